@@ -0,0 +1,136 @@
+import click
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Sale, Borrowing, DailyBookRevenue, BookBorrowCount, UserActiveLoans
+
+# Rollup tables behind /admin/analytics. The order and lending flows add their
+# deltas in the same transaction as the change itself, so the rollups commit
+# (or roll back) together with the facts. `flask rebuild-analytics` recomputes
+# them from sales and borrowings, for backfills or after editing rows by hand.
+
+# A loan is active from the borrow request until the book is returned or the
+# request rejected, the same span a library copy is held for
+CLOSED_LOAN_STATUSES = ('Returned', 'Rejected')
+
+
+def is_active_loan(status):
+    return status not in CLOSED_LOAN_STATUSES
+
+
+def _add(model, keys, rows):
+    """Add the non key values of `rows` onto the rollup rows, creating missing ones."""
+    if not rows:
+        return
+    counters = [column for column in rows[0] if column not in keys]
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = dialect_insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: getattr(model, column) + stmt.excluded[column] for column in counters},
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = db.session.execute(
+            update(model)
+            .where(*(getattr(model, key) == row[key] for key in keys))
+            .values({column: getattr(model, column) + row[column] for column in counters})
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            db.session.execute(insert(model), [row])
+
+
+def record_sales(sales):
+    """Count freshly checked out `sales` as ordered on their day of sale."""
+    totals = {}
+    for sale in sales:
+        key = (sale.date_of_sale, sale.book_id)
+        quantity, revenue = totals.get(key, (0, 0))
+        totals[key] = (quantity + sale.quantity, revenue + sale.total_price)
+
+    _add(DailyBookRevenue, ('day', 'book_id'), [
+        {'day': day, 'book_id': book_id, 'ordered_quantity': quantity, 'ordered_revenue': revenue,
+         'approved_quantity': 0, 'approved_revenue': 0}
+        for (day, book_id), (quantity, revenue) in totals.items()
+    ])
+
+
+def record_sale_status(sale, old_status, new_status):
+    """Move `sale` in or out of the approved totals when its status changes."""
+    sign = (new_status == 'Approved') - (old_status == 'Approved')
+    if sign:
+        _add(DailyBookRevenue, ('day', 'book_id'), [{
+            'day': sale.date_of_sale, 'book_id': sale.book_id,
+            'ordered_quantity': 0, 'ordered_revenue': 0,
+            'approved_quantity': sign * sale.quantity, 'approved_revenue': sign * sale.total_price,
+        }])
+
+
+def record_borrow(user_id, book_id, count=1):
+    """A borrowing was requested (count=1) or a pending one withdrawn (count=-1)."""
+    _add(BookBorrowCount, ('book_id',), [{'book_id': book_id, 'borrow_count': count}])
+    _add(UserActiveLoans, ('user_id',), [{'user_id': user_id, 'active_loans': count}])
+
+
+def record_loan_status(user_id, old_status, new_status):
+    """Open or close the loan of `user_id` when a borrowing changes status."""
+    delta = is_active_loan(new_status) - is_active_loan(old_status)
+    if delta:
+        _add(UserActiveLoans, ('user_id',), [{'user_id': user_id, 'active_loans': delta}])
+
+
+def record_library_book_deleted(book_id):
+    """Close the loans still open on a library book whose borrowings are being deleted with it."""
+    open_loans = db.session.execute(
+        select(Borrowing.user_id, func.count(Borrowing.id))
+        .where(Borrowing.book_id == book_id, Borrowing.status.notin_(CLOSED_LOAN_STATUSES))
+        .group_by(Borrowing.user_id)
+    ).all()
+    _add(UserActiveLoans, ('user_id',), [
+        {'user_id': user_id, 'active_loans': -count} for user_id, count in open_loans
+    ])
+
+
+def rebuild_analytics():
+    """Recompute every rollup table from sales and borrowings."""
+    approved = Sale.status == 'Approved'
+    db.session.execute(delete(DailyBookRevenue))
+    db.session.execute(insert(DailyBookRevenue).from_select(
+        ['day', 'book_id', 'ordered_quantity', 'ordered_revenue', 'approved_quantity', 'approved_revenue'],
+        select(
+            Sale.date_of_sale,
+            Sale.book_id,
+            func.sum(Sale.quantity),
+            func.sum(Sale.total_price),
+            func.sum(case((approved, Sale.quantity), else_=0)),
+            func.sum(case((approved, Sale.total_price), else_=0)),
+        ).group_by(Sale.date_of_sale, Sale.book_id),
+    ))
+
+    db.session.execute(delete(BookBorrowCount))
+    db.session.execute(insert(BookBorrowCount).from_select(
+        ['book_id', 'borrow_count'],
+        select(Borrowing.book_id, func.count(Borrowing.id)).group_by(Borrowing.book_id),
+    ))
+
+    db.session.execute(delete(UserActiveLoans))
+    db.session.execute(insert(UserActiveLoans).from_select(
+        ['user_id', 'active_loans'],
+        select(Borrowing.user_id, func.count(Borrowing.id))
+        .where(Borrowing.status.notin_(CLOSED_LOAN_STATUSES))
+        .group_by(Borrowing.user_id),
+    ))
+    db.session.commit()
+
+
+def init_analytics(app):
+    @app.cli.command('rebuild-analytics')
+    def rebuild_analytics_command():
+        """Recompute the analytics rollup tables from sales and borrowings."""
+        rebuild_analytics()
+        click.echo('Analytics rollups rebuilt')
@@ -166,6 +166,17 @@ from flask_cors import CORS
 from routes.admin_routes import admin_bp
 from routes.user_routes import user_bp
 from models import db
+from query_profiles import init_query_budget
+from engine_config import init_engine
+from image_uploads import init_image_uploads
+from cache import cache
+from overdue import init_overdue_sweeper
+from analytics import init_analytics
+from passwords import password_hasher
+from tokens import init_tokens
+from mpesa import init_mpesa
+from payments import init_payments
+from idempotency import init_idempotency
 import os
 from dotenv import load_dotenv
 
@@ -180,6 +191,7 @@ migrate = Migrate()
 def create_app():
     app = Flask(__name__)
     app.config.from_object('config.Config')  # Load config from config.py
+    app.logger.setLevel(app.config['LOG_LEVEL'])
 
     # Initialize extensions
     db.init_app(app)
@@ -187,6 +199,15 @@ def create_app():
     jwt.init_app(app)
     migrate.init_app(app, db)
     CORS(app, origins=["http://localhost:5173"], supports_credentials=True)
+    init_engine(app, db)
+    init_query_budget(app)
+    init_image_uploads(app)
+    cache.init_app(app)
+    init_overdue_sweeper(app)
+    init_analytics(app)
+    password_hasher.init_app(app)
+    init_tokens(app, jwt)
+    init_idempotency(app)
 
         # M-Pesa configuration
     app.config["CONSUMER_KEY"] = os.getenv("CONSUMER_KEY")
@@ -194,6 +215,8 @@ def create_app():
     app.config["SHORTCODE"] = os.getenv("SHORTCODE")
     app.config["PASSKEY"] = os.getenv("PASSKEY")
     app.config["BASE_URL"] = os.getenv("BASE_URL")
+    init_mpesa(app)
+    init_payments(app)
 
     # Register Blueprints
     app.register_blueprint(admin_bp, url_prefix='/admin')
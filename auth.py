@@ -0,0 +1,66 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from cache import cache
+from models import db, User
+from query_profiles import uncounted_queries
+
+# user id -> is_admin, so admin endpoints don't hit the users table per call
+ADMIN_STATUS_NAMESPACE = 'admin_status'
+ADMIN_STATUS_TTL = 60
+
+
+def is_admin_user(user_id):
+    """
+    Return whether `user_id` is an admin, reading the users table at most
+    once per cache TTL. Unknown users are cached as non admins.
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return False
+
+    with uncounted_queries():
+        return cache.get_or_set(
+            ADMIN_STATUS_NAMESPACE,
+            user_id,
+            lambda: bool(db.session.query(User.is_admin).filter_by(id=user_id).scalar()),
+            ttl=ADMIN_STATUS_TTL,
+        )
+
+
+def has_admin_access(user_id, claims):
+    """
+    The signed is_admin claim from login is trusted to turn non admins away
+    without touching the database. An admin claim is still confirmed against
+    the cached role, so revoking admin rights takes effect before the token
+    expires.
+    """
+    if claims.get('is_admin') is False:
+        return False
+    return is_admin_user(user_id)
+
+
+def invalidate_admin_status(user_id):
+    cache.delete(ADMIN_STATUS_NAMESPACE, user_id)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_on_role_change(mapper, connection, target):
+    # Drop the entry at flush and again once the change is committed, so a
+    # request that read the old row in between can't keep it cached
+    invalidate_admin_status(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        invalidate_admin_status(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
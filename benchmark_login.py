@@ -0,0 +1,64 @@
+"""
+Login throughput benchmark.
+
+Runs POST /user/login against a throwaway SQLite database and reports
+logins/sec, in total and per core used for hashing. Settings come from the
+same environment variables as the app, e.g.
+
+    BCRYPT_LOG_ROUNDS=12 PASSWORD_HASH_WORKERS=2 python benchmark_login.py --logins 200 --threads 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=100, help='number of logins to time')
+    parser.add_argument('--threads', type=int, default=4, help='concurrent clients')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    from app import create_app
+    from models import db, User
+    from passwords import password_hasher
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(name='Benchmark', email='benchmark@example.com')
+        user.set_password('benchmark-password')
+        db.session.add(user)
+        db.session.commit()
+
+    client = app.test_client()
+    credentials = {'email': 'benchmark@example.com', 'password': 'benchmark-password'}
+
+    def login(_):
+        response = client.post('/user/login', json=credentials)
+        if response.status_code != 200:
+            raise RuntimeError(f'login failed with {response.status_code}: {response.get_data(as_text=True)}')
+
+    login(None)  # warm up, also starts the hashing pool
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - started
+
+    cores = min(password_hasher.workers or 1, os.cpu_count() or 1)
+    rate = args.logins / elapsed
+    print(f'bcrypt rounds:     {password_hasher.rounds}')
+    print(f'hashing processes: {password_hasher.workers or "none, request thread"}')
+    print(f'client threads:    {args.threads}')
+    print(f'{args.logins} logins in {elapsed:.2f}s: {rate:.1f} logins/sec, {rate / cores:.1f} per core')
+
+    password_hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # only needed when CACHE_REDIS_URL points at a Redis server
+    redis = None
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Small thread safe LRU cache whose entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class InMemoryRedis:
+    """
+    Stand-in for a Redis server speaking the same client API (get, set with
+    ex, delete, incr), for tests and single process development.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry and entry[1] is not None and entry[1] < time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, int):
+            value = str(value).encode()
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + amount if entry else amount
+            self._data[key] = (str(value).encode(), entry[1] if entry else None)
+            return value
+
+
+class Cache:
+    """
+    Two tier cache shared by the app.
+
+    Every lookup goes to the in-process LRU first and then, when configured,
+    to a shared Redis tier that all worker processes see. Values found in the
+    shared tier are kept locally for at most `local_ttl` seconds, which bounds
+    how long a delete made by another worker can go unnoticed. Keys live in
+    namespaces, and hits and misses are counted per namespace.
+    """
+
+    def __init__(self, maxsize=4096, ttl=300):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared = None
+        self.default_ttl = ttl
+        self.local_ttl = None
+        self.prefix = 'bookstore'
+        self._counters = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', self.default_ttl)
+        self.local = TTLCache(maxsize=app.config.get('CACHE_LOCAL_MAXSIZE', 4096), ttl=self.default_ttl)
+        self.prefix = app.config.get('CACHE_KEY_PREFIX', self.prefix)
+
+        client = app.config.get('CACHE_REDIS_CLIENT')
+        url = app.config.get('CACHE_REDIS_URL')
+        if client is None and url:
+            if url == 'memory://':
+                client = InMemoryRedis()
+            elif redis is None:
+                raise RuntimeError('CACHE_REDIS_URL is set but the redis package is not installed')
+            else:
+                client = redis.Redis.from_url(url)
+        self.shared = client
+        self.local_ttl = app.config.get('CACHE_LOCAL_TTL', 5) if client is not None else None
+        app.extensions['cache'] = self
+
+    def _count(self, namespace, field):
+        with self._lock:
+            counts = self._stats.setdefault(namespace, {'hits': 0, 'misses': 0})
+            counts[field] += 1
+
+    def _shared_key(self, namespace, key):
+        return f'{self.prefix}:{namespace}:{key!r}'
+
+    def _local_ttl(self, ttl):
+        ttl = self.default_ttl if ttl is None else ttl
+        return min(ttl, self.local_ttl) if self.local_ttl is not None else ttl
+
+    def get(self, namespace, key, default=None):
+        value = self.local.get((namespace, key), _MISSING)
+        if value is _MISSING and self.shared is not None:
+            raw = self.shared.get(self._shared_key(namespace, key))
+            if raw is not None:
+                value = pickle.loads(raw)
+                self.local.set((namespace, key), value, ttl=self._local_ttl(None))
+        if value is _MISSING:
+            self._count(namespace, 'misses')
+            return default
+        self._count(namespace, 'hits')
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.local.set((namespace, key), value, ttl=self._local_ttl(ttl))
+        if self.shared is not None:
+            self.shared.set(self._shared_key(namespace, key), pickle.dumps(value), ex=ttl)
+
+    def delete(self, namespace, key):
+        self.local.delete((namespace, key))
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(namespace, key))
+
+    def get_or_set(self, namespace, key, loader, ttl=None):
+        """Read-through lookup: call `loader()` and store its result on a miss."""
+        value = self.get(namespace, key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(namespace, key, value, ttl=ttl)
+        return value
+
+    def counter(self, namespace, key):
+        """Current value of a counter kept with incr(), 0 if never bumped."""
+        if self.shared is None:
+            return self._counters.get((namespace, key), 0)
+        value = self.local.get((namespace, key))
+        if value is None:
+            value = int(self.shared.get(self._shared_key(namespace, key)) or 0)
+            self.local.set((namespace, key), value, ttl=self.local_ttl)
+        return value
+
+    def incr(self, namespace, key):
+        if self.shared is None:
+            # Counters are kept out of the LRU, an evicted one would go back to 0
+            with self._lock:
+                value = self._counters[(namespace, key)] = self._counters.get((namespace, key), 0) + 1
+            return value
+        value = self.shared.incr(self._shared_key(namespace, key))
+        self.local.set((namespace, key), value, ttl=self.local_ttl)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {namespace: dict(counts) for namespace, counts in self._stats.items()}
+
+
+cache = Cache()
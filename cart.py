@@ -0,0 +1,187 @@
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.orm import Session
+from cache import cache
+from models import db, StoreBook, CartItem
+from response_cache import catalog_version
+
+# Cart reads and batch writes.
+#
+# The cart view is priced with one join and cached per user for CART_CACHE_TTL
+# seconds, at most CATALOG_STOCK_TTL as it shows stock. Anything that changes
+# a cart calls mark_cart_changed(); the cached view is dropped once that commit
+# succeeds. A cached view also goes stale when the catalog version moves, so
+# admin changes to prices show up right away.
+#
+# Batch changes are for clients that sync a whole cart at once: however many
+# operations a request carries, they cost the same handful of statements and
+# a single commit.
+
+CART_NAMESPACE = 'cart'
+
+MAX_CART_OPERATIONS = 100
+CART_OPERATIONS = ('add', 'set', 'remove')
+
+
+def mark_cart_changed(user_id):
+    """Drop the cached cart view of `user_id` once the current transaction commits."""
+    db.session.info.setdefault('carts_changed', set()).add(str(user_id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _forget_carts_after_commit(session):
+    for user_id in session.info.pop('carts_changed', ()):
+        cache.delete(CART_NAMESPACE, user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_carts(session):
+    session.info.pop('carts_changed', None)
+
+
+def _load_cart(user_id):
+    rows = db.session.execute(
+        select(
+            StoreBook.id, StoreBook.title, StoreBook.author, StoreBook.price,
+            StoreBook.stock, StoreBook.image_url, func.sum(CartItem.quantity).label('quantity'),
+        )
+        .join(CartItem, CartItem.book_id == StoreBook.id)
+        .where(CartItem.user_id == user_id)
+        .group_by(StoreBook.id)
+        .order_by(func.min(CartItem.id))
+    ).all()
+
+    items = []
+    for row in rows:
+        stock = row.stock or 0
+        items.append({
+            'book_id': row.id,
+            'title': row.title,
+            'author': row.author,
+            'image_url': row.image_url,
+            'price': row.price,
+            'quantity': row.quantity,
+            'line_total': round(row.price * row.quantity, 2),
+            'stock': stock,
+            'in_stock': stock >= row.quantity,
+        })
+    return {
+        'items': items,
+        'total_quantity': sum(item['quantity'] for item in items),
+        'total_price': round(sum(item['line_total'] for item in items), 2),
+        'all_in_stock': all(item['in_stock'] for item in items),
+    }
+
+
+def cart_view(user_id):
+    """
+    The cart of `user_id` with line totals, the grand total and whether the
+    store has enough stock for each line, one row per book.
+    """
+    # Other users' checkouts don't drop the view, so it is kept no longer than stock may be stale
+    ttl = min(current_app.config.get('CART_CACHE_TTL', 30), current_app.config.get('CATALOG_STOCK_TTL', 5))
+    if not ttl:
+        return _load_cart(user_id)
+
+    key = str(user_id)
+    version = catalog_version()
+    cached = cache.get(CART_NAMESPACE, key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    cart = _load_cart(user_id)
+    cache.set(CART_NAMESPACE, key, (version, cart), ttl=ttl)
+    return cart
+
+
+def parse_cart_operations(operations):
+    """
+    Validate a PATCH /cart body: a list of {'op', 'book_id', 'quantity'}.
+    'add' adds quantity (> 0), 'set' replaces it (0 removes the item) and
+    'remove' drops the item. Raises ValueError naming the first bad entry.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('operations must be a non-empty list')
+    if len(operations) > MAX_CART_OPERATIONS:
+        raise ValueError(f'At most {MAX_CART_OPERATIONS} operations per request')
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise ValueError(f'operations[{index}] must be an object')
+        op = operation.get('op')
+        book_id = operation.get('book_id')
+        quantity = operation.get('quantity')
+        if op not in CART_OPERATIONS:
+            raise ValueError(f"operations[{index}].op must be one of {', '.join(CART_OPERATIONS)}")
+        if not isinstance(book_id, int) or isinstance(book_id, bool):
+            raise ValueError(f'operations[{index}].book_id must be an integer')
+        if op != 'remove':
+            minimum = 1 if op == 'add' else 0
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < minimum:
+                raise ValueError(f'operations[{index}].quantity must be an integer of at least {minimum}')
+        parsed.append((op, book_id, quantity))
+    return parsed
+
+
+def apply_cart_operations(user_id, operations):
+    """
+    Apply parsed cart operations in order with a fixed number of statements:
+    one IN query to check the books, one to load the affected cart rows, then
+    bulk insert / update / delete. Returns {book_id: quantity} of the touched
+    books (0 when removed), or raises ValueError for unknown books. The caller
+    commits.
+    """
+    book_ids = {book_id for op, book_id, quantity in operations}
+    wanted_ids = {book_id for op, book_id, quantity in operations if op != 'remove'}
+    known = set(db.session.scalars(select(StoreBook.id).where(StoreBook.id.in_(wanted_ids)))) if wanted_ids else set()
+    unknown = sorted(wanted_ids - known)
+    if unknown:
+        raise ValueError(f"Unknown books: {', '.join(map(str, unknown))}")
+
+    rows = db.session.execute(
+        select(CartItem.id, CartItem.book_id, CartItem.quantity)
+        .where(CartItem.user_id == user_id, CartItem.book_id.in_(book_ids))
+        .order_by(CartItem.id)
+    ).all()
+
+    # Older code could leave several rows per book, they are merged into the first
+    row_ids = {}
+    stored = {}
+    extra_ids = []
+    quantities = {}
+    for row in rows:
+        if row.book_id in row_ids:
+            extra_ids.append(row.id)
+        else:
+            row_ids[row.book_id] = row.id
+            stored[row.book_id] = row.quantity
+        quantities[row.book_id] = quantities.get(row.book_id, 0) + row.quantity
+
+    for op, book_id, quantity in operations:
+        if op == 'add':
+            quantities[book_id] = quantities.get(book_id, 0) + quantity
+        elif op == 'set':
+            quantities[book_id] = quantity
+        else:
+            quantities[book_id] = 0
+
+    inserts, updates, deletes = [], [], list(extra_ids)
+    for book_id, quantity in quantities.items():
+        row_id = row_ids.get(book_id)
+        if row_id is None:
+            if quantity > 0:
+                inserts.append({'user_id': user_id, 'book_id': book_id, 'quantity': quantity})
+        elif quantity <= 0:
+            deletes.append(row_id)
+        elif quantity != stored[book_id]:
+            updates.append({'id': row_id, 'quantity': quantity})
+
+    if inserts:
+        db.session.execute(insert(CartItem), inserts)
+    if updates:
+        db.session.execute(update(CartItem), updates)
+    if deletes:
+        db.session.execute(delete(CartItem).where(CartItem.id.in_(deletes)).execution_options(synchronize_session=False))
+    mark_cart_changed(user_id)
+
+    return {book_id: max(quantity, 0) for book_id, quantity in quantities.items()}
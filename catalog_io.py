@@ -0,0 +1,191 @@
+import codecs
+import csv
+import io
+import json
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, StoreBook, LibraryBook
+from response_cache import mark_catalog_changed
+
+# Streaming bulk import / export of the store and library catalogs.
+# Imports are read line by line and upserted by isbn in batches, exports are
+# generated row by row, so memory stays bounded whatever the file size.
+
+CATALOGS = {
+    'store_books': StoreBook,
+    'library_books': LibraryBook,
+}
+
+REQUIRED_FIELDS = ('title', 'author', 'genre', 'isbn')
+
+FIELD_TYPES = {
+    'store_books': {'price': float, 'stock': int},
+    'library_books': {'available_copies': int, 'total_copies': int},
+}
+
+BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 100
+
+
+def catalog_fields(catalog):
+    """Columns that can be imported / exported, id and image_status are ours."""
+    model = CATALOGS[catalog]
+    return [column.name for column in model.__table__.columns if column.name not in ('id', 'image_status')]
+
+
+def read_records(stream, fmt):
+    """
+    Yield (line number, record) from a CSV or NDJSON byte stream. CSV records
+    are dicts, NDJSON ones the raw line, decoded by clean_record so one bad
+    line doesn't stop the import.
+    """
+    text_stream = codecs.getreader('utf-8')(stream)
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(text_stream, start=1):
+            if line.strip():
+                yield line_number, line
+
+
+def clean_record(catalog, record):
+    """Return a row ready to insert, or raise ValueError describing the problem."""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            raise ValueError('invalid JSON')
+    if not isinstance(record, dict):
+        raise ValueError('record must be an object')
+
+    row = {}
+    for field in catalog_fields(catalog):
+        value = record.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if value in (None, ''):
+            continue
+        convert = FIELD_TYPES[catalog].get(field, str)
+        try:
+            row[field] = convert(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid {field} '{value}'")
+
+    missing = [field for field in REQUIRED_FIELDS if field not in row]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    if catalog == 'store_books' and 'price' not in row:
+        raise ValueError('missing price')
+    return row
+
+
+def _upsert_batch(model, rows):
+    # The same isbn twice in one statement can't be upserted, the last one wins
+    rows = list({row['isbn']: row for row in rows}.values())
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    # Rows of one statement need the same keys, so group them by key set
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+
+    for keys, group in groups.items():
+        if dialect in ('sqlite', 'postgresql'):
+            dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            stmt = dialect_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['isbn'],
+                set_={key: stmt.excluded[key] for key in keys if key != 'isbn'},
+            )
+            db.session.execute(stmt, group)
+        else:
+            existing = {
+                isbn for (isbn,) in db.session.query(model.isbn).filter(model.isbn.in_([row['isbn'] for row in group]))
+            }
+            new_rows = [row for row in group if row['isbn'] not in existing]
+            if new_rows:
+                db.session.execute(insert(table), new_rows)
+            for row in group:
+                if row['isbn'] in existing:
+                    db.session.execute(update(table).where(table.c.isbn == row['isbn']).values(**row))
+    mark_catalog_changed()
+    return len(rows)
+
+
+def import_catalog(catalog, stream, fmt, batch_size=BATCH_SIZE):
+    """
+    Validate and upsert every record of `stream` by isbn, committing once per
+    batch. Invalid records are skipped and reported with their line number.
+    """
+    model = CATALOGS[catalog]
+    processed = upserted = failed = 0
+    errors = []
+    batch = []
+
+    def report(line_number, message):
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'line': line_number, 'error': message})
+
+    try:
+        for line_number, record in read_records(stream, fmt):
+            processed += 1
+            try:
+                batch.append(clean_record(catalog, record))
+            except ValueError as e:
+                failed += 1
+                report(line_number, str(e))
+                continue
+            if len(batch) >= batch_size:
+                upserted += _upsert_batch(model, batch)
+                db.session.commit()
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        # Unreadable file: keep what was imported so far and say where it stopped
+        report(processed + 1, f'unreadable input: {e}')
+
+    if batch:
+        upserted += _upsert_batch(model, batch)
+        db.session.commit()
+
+    return {'processed': processed, 'upserted': upserted, 'failed': failed, 'errors': errors}
+
+
+def export_catalog(catalog, fmt, batch_size=BATCH_SIZE):
+    """Yield the whole catalog as CSV or NDJSON text, a batch of rows at a time."""
+    model = CATALOGS[catalog]
+    fields = catalog_fields(catalog)
+    columns = [model.__table__.c[field] for field in fields]
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(fields)
+
+    # Keyset batches on id, so no cursor is held open between yields
+    last_id = 0
+    while True:
+        rows = (
+            db.session.query(model.id, *columns)
+            .filter(model.id > last_id)
+            .order_by(model.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        for row in rows:
+            if fmt == 'csv':
+                writer.writerow(row[1:])
+            else:
+                buffer.write(json.dumps(dict(zip(fields, row[1:]))) + '\n')
+        last_id = rows[-1][0]
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    remaining = buffer.getvalue()
+    if remaining:
+        yield remaining
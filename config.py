@@ -1,6 +1,8 @@
 import os
+from datetime import timedelta
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
+from engine_config import engine_options, sqlite_pragmas
 
 # Initialize the extensions globally but do not bind them to the app yet
 db = SQLAlchemy()
@@ -9,5 +11,98 @@ bcrypt = Bcrypt()
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pool settings / SQLite pragmas, see engine_config.py for the env variables
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLITE_PRAGMAS = sqlite_pragmas()
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your_secret_key')  # Change this
-    
\ No newline at end of file
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', 60)))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.getenv('JWT_REFRESH_TOKEN_DAYS', 30)))
+
+    # Revoked token ids: bloom filter size per process, and how often (seconds)
+    # it picks up tokens revoked by other workers
+    REVOKED_TOKENS_CAPACITY = int(os.getenv('REVOKED_TOKENS_CAPACITY', 100000))
+    REVOKED_TOKENS_SYNC_INTERVAL = int(os.getenv('REVOKED_TOKENS_SYNC_INTERVAL', 5))
+
+    # M-Pesa (Daraja) API, point MPESA_API_URL at mpesa_stub.py to test locally
+    MPESA_API_URL = os.getenv('MPESA_API_URL', 'https://sandbox.safaricom.co.ke')
+    MPESA_CONNECT_TIMEOUT = float(os.getenv('MPESA_CONNECT_TIMEOUT', 3.05))
+    MPESA_READ_TIMEOUT = float(os.getenv('MPESA_READ_TIMEOUT', 15))
+    MPESA_POOL_SIZE = int(os.getenv('MPESA_POOL_SIZE', 10))
+
+    # Payments: STK push worker threads, how many payments may wait for one,
+    # and how often (seconds) and in what batches the callback inbox is applied.
+    # PAYMENT_CALLBACK_INTERVAL=0 leaves that to `flask apply-payment-callbacks`
+    PAYMENT_WORKERS = int(os.getenv('PAYMENT_WORKERS', 4))
+    PAYMENT_QUEUE_SIZE = int(os.getenv('PAYMENT_QUEUE_SIZE', 100))
+    PAYMENT_CALLBACK_INTERVAL = float(os.getenv('PAYMENT_CALLBACK_INTERVAL', 2))
+    PAYMENT_CALLBACK_BATCH_SIZE = int(os.getenv('PAYMENT_CALLBACK_BATCH_SIZE', 500))
+
+    # Idempotency-Key responses are replayed for IDEMPOTENCY_TTL seconds,
+    # expired ones are deleted at most every IDEMPOTENCY_PRUNE_INTERVAL seconds.
+    # A key whose request hasn't finished after IDEMPOTENCY_LOCK_TIMEOUT
+    # seconds can be claimed again
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 86400))
+    IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+    IDEMPOTENCY_PRUNE_INTERVAL = int(os.getenv('IDEMPOTENCY_PRUNE_INTERVAL', 60))
+
+    # Seconds a user's priced cart view is cached, 0 to always query it
+    CART_CACHE_TTL = int(os.getenv('CART_CACHE_TTL', 30))
+
+    # Max SQL statements per request for the listed endpoints, measured with
+    # warm and cold caches. Token revocation sync and admin role lookups are
+    # not counted, streamed listings count up to their first chunk.
+    # Checked only when QUERY_BUDGET_ENFORCE is on; tests fail on an overrun,
+    # elsewhere it is logged.
+    QUERY_BUDGET_ENFORCE = os.getenv('QUERY_BUDGET_ENFORCE', 'false').lower() == 'true'
+    QUERY_BUDGETS = {
+        'admin_routes.view_orders': 1,
+        'admin_routes.view_borrowings': 1,
+        'admin_routes.get_return_requests': 1,
+        'admin_routes.view_books': 1,
+        'admin_routes.view_library_books': 1,
+        'admin_routes.overdue_summary': 1,
+        'admin_routes.revenue_analytics': 2,
+        'admin_routes.borrowing_analytics': 2,
+        'admin_routes.active_loans_analytics': 2,
+        'admin_routes.reports': 2,
+        'user_routes.view_store_books': 1,
+        'user_routes.view_library_books': 1,
+        'user_routes.view_cart': 1,
+    }
+
+    # Report statements that do a full table scan (SQLite EXPLAIN QUERY PLAN)
+    QUERY_PLAN_CHECK = os.getenv('QUERY_PLAN_CHECK', 'false').lower() == 'true'
+
+    # Background book cover uploads, 'stub' keeps images local (tests)
+    IMAGE_UPLOADER = os.getenv('IMAGE_UPLOADER', 'cloudinary')
+    IMAGE_UPLOAD_DIR = os.getenv('IMAGE_UPLOAD_DIR')
+    IMAGE_UPLOAD_WORKERS = int(os.getenv('IMAGE_UPLOAD_WORKERS', 4))
+    IMAGE_UPLOAD_RETRIES = int(os.getenv('IMAGE_UPLOAD_RETRIES', 3))
+
+    # Cache of the public catalog pages, dropped when an admin changes a book.
+    # Pages and carts showing stock are kept at most CATALOG_STOCK_TTL seconds,
+    # borrowing and checkout don't drop them
+    CATALOG_CACHE_ENABLED = os.getenv('CATALOG_CACHE_ENABLED', 'true').lower() == 'true'
+    CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', 60))
+    CATALOG_STOCK_TTL = int(os.getenv('CATALOG_STOCK_TTL', 5))
+
+    # Two tier cache: a per process LRU, plus a shared Redis tier when
+    # CACHE_REDIS_URL is set ('memory://' uses an in-process stand-in)
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+    CACHE_KEY_PREFIX = os.getenv('CACHE_KEY_PREFIX', 'bookstore')
+    CACHE_LOCAL_MAXSIZE = int(os.getenv('CACHE_LOCAL_MAXSIZE', 4096))
+    CACHE_LOCAL_TTL = int(os.getenv('CACHE_LOCAL_TTL', 5))
+    CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', 300))
+
+    # Level of the app logger; Flask's default (WARNING) hides the engine
+    # settings logged at startup
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+    # Seconds between background overdue sweeps, 0 leaves it to `flask sweep-overdue`
+    OVERDUE_SWEEP_INTERVAL = int(os.getenv('OVERDUE_SWEEP_INTERVAL', 0))
+    OVERDUE_SWEEP_BATCH_SIZE = int(os.getenv('OVERDUE_SWEEP_BATCH_SIZE', 1000))
+
+    # Password hashing: bcrypt cost, and processes to hash in (0 hashes in the request thread)
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 0))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 0)) or None
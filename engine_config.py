@@ -0,0 +1,100 @@
+import os
+import re
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+# Engine and pool settings per database backend, read from the environment.
+#
+# Server databases (PostgreSQL, MySQL):
+#   DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (s), DB_POOL_RECYCLE (s),
+#   DB_POOL_PRE_PING
+# SQLite, applied as PRAGMAs on every new connection:
+#   SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT (ms),
+#   SQLITE_MMAP_SIZE (bytes), SQLITE_CACHE_SIZE (pages, negative means KiB)
+
+
+def _env_int(environ, name, default):
+    value = environ.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer, got {value!r}')
+
+
+def _env_bool(environ, name, default):
+    value = environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_keyword(environ, name, default):
+    # Keywords end up inside a PRAGMA statement, so only plain words pass
+    value = environ.get(name) or default
+    if not re.match(r'^[A-Za-z]+$', value):
+        raise ValueError(f'{name} must be a single keyword, got {value!r}')
+    return value.upper()
+
+
+def sqlite_pragmas(environ=os.environ):
+    return {
+        'journal_mode': _env_keyword(environ, 'SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': _env_keyword(environ, 'SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int(environ, 'SQLITE_BUSY_TIMEOUT', 5000),
+        'mmap_size': _env_int(environ, 'SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        'cache_size': _env_int(environ, 'SQLITE_CACHE_SIZE', -64000),
+    }
+
+
+def engine_options(database_uri, environ=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for `database_uri`."""
+    backend = make_url(database_uri).get_backend_name()
+    if backend == 'sqlite':
+        # Let the driver wait for locks as long as busy_timeout does
+        busy_timeout = sqlite_pragmas(environ)['busy_timeout']
+        return {'connect_args': {'timeout': busy_timeout / 1000}}
+
+    return {
+        'pool_size': _env_int(environ, 'DB_POOL_SIZE', 5),
+        'max_overflow': _env_int(environ, 'DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int(environ, 'DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int(environ, 'DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': _env_bool(environ, 'DB_POOL_PRE_PING', True),
+    }
+
+
+def _apply_sqlite_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def describe_engine(engine):
+    """Effective settings of `engine`, read back from the database for SQLite."""
+    report = {'backend': engine.dialect.name, 'pool': engine.pool.status()}
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            for name in sqlite_pragmas():
+                report[name] = connection.execute(text(f'PRAGMA {name}')).scalar()
+    return report
+
+
+def init_engine(app, db):
+    """Apply the SQLite pragmas to every connection and log the settings in use."""
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            pragmas = app.config.get('SQLITE_PRAGMAS') or sqlite_pragmas()
+            event.listen(engine, 'connect', _apply_sqlite_pragmas(pragmas))
+
+        try:
+            app.logger.info('Database engine settings: %s', describe_engine(engine))
+        except Exception as e:
+            app.logger.warning('Could not read database engine settings: %s', e)
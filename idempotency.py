@@ -0,0 +1,181 @@
+import hashlib
+import time
+import zlib
+from datetime import datetime, timedelta
+from functools import wraps
+import click
+from flask import current_app, request, jsonify, make_response
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey
+
+# Idempotency-Key support for mutating endpoints.
+#
+# The first request with a key claims it by inserting an idempotency_keys row,
+# runs the handler and stores the (compressed) response on that row. A retry
+# with the same key gets the stored response back without the handler running
+# again; one sent while the first is still running gets 409. A claim whose
+# request never finished (a killed worker) can be taken over after
+# IDEMPOTENCY_LOCK_TIMEOUT seconds. Keys are scoped to the user, or to what an
+# endpoint without login passes as `scope`, and expire after IDEMPOTENCY_TTL
+# seconds; every process deletes a batch of expired rows now and then, so the
+# table stays small without a cron job. Requests without the header behave as
+# before.
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+PRUNE_BATCH_SIZE = 500
+
+_next_prune = 0
+
+
+def _default_scope():
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        # Endpoint without @jwt_required
+        identity = None
+    return f'user:{identity}' if identity else f'client:{request.remote_addr}'
+
+
+def _fingerprint():
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.get_data()):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _claim(key, fingerprint):
+    """
+    Insert the row for `key`, returns its created_at, which tells this claim
+    apart from a later one, or None when the key is already taken.
+    """
+    now = datetime.utcnow()
+    ttl = current_app.config.get('IDEMPOTENCY_TTL', 86400)
+    try:
+        db.session.execute(insert(IdempotencyKey).values(
+            key=key, fingerprint=fingerprint, created_at=now, expires_at=now + timedelta(seconds=ttl),
+        ))
+        _maybe_prune(now)
+        db.session.commit()
+        return now
+    except IntegrityError:
+        db.session.rollback()
+        return None
+
+
+def _stale(row, now):
+    """Whether the row can be claimed again: expired, or still running past the lock timeout."""
+    if row.expires_at <= now:
+        return True
+    timeout = timedelta(seconds=current_app.config.get('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+    return row.status_code is None and row.created_at <= now - timeout
+
+
+def _maybe_prune(now):
+    global _next_prune
+    if time.monotonic() < _next_prune:
+        return
+    _next_prune = time.monotonic() + current_app.config.get('IDEMPOTENCY_PRUNE_INTERVAL', 60)
+    expired = select(IdempotencyKey.key).where(IdempotencyKey.expires_at <= now).limit(PRUNE_BATCH_SIZE)
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired.scalar_subquery())))
+
+
+def _replay(row):
+    response = make_response(zlib.decompress(row.body), row.status_code)
+    response.mimetype = 'application/json'
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _ours(key, claimed_at):
+    # A claim taken over after the lock timeout has a newer created_at
+    return (IdempotencyKey.key == key, IdempotencyKey.created_at == claimed_at)
+
+
+def _release(key, claimed_at):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(*_ours(key, claimed_at)))
+    db.session.commit()
+
+
+def idempotent(fn=None, scope=None):
+    """
+    Make `fn` safe to retry with an Idempotency-Key header. Put it below
+    @jwt_required() so keys are scoped to the user. Endpoints without login
+    are scoped to the client address unless `scope` returns something better,
+    e.g. @idempotent(scope=lambda: ...).
+    """
+    if fn is None:
+        return lambda fn: idempotent(fn, scope)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        client_key = request.headers.get(HEADER)
+        if client_key is None:
+            return fn(*args, **kwargs)
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+
+        owner = (scope or _default_scope)()
+        key = hashlib.sha256(f'{owner}:{client_key}'.encode('utf-8')).hexdigest()
+        fingerprint = _fingerprint()
+
+        claimed_at = _claim(key, fingerprint)
+        if claimed_at is None:
+            row = db.session.execute(
+                select(IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.body,
+                       IdempotencyKey.created_at, IdempotencyKey.expires_at)
+                .where(IdempotencyKey.key == key)
+            ).first()
+            if row is not None and _stale(row, datetime.utcnow()):
+                # Expired, or its request died: forget it, unless another retry got there first
+                db.session.execute(delete(IdempotencyKey).where(*_ours(key, row.created_at)))
+                db.session.commit()
+                row = None
+            if row is None:
+                claimed_at = _claim(key, fingerprint)
+                if claimed_at is None:
+                    return jsonify({'error': f'A request with this {HEADER} is in progress'}), 409
+            elif row.fingerprint != fingerprint:
+                return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+            elif row.status_code is None:
+                return jsonify({'error': f'A request with this {HEADER} is in progress'}), 409
+            else:
+                return _replay(row)
+
+        try:
+            response = make_response(fn(*args, **kwargs))
+        except Exception:
+            _release(key, claimed_at)
+            raise
+
+        if response.status_code >= 500:
+            # Failed without a result worth keeping, let the client retry for real
+            _release(key, claimed_at)
+            return response
+
+        db.session.execute(
+            update(IdempotencyKey)
+            .where(*_ours(key, claimed_at))
+            .values(status_code=response.status_code, body=zlib.compress(response.get_data()))
+        )
+        db.session.commit()
+        return response
+    return wrapper
+
+
+def prune_idempotency_keys():
+    """Delete expired idempotency keys, returns how many."""
+    result = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+    db.session.commit()
+    return result.rowcount
+
+
+def init_idempotency(app):
+    @app.cli.command('prune-idempotency-keys')
+    def prune_idempotency_keys_command():
+        """Delete expired Idempotency-Key records."""
+        click.echo(f'Pruned {prune_idempotency_keys()} idempotency keys')
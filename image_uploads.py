@@ -0,0 +1,132 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import update
+import cloudinary.uploader
+from models import db
+from response_cache import mark_catalog_changed
+
+# Book cover uploads run in the background: the request only buffers the file
+# to local disk and commits the book with image_status='pending', a worker
+# pool then uploads the file (with retries) and fills in image_url.
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+
+def cloudinary_uploader(path):
+    return cloudinary.uploader.upload(path)['secure_url']
+
+
+def stub_uploader(path):
+    """Uploader for tests and local development, nothing leaves the machine."""
+    return f'stub://{os.path.basename(path)}'
+
+
+UPLOADERS = {
+    'cloudinary': cloudinary_uploader,
+    'stub': stub_uploader,
+}
+
+
+class ImageUploadQueue:
+    def __init__(self, app, uploader, upload_dir, workers=4, retries=3, retry_delay=1.0):
+        self.app = app
+        self.uploader = uploader
+        self.upload_dir = upload_dir
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-upload')
+        self._latest = {}
+        self._futures = set()
+        self._lock = threading.Lock()
+        os.makedirs(upload_dir, exist_ok=True)
+
+    def buffer(self, file):
+        """Save an uploaded FileStorage to local disk and return its path."""
+        extension = os.path.splitext(file.filename or '')[1].lower()
+        path = os.path.join(self.upload_dir, f'{uuid.uuid4().hex}{extension}')
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(file.stream, out)
+        return path
+
+    def submit(self, model, book_id, path):
+        key = (model.__tablename__, book_id)
+        with self._lock:
+            # A newer upload for the same book wins over one still in flight
+            self._latest[key] = path
+            future = self._executor.submit(self._run, model, book_id, path)
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _is_latest(self, model, book_id, path):
+        with self._lock:
+            return self._latest.get((model.__tablename__, book_id)) == path
+
+    def _run(self, model, book_id, path):
+        image_url = None
+        for attempt in range(1, self.retries + 1):
+            try:
+                image_url = self.uploader(path)
+                break
+            except Exception as e:
+                print(f"Image upload error (attempt {attempt}/{self.retries}): {e}")
+                if attempt < self.retries:
+                    time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+        try:
+            if self._is_latest(model, book_id, path):
+                values = {'image_status': READY, 'image_url': image_url} if image_url else {'image_status': FAILED}
+                with self.app.app_context():
+                    db.session.execute(update(model).where(model.id == book_id).values(**values))
+                    mark_catalog_changed()
+                    db.session.commit()
+        finally:
+            with self._lock:
+                if self._latest.get((model.__tablename__, book_id)) == path:
+                    del self._latest[(model.__tablename__, book_id)]
+            if os.path.exists(path):
+                os.remove(path)
+
+    def wait(self, timeout=None):
+        """Block until every queued upload is done, mainly for tests."""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result(timeout=timeout)
+
+
+def init_image_uploads(app):
+    uploader = app.config.get('IMAGE_UPLOADER', 'cloudinary')
+    app.extensions['image_uploads'] = ImageUploadQueue(
+        app,
+        uploader=UPLOADERS[uploader] if isinstance(uploader, str) else uploader,
+        upload_dir=app.config.get('IMAGE_UPLOAD_DIR') or os.path.join(app.instance_path, 'uploads'),
+        workers=app.config.get('IMAGE_UPLOAD_WORKERS', 4),
+        retries=app.config.get('IMAGE_UPLOAD_RETRIES', 3),
+    )
+
+
+def buffer_image(file):
+    """Save `file` next to the app so it can be uploaded after the commit."""
+    return current_app.extensions['image_uploads'].buffer(file)
+
+
+def queue_image_upload(model, book_id, path):
+    """Upload a buffered image in the background and set it on book `book_id`."""
+    return current_app.extensions['image_uploads'].submit(model, book_id, path)
+
+
+def discard_image(path):
+    if path and os.path.exists(path):
+        os.remove(path)
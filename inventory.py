@@ -0,0 +1,51 @@
+from sqlalchemy import case, update
+from models import db, StoreBook, LibraryBook
+from response_cache import mark_stock_changed
+
+# Copy and stock counts are only ever changed with conditional UPDATEs, so two
+# workers can't both take the last copy and no row lock is held while Python
+# code runs. The caller commits (or rolls back) the surrounding transaction.
+# Stock changes don't invalidate the catalog cache, see response_cache.py.
+
+
+def take_library_copy(book_id):
+    """Take one available copy of `book_id`. Returns False if none was left."""
+    result = db.session.execute(
+        update(LibraryBook)
+        .where(LibraryBook.id == book_id, LibraryBook.available_copies > 0)
+        .values(available_copies=LibraryBook.available_copies - 1)
+        .execution_options(synchronize_session=False)
+    )
+    mark_stock_changed()
+    return result.rowcount == 1
+
+
+def return_library_copy(book_id):
+    """Put one copy of `book_id` back. Returns False if the book doesn't exist."""
+    result = db.session.execute(
+        update(LibraryBook)
+        .where(LibraryBook.id == book_id)
+        .values(available_copies=LibraryBook.available_copies + 1)
+        .execution_options(synchronize_session=False)
+    )
+    mark_stock_changed()
+    return result.rowcount == 1
+
+
+def reserve_store_stock(quantities):
+    """
+    Take `quantities` ({book_id: quantity}) out of store stock in one UPDATE.
+    Returns False when any book was short, in which case the caller has to
+    roll back, as the books that did have enough stock were decremented.
+    """
+    if not quantities:
+        return True
+    wanted = case(quantities, value=StoreBook.id)
+    result = db.session.execute(
+        update(StoreBook)
+        .where(StoreBook.id.in_(list(quantities)), StoreBook.stock >= wanted)
+        .values(stock=StoreBook.stock - wanted)
+        .execution_options(synchronize_session=False)
+    )
+    mark_stock_changed()
+    return result.rowcount == len(quantities)
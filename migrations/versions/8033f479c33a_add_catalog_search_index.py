@@ -0,0 +1,70 @@
+"""add catalog search index
+
+Revision ID: 8033f479c33a
+Revises: 29dfbd7e3c40
+Create Date: 2026-10-18 09:12:44.518203
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8033f479c33a'
+down_revision = '29dfbd7e3c40'
+branch_labels = None
+depends_on = None
+
+BOOK_TABLES = (('store_books', 'store'), ('library_books', 'library'))
+
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(genre, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(isbn, '')), 'D')"
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE book_search USING fts5("
+            "title, author, genre, isbn, kind UNINDEXED, book_id UNINDEXED, "
+            "tokenize='unicode61', prefix='2 3')"
+        )
+        for table, kind in BOOK_TABLES:
+            op.execute(
+                f"CREATE TRIGGER {table}_search_ai AFTER INSERT ON {table} BEGIN "
+                "INSERT INTO book_search (title, author, genre, isbn, kind, book_id) "
+                f"VALUES (new.title, new.author, new.genre, new.isbn, '{kind}', new.id); END"
+            )
+            op.execute(
+                f"CREATE TRIGGER {table}_search_ad AFTER DELETE ON {table} BEGIN "
+                f"DELETE FROM book_search WHERE kind = '{kind}' AND book_id = old.id; END"
+            )
+            op.execute(
+                f"CREATE TRIGGER {table}_search_au "
+                f"AFTER UPDATE OF title, author, genre, isbn ON {table} BEGIN "
+                f"DELETE FROM book_search WHERE kind = '{kind}' AND book_id = old.id; "
+                "INSERT INTO book_search (title, author, genre, isbn, kind, book_id) "
+                f"VALUES (new.title, new.author, new.genre, new.isbn, '{kind}', new.id); END"
+            )
+            op.execute(
+                "INSERT INTO book_search (title, author, genre, isbn, kind, book_id) "
+                f"SELECT title, author, genre, isbn, '{kind}', id FROM {table}"
+            )
+    elif dialect == 'postgresql':
+        for table, kind in BOOK_TABLES:
+            op.execute(f"CREATE INDEX ix_{table}_search ON {table} USING gin (({POSTGRES_DOCUMENT}))")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for table, kind in BOOK_TABLES:
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_search_{suffix}")
+        op.execute("DROP TABLE IF EXISTS book_search")
+    elif dialect == 'postgresql':
+        for table, kind in BOOK_TABLES:
+            op.execute(f"DROP INDEX IF EXISTS ix_{table}_search")
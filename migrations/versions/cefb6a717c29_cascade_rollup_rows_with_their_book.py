@@ -0,0 +1,48 @@
+"""cascade rollup rows with their book
+
+Revision ID: cefb6a717c29
+Revises: f9801c598280
+Create Date: 2026-10-18 20:19:41.568310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cefb6a717c29'
+down_revision = 'f9801c598280'
+branch_labels = None
+depends_on = None
+
+
+# Rollup rows of a book go with the book. The foreign keys were created
+# without a name: SQLite batch mode names them through the convention below,
+# which matches the name PostgreSQL gives them; otherwise the reflected name
+# is used.
+FK_NAMING = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+ROLLUP_FKS = (
+    ('book_borrow_counts', 'library_books'),
+    ('daily_book_revenue', 'store_books'),
+    ('overdue_summaries', 'library_books'),
+)
+
+
+def _replace_book_fk(table, referred_table, ondelete):
+    reflected = sa.inspect(op.get_bind()).get_foreign_keys(table)
+    name = next(fk['name'] for fk in reflected if fk['constrained_columns'] == ['book_id'])
+    new_name = f'{table}_book_id_fkey'
+    with op.batch_alter_table(table, schema=None, naming_convention=FK_NAMING) as batch_op:
+        batch_op.drop_constraint(name or new_name, type_='foreignkey')
+        batch_op.create_foreign_key(new_name, referred_table, ['book_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    for table, referred_table in ROLLUP_FKS:
+        _replace_book_fk(table, referred_table, 'CASCADE')
+
+
+def downgrade():
+    for table, referred_table in reversed(ROLLUP_FKS):
+        _replace_book_fk(table, referred_table, None)
@@ -654,11 +654,10 @@ from sqlalchemy.orm import validates, relationship
 from config import db
 from sqlalchemy import MetaData, Table, ForeignKey
 from sqlalchemy_serializer import SerializerMixin
-from flask_bcrypt import Bcrypt
+from passwords import password_hasher
 import re
 from datetime import datetime, timedelta
 
-bcrypt = Bcrypt()
 metadata = MetaData()
 
 # Association Tables
@@ -706,10 +705,14 @@ class User(db.Model, SerializerMixin):
         return email
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.verify(password, self.password_hash)
+
+    def password_needs_rehash(self):
+        # Stored with another bcrypt cost than the configured one
+        return password_hasher.needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.name}, Email: {self.email}>'
@@ -727,6 +730,7 @@ class StoreBook(db.Model, SerializerMixin):
     price = db.Column(db.Float, nullable=False)
     stock = db.Column(db.Integer, default=0)
     image_url = db.Column(db.String, nullable=True)
+    image_status = db.Column(db.String, nullable=True)  # pending / ready / failed while a cover uploads
 
     cart_items = relationship('CartItem', back_populates='book', cascade='all, delete-orphan', lazy='select')
     sales = relationship('Sale', back_populates='book', cascade='all, delete-orphan', lazy='select')
@@ -747,6 +751,7 @@ class LibraryBook(db.Model, SerializerMixin):
     available_copies = db.Column(db.Integer, default=0)
     total_copies = db.Column(db.Integer, default=0)
     image_url = db.Column(db.String, nullable=True)
+    image_status = db.Column(db.String, nullable=True)  # pending / ready / failed while a cover uploads
 
     borrowings = relationship('Borrowing', back_populates='book', cascade='all, delete-orphan', lazy='select')
 
@@ -756,6 +761,10 @@ class LibraryBook(db.Model, SerializerMixin):
 
 class CartItem(db.Model, SerializerMixin):
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        db.Index('ix_cart_items_user_id_book_id', 'user_id', 'book_id'),
+        db.Index('ix_cart_items_book_id', 'book_id'),
+    )
     serialize_rules = ('-user.cart_items', '-book.cart_items', '-user.borrowings', '-book.sales')
 
     id = db.Column(db.Integer, primary_key=True)
@@ -772,6 +781,11 @@ class CartItem(db.Model, SerializerMixin):
 
 class Sale(db.Model, SerializerMixin):
     __tablename__ = 'sales'
+    __table_args__ = (
+        db.Index('ix_sales_user_id_status', 'user_id', 'status'),
+        db.Index('ix_sales_book_id', 'book_id'),
+        db.Index('ix_sales_status_date_of_sale', 'status', 'date_of_sale'),
+    )
     serialize_rules = ('-user.sales', '-book.sales', '-user.cart_items', '-book.cart_items')
 
     id = db.Column(db.Integer, primary_key=True)
@@ -791,6 +805,12 @@ class Sale(db.Model, SerializerMixin):
 
 class Borrowing(db.Model, SerializerMixin):
     __tablename__ = 'borrowings'
+    __table_args__ = (
+        db.Index('ix_borrowings_user_id_status_book_id', 'user_id', 'status', 'book_id'),
+        db.Index('ix_borrowings_book_id', 'book_id'),
+        db.Index('ix_borrowings_status_date_borrowed', 'status', 'date_borrowed'),
+        db.Index('ix_borrowings_status_due_date', 'status', 'due_date'),
+    )
     serialize_rules = ('-user.borrowings', '-book.borrowings', '-user.cart_items', '-book.sales')
 
     id = db.Column(db.Integer, primary_key=True)
@@ -808,6 +828,124 @@ class Borrowing(db.Model, SerializerMixin):
         return f'<Borrowing Book ID {self.book_id} by User ID {self.user_id}>'
 
 
+class OverdueSummary(db.Model, SerializerMixin):
+    """Overdue loans per library book, rebuilt by every overdue sweep."""
+    __tablename__ = 'overdue_summaries'
+
+    book_id = db.Column(db.Integer, db.ForeignKey('library_books.id', ondelete='CASCADE'), primary_key=True)
+    overdue_count = db.Column(db.Integer, nullable=False)
+    oldest_due_date = db.Column(db.Date, nullable=False)
+    refreshed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<OverdueSummary Book ID {self.book_id}: {self.overdue_count} overdue>'
+
+
+# Rollups for the admin analytics, kept up to date by the order and lending
+# flows (see analytics.py) so dashboards never aggregate sales or borrowings
+
+class DailyBookRevenue(db.Model, SerializerMixin):
+    __tablename__ = 'daily_book_revenue'
+
+    day = db.Column(db.Date, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('store_books.id', ondelete='CASCADE'), primary_key=True)
+    ordered_quantity = db.Column(db.Integer, nullable=False, default=0)
+    ordered_revenue = db.Column(db.Float, nullable=False, default=0)
+    approved_quantity = db.Column(db.Integer, nullable=False, default=0)
+    approved_revenue = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyBookRevenue {self.day} Book ID {self.book_id}>'
+
+
+class BookBorrowCount(db.Model, SerializerMixin):
+    __tablename__ = 'book_borrow_counts'
+
+    book_id = db.Column(db.Integer, db.ForeignKey('library_books.id', ondelete='CASCADE'), primary_key=True)
+    borrow_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<BookBorrowCount Book ID {self.book_id}: {self.borrow_count}>'
+
+
+class UserActiveLoans(db.Model, SerializerMixin):
+    __tablename__ = 'user_active_loans'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    active_loans = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UserActiveLoans User ID {self.user_id}: {self.active_loans}>'
+
+
+class RevokedToken(db.Model):
+    """JWTs revoked before their expiry, kept until they would have expired."""
+    __tablename__ = 'revoked_tokens'
+
+    jti = db.Column(db.String(36), primary_key=True)
+    token_type = db.Column(db.String(10), nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<RevokedToken {self.token_type} {self.jti}>'
+
+
+class IdempotencyKey(db.Model):
+    """Idempotency-Key of a mutating request and the response it got, kept until expires_at."""
+    __tablename__ = 'idempotency_keys'
+
+    # sha256 of the scope (user, or phone / client for endpoints without login) and the client's key,
+    # fingerprint is sha256 of the request
+    key = db.Column(db.String(64), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # Both null while the first request is still running
+    status_code = db.Column(db.SmallInteger, nullable=True)
+    body = db.Column(db.LargeBinary, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key} Status {self.status_code}>'
+
+
+class Transaction(db.Model, SerializerMixin):
+    """An M-Pesa payment, from buyGoods until Safaricom's callback settles it."""
+    __tablename__ = 'transactions'
+
+    id = db.Column(db.String(36), primary_key=True)
+    amount = db.Column(db.Float, nullable=False)
+    phone_number = db.Column(db.String(15), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='Pending')
+    checkout_request_id = db.Column(db.String(100), unique=True, nullable=True)
+    result_code = db.Column(db.Integer, nullable=True)
+    result_desc = db.Column(db.String, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Transaction ID {self.id} Status {self.status} Amount {self.amount}>'
+
+
+class MpesaCallback(db.Model):
+    """Append-only inbox of STK push callbacks, applied in batches."""
+    __tablename__ = 'mpesa_callbacks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    checkout_request_id = db.Column(db.String(100), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True, index=True)
+    # Callbacks that can't be matched yet are retried from next_attempt_at on
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    # Why a processed callback was not applied
+    error = db.Column(db.String, nullable=True)
+
+    def __repr__(self):
+        return f'<MpesaCallback {self.checkout_request_id}>'
+
+
 # class Transaction(db.Model, SerializerMixin):
 #     __tablename__ = 'transactions'
 #     serialize_rules = ('-user.transactions',)
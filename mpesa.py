@@ -0,0 +1,139 @@
+import base64
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+import requests
+from requests.adapters import HTTPAdapter
+
+# Daraja (M-Pesa) API client shared by all requests of a process.
+#
+# Requests go through one keep-alive Session with a bounded connection pool
+# and connect / read timeouts. The OAuth access token is cached until shortly
+# before it expires; when it has to be fetched, one thread does it while the
+# others wait for its result instead of all hitting the token endpoint.
+
+SANDBOX_URL = 'https://sandbox.safaricom.co.ke'
+
+
+class MpesaError(Exception):
+    pass
+
+
+class MpesaClient:
+    def __init__(self, consumer_key, consumer_secret, shortcode, passkey, callback_url,
+                 api_url=SANDBOX_URL, timeout=(3.05, 15), pool_size=10, token_margin=60):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.shortcode = shortcode
+        self.passkey = passkey
+        self.callback_url = callback_url
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.token_margin = token_margin
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        base_url = config.get('BASE_URL') or ''
+        return cls(
+            consumer_key=config.get('CONSUMER_KEY'),
+            consumer_secret=config.get('CONSUMER_SECRET'),
+            shortcode=config.get('SHORTCODE'),
+            passkey=config.get('PASSKEY'),
+            callback_url=base_url.rstrip('/') + '/user/callback',
+            api_url=config.get('MPESA_API_URL', SANDBOX_URL),
+            timeout=(config.get('MPESA_CONNECT_TIMEOUT', 3.05), config.get('MPESA_READ_TIMEOUT', 15)),
+            pool_size=config.get('MPESA_POOL_SIZE', 10),
+        )
+
+    def _token_valid(self):
+        return self._token is not None and time.monotonic() < self._token_expires_at
+
+    def access_token(self):
+        if self._token_valid():
+            return self._token
+        with self._token_lock:
+            # Whoever waited on the lock finds the token the first thread fetched
+            if not self._token_valid():
+                self._fetch_token()
+            return self._token
+
+    def _fetch_token(self):
+        try:
+            response = self.session.get(
+                f'{self.api_url}/oauth/v1/generate',
+                params={'grant_type': 'client_credentials'},
+                auth=(self.consumer_key, self.consumer_secret),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise MpesaError(f'Could not get an access token: {e}')
+
+        expires_in = int(data.get('expires_in', 3599))
+        self._token = data['access_token']
+        self._token_expires_at = time.monotonic() + max(expires_in - self.token_margin, 0)
+
+    def invalidate_token(self, token):
+        with self._token_lock:
+            # Unless another thread already replaced it
+            if self._token == token:
+                self._token = None
+
+    def stk_push(self, amount, phone_number, reference='Mpesa Integration Api', description='Test Payment'):
+        """Send an STK push prompt to `phone_number`, returns Safaricom's response."""
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        password = base64.b64encode(f'{self.shortcode}{self.passkey}{timestamp}'.encode()).decode('utf-8')
+        payload = {
+            'BusinessShortCode': self.shortcode,
+            'Password': password,
+            'Timestamp': timestamp,
+            'TransactionType': 'CustomerPayBillOnline',
+            'Amount': amount,
+            'PartyA': phone_number,
+            'PartyB': self.shortcode,
+            'PhoneNumber': phone_number,
+            'CallBackURL': self.callback_url,
+            'AccountReference': reference,
+            'TransactionDesc': description,
+        }
+
+        for attempt in range(2):
+            token = self.access_token()
+            try:
+                response = self.session.post(
+                    f'{self.api_url}/mpesa/stkpush/v1/processrequest',
+                    json=payload,
+                    headers={'Authorization': f'Bearer {token}'},
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as e:
+                raise MpesaError(f'STK push failed: {e}')
+            # A token revoked before its expiry: fetch a new one and try once more
+            if response.status_code == 401 and attempt == 0:
+                self.invalidate_token(token)
+                continue
+            break
+
+        try:
+            return response.json()
+        except ValueError:
+            raise MpesaError(f'STK push failed with status {response.status_code}')
+
+
+def init_mpesa(app):
+    app.extensions['mpesa'] = MpesaClient.from_config(app.config)
+
+
+def mpesa_client():
+    return current_app.extensions['mpesa']
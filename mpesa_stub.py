@@ -0,0 +1,113 @@
+"""
+Local stand-in for the Daraja API, for tests and development without
+Safaricom credentials. Serves the OAuth token and STK push endpoints.
+
+    python mpesa_stub.py 8090
+    MPESA_API_URL=http://127.0.0.1:8090 flask run
+"""
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MpesaStubServer(ThreadingHTTPServer):
+    """
+    Counts token and STK push requests in `token_requests` / `stk_requests`,
+    and client connections in `connections`, and keeps the STK payloads in
+    `stk_payloads`. `latency` (seconds) is added to every response.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0, token_expires_in=3599):
+        super().__init__(address, MpesaStubHandler)
+        self.latency = latency
+        self.token_expires_in = token_expires_in
+        self.token_requests = 0
+        self.stk_requests = 0
+        self.connections = 0
+        self.stk_payloads = []
+        self.valid_tokens = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='mpesa-stub', daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class MpesaStubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API, so clients can reuse their connections
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if not self.path.startswith('/oauth/v1/generate'):
+            return self._send(404, {'errorMessage': 'Not found'})
+        if not self.headers.get('Authorization', '').startswith('Basic '):
+            return self._send(400, {'errorMessage': 'Invalid credentials'})
+
+        token = uuid.uuid4().hex
+        with self.server.lock:
+            self.server.token_requests += 1
+            self.server.valid_tokens.add(token)
+        self._send(200, {'access_token': token, 'expires_in': str(self.server.token_expires_in)})
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        # Read the body even when rejecting, the connection is reused
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path != '/mpesa/stkpush/v1/processrequest':
+            return self._send(404, {'errorMessage': 'Not found'})
+
+        token = self.headers.get('Authorization', '').replace('Bearer ', '', 1)
+        if token not in self.server.valid_tokens:
+            return self._send(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+
+        payload = json.loads(body or b'{}')
+        with self.server.lock:
+            self.server.stk_requests += 1
+            self.server.stk_payloads.append(payload)
+        self._send(200, {
+            'MerchantRequestID': uuid.uuid4().hex[:12],
+            'CheckoutRequestID': f'ws_CO_{uuid.uuid4().hex[:20]}',
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8090
+    server = MpesaStubServer(('127.0.0.1', port))
+    print(f'M-Pesa stub listening on {server.url}')
+    server.serve_forever()
@@ -0,0 +1,120 @@
+import threading
+import time
+from datetime import datetime
+import click
+from sqlalchemy import delete, func, insert, literal, select, update
+from models import db, Borrowing, OverdueSummary
+
+# Approved loans past their due_date are moved to 'Overdue' by a sweep that
+# walks ix_borrowings_status_due_date, a batch of ids per UPDATE and commit,
+# so a large backlog never holds a long write lock. Each sweep then rebuilds
+# overdue_summaries (one row per book) for dashboards to read.
+
+ON_LOAN = 'Approved'
+OVERDUE = 'Overdue'
+
+
+def mark_overdue(today=None, batch_size=1000):
+    """Move every approved loan due before `today` to Overdue, return how many."""
+    today = today or datetime.utcnow().date()
+    marked = 0
+    while True:
+        ids = db.session.scalars(
+            select(Borrowing.id)
+            .where(Borrowing.status == ON_LOAN, Borrowing.due_date < today)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        # The status check again, in case a return raced the select
+        result = db.session.execute(
+            update(Borrowing)
+            .where(Borrowing.id.in_(ids), Borrowing.status == ON_LOAN)
+            .values(status=OVERDUE)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        marked += result.rowcount
+    return marked
+
+
+def refresh_overdue_summary():
+    """Rebuild overdue_summaries from the overdue loans in one statement."""
+    overdue = (
+        select(
+            Borrowing.book_id,
+            func.count(Borrowing.id),
+            func.min(Borrowing.due_date),
+            literal(datetime.utcnow(), db.DateTime),
+        )
+        .where(Borrowing.status == OVERDUE)
+        .group_by(Borrowing.book_id)
+    )
+    db.session.execute(delete(OverdueSummary))
+    db.session.execute(
+        insert(OverdueSummary).from_select(
+            ['book_id', 'overdue_count', 'oldest_due_date', 'refreshed_at'], overdue
+        )
+    )
+    db.session.commit()
+
+
+def sweep_overdue(today=None, batch_size=1000):
+    marked = mark_overdue(today, batch_size)
+    refresh_overdue_summary()
+    return marked
+
+
+class OverdueSweeper:
+    """Runs sweep_overdue every `interval` seconds on a daemon thread."""
+
+    def __init__(self, app, interval, batch_size=1000):
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='overdue-sweeper', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    marked = sweep_overdue(batch_size=self.batch_size)
+                if marked:
+                    print(f"Marked {marked} borrowings overdue")
+            except Exception as e:
+                print(f"Error sweeping overdue borrowings: {e}")
+            self._stop.wait(self.interval)
+
+
+def init_overdue_sweeper(app):
+    """
+    Register `flask sweep-overdue` and, when OVERDUE_SWEEP_INTERVAL is above
+    0, start sweeping in the background of this process.
+    """
+    batch_size = app.config.get('OVERDUE_SWEEP_BATCH_SIZE', 1000)
+
+    @app.cli.command('sweep-overdue')
+    @click.option('--loop', is_flag=True, help='Keep sweeping instead of running once.')
+    @click.option('--interval', default=3600, show_default=True, help='Seconds between sweeps with --loop.')
+    def sweep_overdue_command(loop, interval):
+        """Mark overdue borrowings and refresh the overdue summary."""
+        while True:
+            marked = sweep_overdue(batch_size=batch_size)
+            click.echo(f'Marked {marked} borrowings overdue')
+            if not loop:
+                break
+            time.sleep(interval)
+
+    interval = app.config.get('OVERDUE_SWEEP_INTERVAL', 0)
+    if interval > 0:
+        sweeper = OverdueSweeper(app, interval, batch_size)
+        app.extensions['overdue_sweeper'] = sweeper
+        sweeper.start()
@@ -0,0 +1,111 @@
+from urllib.parse import urlencode
+from flask import jsonify, request
+from config import db
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 200
+
+
+def parse_fields(model, fields_arg):
+    """
+    Turn a comma separated `fields=` argument into a list of column names.
+    Only plain columns of the model are allowed, never relationships.
+    """
+    columns = model.__table__.columns
+    if not fields_arg:
+        return [column.name for column in columns]
+
+    fields = []
+    for name in fields_arg.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in columns:
+            raise ValueError(f"Unknown field '{name}'")
+        fields.append(name)
+
+    # The cursor is built from the id, so it is always selected
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def parse_limit(limit_arg, default=DEFAULT_PAGE_LIMIT, maximum=MAX_PAGE_LIMIT):
+    if limit_arg in (None, ''):
+        return default
+    try:
+        limit = int(limit_arg)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if limit <= 0:
+        raise ValueError('limit must be greater than 0')
+    return min(limit, maximum)
+
+
+def parse_cursor(cursor_arg):
+    if cursor_arg in (None, ''):
+        return None
+    try:
+        return int(cursor_arg)
+    except (TypeError, ValueError):
+        raise ValueError('cursor must be an integer')
+
+
+def parse_offset(offset_arg):
+    if offset_arg in (None, ''):
+        return 0
+    try:
+        offset = int(offset_arg)
+    except (TypeError, ValueError):
+        raise ValueError('offset must be an integer')
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+    return offset
+
+
+def keyset_page(model, args):
+    """
+    Fetch one page of `model` rows ordered by id, starting after `cursor`.
+
+    Only the columns named in `fields` are selected, so relationships are
+    never loaded. One extra row is fetched to know whether a next page exists.
+    Without a `limit` argument every remaining row is returned, as these
+    listings always did. Returns a dict with the page items and the cursor
+    for the next page.
+    """
+    fields = parse_fields(model, args.get('fields'))
+    limit = parse_limit(args.get('limit')) if 'limit' in args else None
+    cursor = parse_cursor(args.get('cursor'))
+
+    columns = [model.__table__.c[name] for name in fields]
+    query = db.session.query(*columns)
+    if cursor is not None:
+        query = query.filter(model.id > cursor)
+    query = query.order_by(model.id)
+    if limit is None:
+        rows = query.all()
+        has_more = False
+    else:
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    items = [dict(zip(fields, row)) for row in rows]
+    next_cursor = items[-1]['id'] if has_more else None
+
+    return {'items': items, 'next_cursor': next_cursor, 'limit': limit}
+
+
+def keyset_response(model, args):
+    """
+    keyset_page() as a JSON response. With ?limit= the page is sent in its
+    {'items', 'next_cursor', 'limit'} envelope and the next page, if any, is
+    linked in a `Link: <url>; rel="next"` header. Without it the whole
+    listing is sent as a plain list, the shape these endpoints always had.
+    """
+    page = keyset_page(model, args)
+    response = jsonify(page if 'limit' in args else page['items'])
+    if page['next_cursor'] is not None:
+        next_args = args.to_dict(flat=False)
+        next_args['cursor'] = [page['next_cursor']]
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(next_args, doseq=True)}>; rel="next"'
+    return response
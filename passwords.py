@@ -0,0 +1,98 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+# Password hashing service used by User.set_password / check_password.
+#
+# The bcrypt cost comes from BCRYPT_LOG_ROUNDS. Hashes made with another cost
+# still verify, and needs_rehash() tells the login flow to store a new one.
+# With PASSWORD_HASH_WORKERS above 0 the hashing runs in a bounded process
+# pool, so a burst of sign-ups or logins can't take every core away from the
+# worker's other requests; at most PASSWORD_HASH_MAX_PENDING hashes wait for
+# the pool, further callers block until one finishes.
+
+DEFAULT_ROUNDS = 12
+
+# bcrypt only ever looked at the first 72 bytes, newer releases refuse longer input
+MAX_PASSWORD_BYTES = 72
+
+
+def _encode(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+# Run in the pool processes, so they have to be plain module level functions
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password, password_hash):
+    return bcrypt.checkpw(password, password_hash.encode('utf-8'))
+
+
+def hash_rounds(password_hash):
+    """Cost factor of a '$2b$12$...' hash, None if it isn't a bcrypt hash."""
+    parts = (password_hash or '').split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=0, max_pending=None):
+        self.configure(rounds, workers, max_pending)
+
+    def configure(self, rounds=DEFAULT_ROUNDS, workers=0, max_pending=None):
+        if getattr(self, '_pool', None) is not None:
+            self._pool.shutdown(wait=False)
+        self.rounds = rounds
+        self.workers = workers
+        self._pending = threading.BoundedSemaphore(max_pending or max(workers, 1) * 4)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.configure(
+            rounds=app.config.get('BCRYPT_LOG_ROUNDS', DEFAULT_ROUNDS),
+            workers=app.config.get('PASSWORD_HASH_WORKERS', 0),
+            max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING'),
+        )
+        app.extensions['password_hasher'] = self
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn, as forking a threaded server can copy held locks. Like
+                # any spawn pool it re-imports __main__, which has to be guarded
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        with self._pending:
+            return self._get_pool().submit(fn, *args).result()
+
+    def hash(self, password):
+        return self._run(_hash, _encode(password), self.rounds)
+
+    def verify(self, password, password_hash):
+        if not password or hash_rounds(password_hash) is None:
+            return False
+        return self._run(_verify, _encode(password), password_hash)
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,316 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import bindparam, insert, or_, select, update
+from models import db, Transaction, MpesaCallback
+from mpesa import MpesaError, mpesa_client
+
+# M-Pesa payments run outside the request:
+#
+# buyGoods stores a Pending transaction, queues the STK push and answers at
+# once with the transaction id. A small worker pool sends the pushes and moves
+# each transaction to Sent (with Safaricom's CheckoutRequestID) or Failed.
+#
+# /user/callback only appends the callback to the mpesa_callbacks inbox. A
+# processor applies the inbox in batches: a callback settles the transaction
+# with its CheckoutRequestID only while that is still open, so duplicate or
+# replayed callbacks change nothing. Callbacks that arrive before the worker
+# has stored the CheckoutRequestID are retried on later batches.
+
+PENDING = 'Pending'
+SENT = 'Sent'
+FAILED = 'Failed'
+COMPLETED = 'Completed'
+CANCELED = 'Canceled'
+OPEN_STATUSES = (PENDING, SENT)
+
+# Delay before an unmatched callback is looked at again, doubling per attempt
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 300
+
+
+class PaymentQueueFull(Exception):
+    pass
+
+
+class PaymentQueue:
+    def __init__(self, app, workers=4, max_pending=100):
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payment')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, transaction_id):
+        # Refuse instead of queueing without bound when Safaricom falls behind
+        if not self._slots.acquire(blocking=False):
+            raise PaymentQueueFull()
+        future = self._executor.submit(self._run, transaction_id)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, transaction_id):
+        with self.app.app_context():
+            try:
+                transaction = db.session.get(Transaction, transaction_id)
+                if transaction is None or transaction.status != PENDING:
+                    return
+                try:
+                    response = mpesa_client().stk_push(transaction.amount, transaction.phone_number)
+                except MpesaError as e:
+                    print(f"Error sending STK push for {transaction_id}: {e}")
+                    response = {'errorMessage': str(e)}
+
+                if response.get('ResponseCode') == '0' and response.get('CheckoutRequestID'):
+                    values = {'status': SENT, 'checkout_request_id': response['CheckoutRequestID']}
+                else:
+                    values = {
+                        'status': FAILED,
+                        'result_desc': response.get('errorMessage') or response.get('ResponseDescription'),
+                    }
+                db.session.execute(
+                    update(Transaction)
+                    .where(Transaction.id == transaction_id, Transaction.status == PENDING)
+                    .values(updated_at=datetime.utcnow(), **values)
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error processing payment {transaction_id}: {e}")
+
+
+def start_payment(amount, phone_number):
+    """Store a pending transaction and queue its STK push, returns the transaction."""
+    transaction = Transaction(id=uuid.uuid4().hex, amount=amount, phone_number=phone_number, status=PENDING)
+    db.session.add(transaction)
+    db.session.commit()
+    try:
+        current_app.extensions['payment_queue'].submit(transaction.id)
+    except PaymentQueueFull:
+        transaction.status = FAILED
+        transaction.result_desc = 'Payment queue full'
+        db.session.commit()
+        raise
+    return transaction
+
+
+def _result_code(callback):
+    """ResultCode of a callback as an int, None when it is missing or not a number."""
+    value = callback.get('ResultCode')
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return None
+
+
+def receive_callback(data):
+    """
+    Append an STK callback to the inbox. Returns False, without storing it,
+    when it has no CheckoutRequestID to match it by or no numeric ResultCode.
+    """
+    callback = data.get('Body', {}).get('stkCallback', {}) if isinstance(data, dict) else {}
+    if not isinstance(callback, dict):
+        return False
+    checkout_request_id = callback.get('CheckoutRequestID')
+    if not checkout_request_id or not isinstance(checkout_request_id, str) or _result_code(callback) is None:
+        return False
+    db.session.execute(insert(MpesaCallback).values(
+        checkout_request_id=checkout_request_id,
+        payload=json.dumps(callback),
+        received_at=datetime.utcnow(),
+    ))
+    db.session.commit()
+    processor = current_app.extensions.get('callback_processor')
+    if processor:
+        processor.wake()
+    return True
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** attempts, RETRY_MAX_SECONDS))
+
+
+def apply_callbacks(batch_size=500, orphan_after=timedelta(hours=1)):
+    """
+    Apply one batch of callbacks that are due, returns how many inbox rows
+    it handled. A callback for an unknown CheckoutRequestID is put back with
+    a growing delay, so it doesn't hold up the rows behind it, until it is
+    `orphan_after` old; then it is marked processed with an error, like a
+    callback whose payload can't be applied.
+    """
+    now = datetime.utcnow()
+    rows = db.session.execute(
+        select(MpesaCallback.id, MpesaCallback.checkout_request_id, MpesaCallback.payload,
+               MpesaCallback.received_at, MpesaCallback.attempts)
+        .where(
+            MpesaCallback.processed_at.is_(None),
+            or_(MpesaCallback.next_attempt_at.is_(None), MpesaCallback.next_attempt_at <= now),
+        )
+        .order_by(MpesaCallback.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+
+    checkout_ids = {row.checkout_request_id for row in rows}
+    known = set(db.session.scalars(
+        select(Transaction.checkout_request_id).where(Transaction.checkout_request_id.in_(checkout_ids))
+    ))
+
+    results = {}
+    processed = []
+    deferred = []
+    for row in rows:
+        error = None
+        if row.checkout_request_id in known:
+            # The first callback for a request settles it, later ones are replays
+            if row.checkout_request_id not in results:
+                try:
+                    callback = json.loads(row.payload)
+                    result_code = _result_code(callback)
+                except (TypeError, ValueError, AttributeError):
+                    result_code = None
+                if result_code is None:
+                    error = 'Invalid ResultCode'
+                else:
+                    results[row.checkout_request_id] = {
+                        'b_checkout_request_id': row.checkout_request_id,
+                        'b_status': COMPLETED if result_code == 0 else CANCELED,
+                        'b_result_code': result_code,
+                        'b_result_desc': callback.get('ResultDesc'),
+                    }
+        elif now - row.received_at > orphan_after:
+            error = 'Unknown CheckoutRequestID'
+        else:
+            deferred.append({'b_id': row.id, 'b_next_attempt_at': now + _retry_delay(row.attempts)})
+            continue
+        if error:
+            print(f"Error applying M-Pesa callback {row.id} for {row.checkout_request_id}: {error}")
+        processed.append({'b_id': row.id, 'b_error': error})
+
+    if results:
+        db.session.execute(
+            update(Transaction.__table__)
+            .where(
+                Transaction.checkout_request_id == bindparam('b_checkout_request_id'),
+                # Spelled out, an IN list can't be used with executemany
+                or_(*(Transaction.status == status for status in OPEN_STATUSES)),
+            )
+            .values(
+                status=bindparam('b_status'),
+                result_code=bindparam('b_result_code'),
+                result_desc=bindparam('b_result_desc'),
+                updated_at=now,
+            ),
+            list(results.values()),
+        )
+    if processed:
+        db.session.execute(
+            update(MpesaCallback.__table__)
+            .where(MpesaCallback.id == bindparam('b_id'))
+            .values(processed_at=now, error=bindparam('b_error')),
+            processed,
+        )
+    if deferred:
+        db.session.execute(
+            update(MpesaCallback.__table__)
+            .where(MpesaCallback.id == bindparam('b_id'))
+            .values(attempts=MpesaCallback.attempts + 1, next_attempt_at=bindparam('b_next_attempt_at')),
+            deferred,
+        )
+    db.session.commit()
+    return len(rows)
+
+
+class CallbackProcessor:
+    """
+    Applies the callback inbox on a daemon thread every `interval` seconds,
+    or sooner when woken. It runs from startup, so callbacks a previous
+    process stored but didn't apply are picked up without a new one arriving.
+    """
+
+    def __init__(self, app, interval=2, batch_size=500):
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='mpesa-callbacks', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            # The first pass waits too, giving `flask db upgrade` and the like a moment
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                with self.app.app_context():
+                    while apply_callbacks(self.batch_size) == self.batch_size:
+                        pass
+            except Exception as e:
+                print(f"Error applying M-Pesa callbacks: {e}")
+
+
+def _serving():
+    """
+    False when the app was loaded for a CLI command other than `flask run`
+    (`flask db upgrade`, `flask apply-payment-callbacks`, ...), which
+    shouldn't start background work.
+    """
+    ctx = click.get_current_context(silent=True)
+    return ctx is None or ctx.info_name == 'run'
+
+
+def init_payments(app):
+    """
+    Set up the STK push workers, register `flask apply-payment-callbacks`
+    and, when PAYMENT_CALLBACK_INTERVAL is above 0 and the app is being
+    served, start applying the callback inbox in the background of this
+    process.
+    """
+    app.extensions['payment_queue'] = PaymentQueue(
+        app,
+        workers=app.config.get('PAYMENT_WORKERS', 4),
+        max_pending=app.config.get('PAYMENT_QUEUE_SIZE', 100),
+    )
+    batch_size = app.config.get('PAYMENT_CALLBACK_BATCH_SIZE', 500)
+    interval = app.config.get('PAYMENT_CALLBACK_INTERVAL', 2)
+    if interval > 0 and _serving():
+        processor = CallbackProcessor(app, interval=interval, batch_size=batch_size)
+        app.extensions['callback_processor'] = processor
+        processor.start()
+
+    @app.cli.command('apply-payment-callbacks')
+    @click.option('--loop', is_flag=True, help='Keep applying instead of running once.')
+    @click.option('--interval', default=2, show_default=True, help='Seconds between batches with --loop.')
+    def apply_callbacks_command(loop, interval):
+        """Apply the M-Pesa callback inbox to the transactions."""
+        while True:
+            applied = apply_callbacks(batch_size)
+            if applied:
+                click.echo(f'Handled {applied} callbacks')
+            if not loop and applied < batch_size:
+                break
+            if applied < batch_size:
+                time.sleep(interval)
@@ -0,0 +1,126 @@
+import re
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload
+from models import Sale, Borrowing
+
+# Named eager loading profiles, one per response shape.
+# Each one loads exactly the relationships the endpoint serializes.
+LOAD_PROFILES = {
+    'admin_order_list': (joinedload(Sale.user), joinedload(Sale.book)),
+    'admin_borrowing_list': (joinedload(Borrowing.user), joinedload(Borrowing.book)),
+    'admin_return_requests': (joinedload(Borrowing.user), joinedload(Borrowing.book)),
+}
+
+
+def with_profile(query, name):
+    """Apply the loader options of profile `name` to `query`."""
+    return query.options(*LOAD_PROFILES[name])
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and 'query_count' in g:
+        g.query_count += 1
+
+
+@contextmanager
+def uncounted_queries():
+    """
+    Leave the statements run inside out of the request's query count. For
+    bookkeeping that runs in whichever request comes first (token revocation
+    sync, cache misses of the admin role), not for the endpoint's own queries.
+    """
+    if not has_app_context() or 'query_count' not in g:
+        yield
+        return
+    count = g.query_count
+    try:
+        yield
+    finally:
+        g.query_count = count
+
+
+# ORDER BY <table>.id LIMIT: a keyset page walks the rowid in order and stops
+# after LIMIT rows, SQLite still reports that as a SCAN
+_ROWID_PAGE = re.compile(r'\bORDER BY\s+(\w+)\.id(?:\s+ASC)?\s+LIMIT\b', re.IGNORECASE)
+
+
+def _full_scans(plan_rows, statement=''):
+    # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail); a plain
+    # "SCAN <table>" without an index is a full table scan
+    paged = set(_ROWID_PAGE.findall(statement))
+    scans = []
+    for row in plan_rows:
+        detail = row[3]
+        if detail.startswith('SCAN') and 'USING' not in detail and 'VIRTUAL TABLE' not in detail:
+            if detail.split()[1] in paged:
+                continue
+            scans.append(detail)
+    return scans
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _check_query_plan(conn, cursor, statement, parameters, context, executemany):
+    if executemany or not (has_app_context() and 'full_scans' in g):
+        return
+    if conn.dialect.name != 'sqlite' or not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+        return
+    # Raw DBAPI cursor, so the EXPLAIN itself isn't counted or checked
+    plan_cursor = cursor.connection.cursor()
+    try:
+        plan_cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        for detail in _full_scans(plan_cursor.fetchall(), statement):
+            g.full_scans.append((detail, statement))
+    finally:
+        plan_cursor.close()
+
+
+def init_query_budget(app):
+    """
+    Count the SQL statements of every request when QUERY_BUDGET_ENFORCE is
+    set and check them against the endpoint's QUERY_BUDGETS entry. An overrun
+    fails the request under TESTING and is only logged otherwise.
+
+    With QUERY_PLAN_CHECK set (SQLite only) every statement is also run
+    through EXPLAIN QUERY PLAN and full table scans are reported per endpoint,
+    collected in app.extensions['full_scans'].
+    """
+    app.extensions['full_scans'] = {}
+
+    @app.before_request
+    def start_query_count():
+        if app.config.get('QUERY_BUDGET_ENFORCE'):
+            g.query_count = 0
+        if app.config.get('QUERY_PLAN_CHECK'):
+            g.full_scans = []
+
+    @app.after_request
+    def report_full_scans(response):
+        scans = g.pop('full_scans', None)
+        if scans:
+            seen = app.extensions['full_scans'].setdefault(request.endpoint, set())
+            for detail, statement in scans:
+                if (detail, statement) not in seen:
+                    seen.add((detail, statement))
+                    current_app.logger.warning('Full scan in %s: %s\n    %s', request.endpoint, detail, statement)
+        return response
+
+    @app.after_request
+    def check_query_budget(response):
+        count = g.pop('query_count', None)
+        if count is None:
+            return response
+        budget = app.config.get('QUERY_BUDGETS', {}).get(request.endpoint)
+        if budget is not None and count > budget:
+            message = f'{request.endpoint} ran {count} queries, budget is {budget}'
+            if app.config.get('TESTING'):
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
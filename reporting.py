@@ -0,0 +1,187 @@
+from datetime import datetime
+from sqlalchemy import func, select
+from models import db, Sale, Borrowing
+
+try:
+    import numpy as np
+except ImportError:  # reports still work, just slower, without numpy
+    np = None
+
+# Finance reports over the raw sales and borrowings tables.
+#
+# Only the needed columns are selected and fetched a chunk of rows at a time,
+# each chunk is turned into column arrays and aggregated with numpy
+# (unique + bincount), then folded into running totals, so memory stays bounded
+# by the partition size. Borrow durations are the exception, they are kept
+# (one float each) until the percentiles are taken.
+
+CHUNK_SIZE = 100000
+DURATION_PERCENTILES = (50, 90, 99)
+
+
+def _partitions(stmt, chunk_size):
+    """
+    Yield the result of `stmt` as column tuples, `chunk_size` rows at a time.
+    Executed on the Core connection, ORM row handling would about double
+    the extraction time, with a server side cursor where the driver has one.
+    """
+    result = db.session.connection().execute(stmt.execution_options(stream_results=True))
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield tuple(zip(*rows))
+    finally:
+        result.close()
+
+
+def _sum_by(keys, *values):
+    """Group `values` by `keys`, returning {key: [sum of each value]}."""
+    if np is not None:
+        groups, inverse = np.unique(np.asarray(keys), return_inverse=True)
+        sums = [np.bincount(inverse, weights=np.asarray(value, dtype=float), minlength=len(groups)) for value in values]
+        return {group.item(): [float(total[i]) for total in sums] for i, group in enumerate(groups)}
+
+    totals = {}
+    for key, *row in zip(keys, *values):
+        sums = totals.setdefault(key, [0.0] * len(values))
+        for i, value in enumerate(row):
+            sums[i] += value
+    return totals
+
+
+def _merge(totals, chunk_totals):
+    for key, sums in chunk_totals.items():
+        running = totals.setdefault(key, [0.0] * len(sums))
+        for i, value in enumerate(sums):
+            running[i] += value
+
+
+def _percentiles(values, percentiles):
+    if np is not None:
+        return [float(value) for value in np.percentile(values, percentiles)]
+
+    # Linear interpolation between closest ranks, what numpy does by default
+    values = sorted(values)
+    results = []
+    for percentile in percentiles:
+        rank = (len(values) - 1) * percentile / 100
+        low = int(rank)
+        high = min(low + 1, len(values) - 1)
+        results.append(values[low] + (values[high] - values[low]) * (rank - low))
+    return results
+
+
+def _days_between(start, end):
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return func.julianday(end) - func.julianday(start)
+    return end - start
+
+
+def _date_filters(column, since, until):
+    filters = []
+    if since:
+        filters.append(column >= since)
+    if until:
+        filters.append(column <= until)
+    return filters
+
+
+def _statuses(statuses):
+    # Rows from before status had a default can be NULL
+    if np is not None:
+        statuses = np.asarray(statuses, dtype=object)
+        statuses[statuses == None] = 'Unknown'  # noqa: E711, elementwise
+        return statuses.astype(str)
+    return [status or 'Unknown' for status in statuses]
+
+
+def sales_report(since=None, until=None, top=10, chunk_size=CHUNK_SIZE):
+    """Orders, quantity and revenue in total, per status and for the top books."""
+    stmt = (
+        select(Sale.status, Sale.book_id, Sale.quantity, Sale.total_price)
+        .where(*_date_filters(Sale.date_of_sale, since, until))
+    )
+    by_status = {}
+    by_book = {}
+    for statuses, book_ids, quantities, prices in _partitions(stmt, chunk_size):
+        statuses = _statuses(statuses)
+        _merge(by_status, _sum_by(statuses, [1] * len(statuses), quantities, prices))
+        if np is not None:
+            approved = statuses == 'Approved'
+            book_ids, quantities, prices = (np.asarray(column)[approved] for column in (book_ids, quantities, prices))
+        else:
+            rows = [row for status, *row in zip(statuses, book_ids, quantities, prices) if status == 'Approved']
+            book_ids, quantities, prices = zip(*rows) if rows else ((), (), ())
+        if len(book_ids):
+            _merge(by_book, _sum_by(book_ids, quantities, prices))
+
+    orders, quantity, revenue = (sum(sums[i] for sums in by_status.values()) for i in range(3))
+    top_books = sorted(by_book.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    return {
+        'orders': int(orders),
+        'quantity': int(quantity),
+        'revenue': round(revenue, 2),
+        'by_status': {
+            status: {'orders': int(count), 'quantity': int(qty), 'revenue': round(total, 2)}
+            for status, (count, qty, total) in sorted(by_status.items())
+        },
+        'top_books_by_approved_revenue': [
+            {'book_id': int(book_id), 'quantity': int(qty), 'revenue': round(total, 2)}
+            for book_id, (qty, total) in top_books
+        ],
+    }
+
+
+def borrowing_report(since=None, until=None, chunk_size=CHUNK_SIZE):
+    """Loans per status and how long returned books were out, in days."""
+    stmt = (
+        select(Borrowing.status, _days_between(Borrowing.date_borrowed, Borrowing.date_returned))
+        .where(*_date_filters(Borrowing.date_borrowed, since, until))
+    )
+    by_status = {}
+    chunks = []
+    for statuses, days in _partitions(stmt, chunk_size):
+        statuses = _statuses(statuses)
+        _merge(by_status, _sum_by(statuses, [1] * len(statuses)))
+        if np is not None:
+            # NULL (not returned yet) comes out as NaN
+            days = np.asarray(days, dtype=float)
+            chunks.append(days[~np.isnan(days)])
+        else:
+            chunks.append([value for value in days if value is not None])
+
+    duration_days = {'returned': 0}
+    if np is not None:
+        durations = np.concatenate(chunks) if chunks else np.empty(0)
+        if len(durations):
+            duration_days.update(returned=len(durations), mean=float(durations.mean()), max=float(durations.max()))
+    else:
+        durations = [value for chunk in chunks for value in chunk]
+        if durations:
+            duration_days.update(returned=len(durations), mean=sum(durations) / len(durations), max=float(max(durations)))
+    if len(durations):
+        duration_days['mean'] = round(duration_days['mean'], 2)
+        for percentile, value in zip(DURATION_PERCENTILES, _percentiles(durations, DURATION_PERCENTILES)):
+            duration_days[f'p{percentile}'] = round(value, 2)
+
+    return {
+        'borrowings': int(sum(count for (count,) in by_status.values())),
+        'by_status': {status: int(count) for status, (count,) in sorted(by_status.items())},
+        'duration_days': duration_days,
+    }
+
+
+def parse_report_date(value):
+    """YYYY-MM-DD query argument to a date, None when missing."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"invalid date '{value}', expected YYYY-MM-DD")
+
+
+def engine_name():
+    return 'numpy' if np is not None else 'python'
@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import time
+from functools import wraps
+from flask import current_app, request, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.http import http_date
+from cache import cache
+from models import db
+
+# Response cache for the public catalog endpoints.
+#
+# Rendered bodies are kept (with a gzipped copy) per route + query string and
+# tagged with the catalog version. Admin writes to the books mark the session
+# with mark_catalog_changed(); the version is bumped once that commit
+# succeeds, which makes every cached page stale. With a shared cache tier the
+# version and the pages are shared by all workers, otherwise the TTL bounds
+# how long another worker can serve an old page.
+#
+# Borrowing and checkout only move stock counts and call mark_stock_changed()
+# instead, which leaves the version alone. Pages that show stock are cached
+# for at most CATALOG_STOCK_TTL seconds, so stock is never older than that.
+
+PAGES_NAMESPACE = 'catalog_pages'
+CATALOG_NAMESPACE = 'catalog'
+STOCK_FIELDS = ('stock', 'available_copies')
+# Response headers that are part of a page and kept with it
+CACHED_HEADERS = ('Link',)
+
+
+def catalog_version():
+    return cache.counter(CATALOG_NAMESPACE, 'version')
+
+
+def catalog_updated_at(with_stock=False):
+    updated_at = cache.get(CATALOG_NAMESPACE, 'updated_at') or time.time()
+    if with_stock:
+        updated_at = max(updated_at, cache.get(CATALOG_NAMESPACE, 'stock_updated_at') or 0)
+    return updated_at
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_NAMESPACE, 'updated_at', time.time(), ttl=86400)
+    cache.incr(CATALOG_NAMESPACE, 'version')
+
+
+def mark_catalog_changed():
+    """Invalidate cached catalog pages once the current transaction commits."""
+    db.session.info['catalog_changed'] = True
+
+
+def mark_stock_changed():
+    """
+    Note a stock change for Last-Modified once the current transaction
+    commits. Cached pages are kept, their short TTL covers stock.
+    """
+    db.session.info['stock_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_after_commit(session):
+    if session.info.pop('catalog_changed', False):
+        bump_catalog_version()
+    if session.info.pop('stock_changed', False):
+        cache.set(CATALOG_NAMESPACE, 'stock_updated_at', time.time(), ttl=86400)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_catalog_change(session):
+    session.info.pop('catalog_changed', None)
+    session.info.pop('stock_changed', None)
+
+
+def shows_stock(fields_arg):
+    """Whether a page selected with `fields=` includes stock counts."""
+    if not fields_arg:
+        return True
+    return any(name.strip() in STOCK_FIELDS for name in fields_arg.split(','))
+
+
+class CachedBody:
+    def __init__(self, body, mimetype, last_modified, headers=None):
+        self.body = body
+        self.headers = headers or {}
+        self.gzipped = gzip.compress(body) if len(body) > 512 else None
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = last_modified
+
+
+def _not_modified(entry):
+    # If-None-Match wins over If-Modified-Since when both are sent
+    if request.if_none_match:
+        return request.if_none_match.contains(entry.etag)
+    if request.if_modified_since:
+        return request.if_modified_since.timestamp() >= int(entry.last_modified)
+    return False
+
+
+def _build_response(entry):
+    if _not_modified(entry):
+        response = make_response('', 304)
+    elif entry.gzipped and 'gzip' in request.accept_encodings:
+        response = make_response(entry.gzipped)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.mimetype = entry.mimetype
+    else:
+        response = make_response(entry.body)
+        response.mimetype = entry.mimetype
+
+    response.headers.update(entry.headers)
+    response.set_etag(entry.etag)
+    response.headers['Last-Modified'] = http_date(entry.last_modified)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Clients may keep the page but have to revalidate it with the ETag
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+
+def cached_response(fn):
+    """
+    Serve GET responses of `fn` from memory until the catalog changes,
+    answering If-None-Match / If-Modified-Since with 304.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not current_app.config.get('CATALOG_CACHE_ENABLED', True):
+            return fn(*args, **kwargs)
+
+        version = catalog_version()
+        key = (version, request.path, tuple(sorted(request.args.items(multi=True))))
+        entry = cache.get(PAGES_NAMESPACE, key)
+        if entry is None:
+            with_stock = shows_stock(request.args.get('fields'))
+            updated_at = catalog_updated_at(with_stock)
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+            entry = CachedBody(response.get_data(), response.mimetype, updated_at, headers)
+            ttl = current_app.config.get('CATALOG_CACHE_TTL', 60)
+            if with_stock:
+                ttl = min(ttl, current_app.config.get('CATALOG_STOCK_TTL', 5))
+            cache.set(PAGES_NAMESPACE, key, entry, ttl=ttl)
+        return _build_response(entry)
+    return wrapper
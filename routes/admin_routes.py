@@ -1,9 +1,23 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, StoreBook, LibraryBook, Sale, Borrowing
-import cloudinary.uploader
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from models import (
+    db, User, StoreBook, LibraryBook, Sale, Borrowing, OverdueSummary,
+    DailyBookRevenue, BookBorrowCount, UserActiveLoans,
+)
+from serializers import serialize_many, json_response, streaming_json_response
+from query_profiles import with_profile
+from auth import has_admin_access
+from inventory import return_library_copy
+from image_uploads import buffer_image, queue_image_upload, discard_image, PENDING
+from catalog_io import import_catalog, export_catalog
+from response_cache import mark_catalog_changed
+from cache import cache
+from analytics import record_sale_status, record_loan_status, record_library_book_deleted
+from pagination import parse_limit
+from reporting import sales_report, borrowing_report, parse_report_date, engine_name
+from sqlalchemy import func
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timedelta
 
 admin_bp = Blueprint('admin_routes', __name__)
 
@@ -13,23 +27,11 @@ def admin_required(fn):
     @jwt_required()
     def wrapper(*args, **kwargs):
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        if not user or not user.is_admin:
+        if not has_admin_access(current_user_id, get_jwt()):
             return jsonify({'error': 'Admin access required'}), 403
         return fn(*args, **kwargs)
     return wrapper
 
-# Helper function to handle image uploads
-def upload_image(file):
-    if not file:
-        return None
-    try:
-        upload_result = cloudinary.uploader.upload(file)
-        return upload_result['secure_url']
-    except Exception as e:
-        print(f"Image upload error: {e}")
-        return None
-
 # Admin Routes
 
 # CRUD Routes for Store Books
@@ -37,6 +39,7 @@ def upload_image(file):
 @admin_bp.route('/store_books', methods=['POST'])
 @admin_required
 def add_store_book():
+    image_path = None
     try:
         title = request.form.get('title')
         author = request.form.get('author')
@@ -45,12 +48,13 @@ def add_store_book():
         price = float(request.form.get('price', 0))
         stock = int(request.form.get('stock', 0))
 
-        image = request.files.get('image')
-        image_url = upload_image(image)
-
         if not all([title, author, genre, isbn]):
             return jsonify({'error': 'Missing required fields'}), 400
 
+        # The cover is uploaded in the background once the book is saved
+        image = request.files.get('image')
+        image_path = buffer_image(image) if image else None
+
         new_book = StoreBook(
             title=title,
             author=author,
@@ -58,13 +62,18 @@ def add_store_book():
             isbn=isbn,
             price=price,
             stock=stock,
-            image_url=image_url
+            image_status=PENDING if image_path else None
         )
         db.session.add(new_book)
+        mark_catalog_changed()
         db.session.commit()
+        if image_path:
+            queue_image_upload(StoreBook, new_book.id, image_path)
         return jsonify(new_book.to_dict()), 201
 
     except Exception as e:
+        db.session.rollback()
+        discard_image(image_path)
         print(f"Error adding store book: {e}")
         return jsonify({'error': 'Failed to add store book'}), 500
 
@@ -75,6 +84,7 @@ def update_store_book(book_id):
     if not book:
         return jsonify({'error': 'Book not found'}), 404
 
+    image_path = None
     try:
         book.title = request.form.get('title', book.title)
         book.author = request.form.get('author', book.author)
@@ -85,12 +95,18 @@ def update_store_book(book_id):
 
         image = request.files.get('image')
         if image:
-            book.image_url = upload_image(image)
+            image_path = buffer_image(image)
+            book.image_status = PENDING
 
+        mark_catalog_changed()
         db.session.commit()
+        if image_path:
+            queue_image_upload(StoreBook, book.id, image_path)
         return jsonify(book.to_dict())
 
     except Exception as e:
+        db.session.rollback()
+        discard_image(image_path)
         print(f"Error updating store book: {e}")
         return jsonify({'error': 'Failed to update store book'}), 500
 
@@ -101,10 +117,14 @@ def delete_store_book(book_id):
     if not book:
         return jsonify({'error': 'Book not found'}), 404
     try:
+        # Its rollup rows too, SQLite doesn't act on the ON DELETE CASCADE
+        DailyBookRevenue.query.filter_by(book_id=book.id).delete(synchronize_session=False)
         db.session.delete(book)
+        mark_catalog_changed()
         db.session.commit()
         return jsonify({'message': f'Store book {book_id} deleted successfully'})
     except Exception as e:
+        db.session.rollback()
         print(f"Error deleting store book: {e}")
         return jsonify({'error': 'Failed to delete book'}), 500
 
@@ -113,6 +133,7 @@ def delete_store_book(book_id):
 @admin_bp.route('/library_books', methods=['POST'])
 @admin_required
 def add_library_book():
+    image_path = None
     try:
         title = request.form.get('title')
         author = request.form.get('author')
@@ -121,12 +142,13 @@ def add_library_book():
         available_copies = int(request.form.get('available_copies', 0))
         total_copies = int(request.form.get('total_copies', available_copies))
 
-        image = request.files.get('image')
-        image_url = upload_image(image)
-
         if not all([title, author, genre, isbn]):
             return jsonify({'error': 'Missing required fields'}), 400
 
+        # The cover is uploaded in the background once the book is saved
+        image = request.files.get('image')
+        image_path = buffer_image(image) if image else None
+
         new_book = LibraryBook(
             title=title,
             author=author,
@@ -134,13 +156,18 @@ def add_library_book():
             isbn=isbn,
             available_copies=available_copies,
             total_copies=total_copies,
-            image_url=image_url
+            image_status=PENDING if image_path else None
         )
         db.session.add(new_book)
+        mark_catalog_changed()
         db.session.commit()
+        if image_path:
+            queue_image_upload(LibraryBook, new_book.id, image_path)
         return jsonify(new_book.to_dict()), 201
 
     except Exception as e:
+        db.session.rollback()
+        discard_image(image_path)
         print(f"Error adding library book: {e}")
         return jsonify({'error': 'Failed to add library book'}), 500
 
@@ -151,6 +178,7 @@ def update_library_book(book_id):
     if not book:
         return jsonify({'error': 'Book not found'}), 404
 
+    image_path = None
     try:
         book.title = request.form.get('title', book.title)
         book.author = request.form.get('author', book.author)
@@ -161,12 +189,18 @@ def update_library_book(book_id):
 
         image = request.files.get('image')
         if image:
-            book.image_url = upload_image(image)
+            image_path = buffer_image(image)
+            book.image_status = PENDING
 
+        mark_catalog_changed()
         db.session.commit()
+        if image_path:
+            queue_image_upload(LibraryBook, book.id, image_path)
         return jsonify(book.to_dict())
 
     except Exception as e:
+        db.session.rollback()
+        discard_image(image_path)
         print(f"Error updating library book: {e}")
         return jsonify({'error': 'Failed to update library book'}), 500
 
@@ -177,20 +211,70 @@ def delete_library_book(book_id):
     if not book:
         return jsonify({'error': 'Book not found'}), 404
     try:
+        # Its rollup rows too, SQLite doesn't act on the ON DELETE CASCADE.
+        # Its borrowings go with it, so their open loans stop counting
+        record_library_book_deleted(book.id)
+        BookBorrowCount.query.filter_by(book_id=book.id).delete(synchronize_session=False)
+        OverdueSummary.query.filter_by(book_id=book.id).delete(synchronize_session=False)
         db.session.delete(book)
+        mark_catalog_changed()
         db.session.commit()
         return jsonify({'message': f'Library book {book_id} deleted successfully'})
     except Exception as e:
+        db.session.rollback()
         print(f"Error deleting library book: {e}")
         return jsonify({'error': 'Failed to delete book'}), 500
 
+# Bulk catalog import / export, CSV or NDJSON
+
+def catalog_format(filename=None):
+    fmt = request.args.get('format')
+    if not fmt and filename:
+        fmt = 'csv' if filename.lower().endswith('.csv') else 'ndjson'
+    if not fmt:
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    return fmt if fmt in ('csv', 'ndjson') else None
+
+@admin_bp.route('/<any(store_books, library_books):catalog>/import', methods=['POST'])
+@admin_required
+def import_books(catalog):
+    """
+    Upsert books by isbn from a CSV or NDJSON body (or a multipart 'file'),
+    read incrementally and committed in batches.
+    """
+    upload = request.files.get('file')
+    fmt = catalog_format(upload.filename if upload else None)
+    if not fmt:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    try:
+        result = import_catalog(catalog, upload.stream if upload else request.stream, fmt)
+        return jsonify(result), 200
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error importing {catalog}: {e}")
+        return jsonify({'error': 'Failed to import books'}), 500
+
+@admin_bp.route('/<any(store_books, library_books):catalog>/export', methods=['GET'])
+@admin_required
+def export_books(catalog):
+    fmt = catalog_format()
+    if not fmt:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    return Response(
+        stream_with_context(export_catalog(catalog, fmt)),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={catalog}.{fmt}'},
+    )
+
 # Routes for Orders
 @admin_bp.route('/orders', methods=['GET'])
 @admin_required
 def view_orders():
     try:
-        orders = Sale.query.all()
-        return jsonify([order.to_dict() for order in orders]), 200
+        orders = with_profile(Sale.query, 'admin_order_list').order_by(Sale.id)
+        return streaming_json_response(orders, depth=1, include=('user', 'book'))
     except Exception as e:
         print(f"Error fetching orders: {e}")
         return jsonify({'error': 'Failed to fetch orders'}), 500
@@ -207,13 +291,32 @@ def approve_order(sale_id):
         return jsonify({"error": "Invalid action"}), 400
 
     try:
-        sale.status = 'Approved' if action == 'approve' else 'Rejected'
+        old_status = sale.status
+        new_status = 'Approved' if action == 'approve' else 'Rejected'
+        # Conditional on the status we read, so the revenue rollup sees each change once
+        changed = Sale.query.filter_by(id=sale.id, status=old_status).update(
+            {'status': new_status}, synchronize_session=False
+        )
+        if not changed:
+            db.session.rollback()
+            return jsonify({"error": "Order was updated meanwhile, try again"}), 409
+        record_sale_status(sale, old_status, new_status)
         db.session.commit()
         return jsonify({"message": f"Order {action}ed", "order": sale.to_dict()})
     except Exception as e:
         print(f"Error approving order: {e}")
         return jsonify({'error': 'Failed to update order'}), 500
 
+# Hit / miss counts of the shared cache, per namespace
+@admin_bp.route('/cache/stats', methods=['GET'])
+@admin_required
+def cache_stats():
+    return jsonify({
+        'shared_tier': cache.shared is not None,
+        'local_entries': len(cache.local),
+        'namespaces': cache.stats(),
+    })
+
 
 
 
@@ -723,8 +826,8 @@ def approve_order(sale_id):
 @admin_required
 def view_borrowings():
     try:
-        borrowings = Borrowing.query.all()
-        return jsonify([borrowing.to_dict() for borrowing in borrowings]), 200
+        borrowings = with_profile(Borrowing.query, 'admin_borrowing_list').order_by(Borrowing.id)
+        return streaming_json_response(borrowings, depth=1, include=('user', 'book'))
     except Exception as e:
         print(f"Error fetching borrowings: {e}")
         return jsonify({'error': 'Failed to fetch borrowings'}), 500
@@ -744,7 +847,15 @@ def approve_lending(borrowing_id):
         return jsonify({"error": "Invalid action"}), 400
 
     try:
-        borrowing.status = 'Approved' if action == 'approve' else 'Rejected'
+        old_status = borrowing.status
+        new_status = 'Approved' if action == 'approve' else 'Rejected'
+        changed = Borrowing.query.filter_by(id=borrowing.id, status=old_status).update(
+            {'status': new_status}, synchronize_session=False
+        )
+        if not changed:
+            db.session.rollback()
+            return jsonify({"error": "Lending request was updated meanwhile, try again"}), 409
+        record_loan_status(borrowing.user_id, old_status, new_status)
         db.session.commit()
         return jsonify({"message": f"Lending request {action}ed", "borrowing": borrowing.to_dict()})
     except Exception as e:
@@ -755,14 +866,12 @@ def approve_lending(borrowing_id):
 @admin_bp.route('/view_books', methods=['GET'])
 @admin_required
 def view_books():
-    books = StoreBook.query.all()
-    return jsonify([book.to_dict() for book in books]), 200
+    return streaming_json_response(StoreBook.query.order_by(StoreBook.id))
 
 @admin_bp.route('/view_library_books', methods=['GET'])
 @admin_required
 def view_library_books():
-    library_books = LibraryBook.query.all()
-    return jsonify([book.to_dict() for book in library_books]), 200
+    return streaming_json_response(LibraryBook.query.order_by(LibraryBook.id))
 
 
 
@@ -782,11 +891,15 @@ def confirm_return():
     if borrowing.status != 'Return Requested':
         return jsonify({'error': 'Cannot confirm return for a non-requested book.'}), 400
 
-    borrowing.status = 'Returned'
-    borrowing.date_returned = datetime.utcnow()
-
-    book = LibraryBook.query.get(borrowing.book_id)
-    book.available_copies += 1
+    # Conditional status change, so a return confirmed twice frees one copy
+    confirmed = Borrowing.query.filter_by(id=borrowing.id, status='Return Requested').update(
+        {'status': 'Returned', 'date_returned': datetime.utcnow()}, synchronize_session=False
+    )
+    if not confirmed:
+        db.session.rollback()
+        return jsonify({'error': 'Cannot confirm return for a non-requested book.'}), 400
+    return_library_copy(borrowing.book_id)
+    record_loan_status(borrowing.user_id, 'Return Requested', 'Returned')
 
     db.session.commit()
 
@@ -799,9 +912,178 @@ def get_return_requests():
     """
     Fetch all return requests with status 'Return Requested'.
     """
-    return_requests = Borrowing.query.filter_by(status='Return Requested').all()
+    return_requests = with_profile(Borrowing.query, 'admin_return_requests').filter_by(status='Return Requested').all()
 
     if not return_requests:
         return jsonify([]), 200
 
-    return jsonify([request.to_dict() for request in return_requests]), 200
+    return json_response(serialize_many(return_requests, depth=1, include=('user', 'book')))
+
+
+@admin_bp.route('/overdue', methods=['GET'])
+@admin_required
+def overdue_summary():
+    """
+    Overdue loans per book as of the last overdue sweep.
+    """
+    rows = OverdueSummary.query.order_by(OverdueSummary.overdue_count.desc()).all()
+    return jsonify({
+        'total_overdue': sum(row.overdue_count for row in rows),
+        'refreshed_at': rows[0].refreshed_at.strftime('%Y-%m-%d %H:%M:%S') if rows else None,
+        'books': [
+            {
+                'book_id': row.book_id,
+                'overdue_count': row.overdue_count,
+                'oldest_due_date': row.oldest_due_date.strftime('%Y-%m-%d'),
+            }
+            for row in rows
+        ],
+    })
+
+
+# Analytics, read from the rollup tables kept by analytics.py
+
+@admin_bp.route('/analytics/revenue', methods=['GET'])
+@admin_required
+def revenue_analytics():
+    """
+    Ordered and approved revenue per day over the last ?days= (default 30),
+    plus the books that brought in the most approved revenue.
+    """
+    try:
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({'error': 'days must be an integer'}), 400
+    try:
+        limit = parse_limit(request.args.get('limit'), default=10)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    since = datetime.utcnow().date() - timedelta(days=max(days, 1) - 1)
+
+    daily = (
+        db.session.query(
+            DailyBookRevenue.day,
+            func.sum(DailyBookRevenue.ordered_revenue),
+            func.sum(DailyBookRevenue.approved_revenue),
+            func.sum(DailyBookRevenue.approved_quantity),
+        )
+        .filter(DailyBookRevenue.day >= since)
+        .group_by(DailyBookRevenue.day)
+        .order_by(DailyBookRevenue.day)
+        .all()
+    )
+    top_books = (
+        db.session.query(
+            DailyBookRevenue.book_id,
+            StoreBook.title,
+            func.sum(DailyBookRevenue.approved_quantity).label('quantity'),
+            func.sum(DailyBookRevenue.approved_revenue).label('revenue'),
+        )
+        .join(StoreBook, StoreBook.id == DailyBookRevenue.book_id)
+        .filter(DailyBookRevenue.day >= since)
+        .group_by(DailyBookRevenue.book_id, StoreBook.title)
+        .order_by(func.sum(DailyBookRevenue.approved_revenue).desc())
+        .limit(limit)
+        .all()
+    )
+    return jsonify({
+        'since': since.strftime('%Y-%m-%d'),
+        'daily': [
+            {'day': day.strftime('%Y-%m-%d'), 'ordered_revenue': ordered, 'approved_revenue': approved, 'approved_quantity': quantity}
+            for day, ordered, approved, quantity in daily
+        ],
+        'top_books': [
+            {'book_id': book_id, 'title': title, 'quantity': quantity, 'revenue': revenue}
+            for book_id, title, quantity, revenue in top_books
+        ],
+    })
+
+@admin_bp.route('/analytics/borrowing', methods=['GET'])
+@admin_required
+def borrowing_analytics():
+    """
+    Most borrowed library books and borrow counts per genre.
+    """
+    try:
+        limit = parse_limit(request.args.get('limit'), default=10)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    top_books = (
+        db.session.query(BookBorrowCount.book_id, LibraryBook.title, LibraryBook.genre, BookBorrowCount.borrow_count)
+        .join(LibraryBook, LibraryBook.id == BookBorrowCount.book_id)
+        .order_by(BookBorrowCount.borrow_count.desc())
+        .limit(limit)
+        .all()
+    )
+    by_genre = (
+        db.session.query(LibraryBook.genre, func.sum(BookBorrowCount.borrow_count))
+        .join(LibraryBook, LibraryBook.id == BookBorrowCount.book_id)
+        .group_by(LibraryBook.genre)
+        .order_by(func.sum(BookBorrowCount.borrow_count).desc())
+        .all()
+    )
+    return jsonify({
+        'top_books': [
+            {'book_id': book_id, 'title': title, 'genre': genre, 'borrow_count': count}
+            for book_id, title, genre, count in top_books
+        ],
+        'by_genre': [{'genre': genre, 'borrow_count': count} for genre, count in by_genre],
+    })
+
+@admin_bp.route('/analytics/active_loans', methods=['GET'])
+@admin_required
+def active_loans_analytics():
+    """
+    Users holding library books, most loans first.
+    """
+    try:
+        limit = parse_limit(request.args.get('limit'), default=20)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    total_loans, total_users = (
+        db.session.query(func.coalesce(func.sum(UserActiveLoans.active_loans), 0), func.count(UserActiveLoans.user_id))
+        .filter(UserActiveLoans.active_loans > 0)
+        .one()
+    )
+    users = (
+        db.session.query(UserActiveLoans.user_id, User.name, UserActiveLoans.active_loans)
+        .join(User, User.id == UserActiveLoans.user_id)
+        .filter(UserActiveLoans.active_loans > 0)
+        .order_by(UserActiveLoans.active_loans.desc())
+        .limit(limit)
+        .all()
+    )
+    return jsonify({
+        'total_active_loans': total_loans,
+        'users_with_loans': total_users,
+        'users': [
+            {'user_id': user_id, 'name': name, 'active_loans': loans}
+            for user_id, name, loans in users
+        ],
+    })
+
+@admin_bp.route('/reports', methods=['GET'])
+@admin_required
+def reports():
+    """
+    Sales and borrowing report over the raw tables, optionally limited to
+    ?since= / ?until= (YYYY-MM-DD, sale and borrow dates).
+    """
+    try:
+        since = parse_report_date(request.args.get('since'))
+        until = parse_report_date(request.args.get('until'))
+        top = parse_limit(request.args.get('top'), default=10)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        return jsonify({
+            'engine': engine_name(),
+            'sales': sales_report(since, until, top=top),
+            'borrowings': borrowing_report(since, until),
+        })
+    except Exception as e:
+        print(f"Error building reports: {e}")
+        return jsonify({'error': 'Failed to build reports'}), 500
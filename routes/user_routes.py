@@ -1,12 +1,17 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from models import db, User, StoreBook, LibraryBook, CartItem, Sale, Borrowing
-from sqlalchemy import or_
-from datetime import timedelta
-import requests
-import base64
-from datetime import datetime
-import os
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from sqlalchemy import insert
+from models import db, User, StoreBook, LibraryBook, CartItem, Sale, Borrowing, Transaction
+from pagination import keyset_response, parse_limit, parse_offset
+from search import search_catalog
+from inventory import take_library_copy, return_library_copy, reserve_store_stock
+from serializers import serialize_many
+from response_cache import cached_response
+from analytics import record_sales, record_borrow
+from tokens import issue_tokens, revocation_list
+from payments import start_payment, receive_callback, PaymentQueueFull
+from idempotency import idempotent
+from cart import cart_view, mark_cart_changed, parse_cart_operations, apply_cart_operations
 
 
 user_bp = Blueprint('user_routes', __name__)
@@ -37,58 +42,114 @@ def login():
 
     user = User.query.filter_by(email=email).first()
     if user and user.check_password(password):
-        # Create JWT token with the user's id and is_admin claim
-        access_token = create_access_token(identity=user.id, expires_delta=timedelta(hours=1), additional_claims={'is_admin': user.is_admin})
-        return jsonify({'message': 'Login successful', 'access_token': access_token, 'user': user.to_dict()})
+        # Move the hash to the configured cost while we have the password
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+        # Short lived access token plus a refresh token for /user/refresh
+        access_token, refresh_token = issue_tokens(user)
+        return jsonify({
+            'message': 'Login successful',
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+            'user': user.to_dict(),
+        })
     return jsonify({'error': 'Invalid credentials'}), 401
 
 
+@user_bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    """
+    Trade a refresh token for a new access + refresh token pair. The old
+    refresh token is revoked, so each one works exactly once.
+    """
+    user = User.query.get(get_jwt_identity())
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
+
+    if not revocation_list.revoke(get_jwt()):
+        return jsonify({'error': 'Refresh token already used'}), 401
+
+    access_token, refresh_token = issue_tokens(user)
+    return jsonify({'access_token': access_token, 'refresh_token': refresh_token})
+
+
+@user_bp.route('/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def logout():
+    """
+    Revoke the token sent with the request, call it with the access token
+    and with the refresh token to end the session.
+    """
+    revocation_list.revoke(get_jwt())
+    return jsonify({'message': 'Token revoked'}), 200
+
+
 
 @user_bp.route('/store_books', methods=['GET'])
+@cached_response
 def view_store_books():
-    """Fetch all store books without requiring authentication."""
-    books = StoreBook.query.all()
-    return jsonify([book.to_dict() for book in books])
+    """
+    Fetch a page of store books without requiring authentication.
+    Supports ?limit=, ?cursor=<last seen id> and ?fields=title,price,...
+    Every book as a plain list unless ?limit= is given, see keyset_response.
+    """
+    try:
+        return keyset_response(StoreBook, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 
 @user_bp.route('/library_books', methods=['GET'])
 # @jwt_required()
+@cached_response
 def view_library_books():
-    books = LibraryBook.query.all()
-    return jsonify([book.to_dict() for book in books])
+    try:
+        return keyset_response(LibraryBook, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @user_bp.route('/search_books', methods=['GET'])
 @jwt_required()
 def search_books():
+    """
+    Ranked prefix search over title, author, genre and isbn of both catalogs.
+    Supports ?limit= and ?offset= per catalog.
+    """
     query = request.args.get('query', '')
-    store_books = StoreBook.query.filter(
-        or_(StoreBook.title.ilike(f'%{query}%'), StoreBook.genre.ilike(f'%{query}%'))
-    ).all()
-    library_books = LibraryBook.query.filter(
-        or_(LibraryBook.title.ilike(f'%{query}%'), LibraryBook.genre.ilike(f'%{query}%'))
-    ).all()
-    return jsonify({'store_books': [book.to_dict() for book in store_books], 'library_books': [book.to_dict() for book in library_books]})
+    try:
+        limit = parse_limit(request.args.get('limit'), default=20)
+        offset = parse_offset(request.args.get('offset'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    store_books = search_catalog('store', query, limit, offset)
+    library_books = search_catalog('library', query, limit, offset)
+    return jsonify({'store_books': serialize_many(store_books), 'library_books': serialize_many(library_books)})
 
 
 @user_bp.route('/borrow_book', methods=['POST'])
 @jwt_required()
+@idempotent
 def borrow_book():
     user_id = get_jwt_identity()
     data = request.get_json()
     book_id = data.get('book_id')
 
-    book = LibraryBook.query.get(book_id)
-    if book and book.available_copies > 0:
-        borrowing = Borrowing(user_id=user_id, book_id=book.id)
-        book.available_copies -= 1
+    if book_id and take_library_copy(book_id):
+        borrowing = Borrowing(user_id=user_id, book_id=book_id)
         db.session.add(borrowing)
+        record_borrow(user_id, book_id)
         db.session.commit()
         return jsonify(borrowing.to_dict()), 201
+    db.session.rollback()
     return jsonify({'error': 'Book not available for borrowing'}), 400
 
 
 @user_bp.route('/add_to_cart', methods=['POST'])
 @jwt_required()
+@idempotent
 def add_to_cart():
     user_id = get_jwt_identity()
     data = request.get_json()
@@ -106,6 +167,7 @@ def add_to_cart():
         cart_item = CartItem(user_id=user_id, book_id=book.id, quantity=quantity)
         db.session.add(cart_item)
 
+    mark_cart_changed(user_id)
     db.session.commit()
 
     result = {"message": "Item added to cart successfully"}
@@ -125,59 +187,113 @@ def remove_from_cart():
         return jsonify({'error': 'Cart item not found'}), 404
 
     db.session.delete(cart_item)
+    mark_cart_changed(user_id)
     db.session.commit()
     return jsonify({'message': 'Book removed from cart successfully'}), 200
 
 
 
 
+@user_bp.route('/cart', methods=['PATCH'])
+@jwt_required()
+@idempotent
+def update_cart():
+    """
+    Apply a list of cart operations in one transaction, e.g.
+    {"operations": [{"op": "add", "book_id": 1, "quantity": 2},
+                    {"op": "set", "book_id": 2, "quantity": 5},
+                    {"op": "remove", "book_id": 3}]}
+    Either all of them are applied or none.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True)
+    try:
+        operations = parse_cart_operations(data.get('operations') if isinstance(data, dict) else None)
+        quantities = apply_cart_operations(user_id, operations)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+    items = [{'book_id': book_id, 'quantity': quantity} for book_id, quantity in quantities.items()]
+    return jsonify({'message': 'Cart updated successfully', 'items': items}), 200
+
+
 @user_bp.route('/cart', methods=['GET'])
 @jwt_required()
 def view_cart():
-    user_id = get_jwt_identity()
-    cart_items = CartItem.query.filter_by(user_id=user_id).all()
-    return jsonify([cart_item.to_dict() for cart_item in cart_items])
+    """The cart with line totals, total_price and in_stock flags, priced in one query."""
+    return jsonify(cart_view(get_jwt_identity()))
 
 
 @user_bp.route('/checkout', methods=['POST'])
 @jwt_required()
+@idempotent
 def checkout():
+    """
+    Turn the whole cart into one pending Sale per line in a single transaction:
+    price it with one join, reserve stock with one conditional UPDATE,
+    bulk insert the sales and clear the cart with one DELETE.
+    """
     user_id = get_jwt_identity()
-    cart_items = CartItem.query.filter_by(user_id=user_id).all()
-    if not cart_items:
+    lines = (
+        db.session.query(CartItem.id, CartItem.book_id, CartItem.quantity, StoreBook.price)
+        .join(StoreBook, CartItem.book_id == StoreBook.id)
+        .filter(CartItem.user_id == user_id)
+        .all()
+    )
+    if not lines:
         return jsonify({'error': 'Your cart is empty'}), 400
 
-    total_price = sum(item.book.price * item.quantity for item in cart_items)
-    sale = Sale(user_id=user_id, book_id=cart_items[0].book_id, quantity=cart_items[0].quantity, total_price=total_price, status='Pending')
-    db.session.add(sale)
-    db.session.commit()
-    for item in cart_items:
-        db.session.delete(item)
-    db.session.commit()
+    quantities = {}
+    for line in lines:
+        quantities[line.book_id] = quantities.get(line.book_id, 0) + line.quantity
+
+    try:
+        if not reserve_store_stock(quantities):
+            db.session.rollback()
+            return jsonify({'error': 'Not enough stock for some books in your cart'}), 409
+
+        sales = db.session.scalars(insert(Sale).returning(Sale), [
+            {'user_id': user_id, 'book_id': line.book_id, 'quantity': line.quantity,
+             'total_price': line.price * line.quantity, 'status': 'Pending'}
+            for line in lines
+        ]).all()
+        record_sales(sales)
+        # Only the rows that were priced, items added meanwhile stay in the cart
+        CartItem.query.filter(CartItem.id.in_([line.id for line in lines])).delete(synchronize_session=False)
+        mark_cart_changed(user_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error during checkout: {e}")
+        return jsonify({'error': 'Checkout failed'}), 500
 
-    return jsonify(sale.to_dict()), 201
+    total_price = sum(line.price * line.quantity for line in lines)
+    return jsonify({'total_price': total_price, 'sales': serialize_many(sales)}), 201
 
 
 
 
 @user_bp.route('/add_to_borrowings', methods=['POST'])
 @jwt_required()
+@idempotent
 def add_to_borrowings():
     user_id = get_jwt_identity()
     data = request.get_json()
     book_id = data.get('book_id')
 
-    book = LibraryBook.query.get(book_id)
-    if not book or book.available_copies <= 0:
-        return jsonify({'error': 'Book not available for borrowing'}), 400
-
-    borrowing = Borrowing.query.filter_by(user_id=user_id, book_id=book.id, status='Pending').first()
+    borrowing = Borrowing.query.filter_by(user_id=user_id, book_id=book_id, status='Pending').first()
     if borrowing:
         return jsonify({'error': 'Book already in borrowings'}), 400
 
-    new_borrowing = Borrowing(user_id=user_id, book_id=book.id)
-    book.available_copies -= 1
+    if not book_id or not take_library_copy(book_id):
+        db.session.rollback()
+        return jsonify({'error': 'Book not available for borrowing'}), 400
+
+    new_borrowing = Borrowing(user_id=user_id, book_id=book_id)
     db.session.add(new_borrowing)
+    record_borrow(user_id, book_id)
     db.session.commit()
 
     return jsonify(new_borrowing.to_dict()), 201
@@ -194,9 +310,13 @@ def remove_from_borrowings():
     if not borrowing:
         return jsonify({'error': 'Borrowing record not found'}), 404
 
-    book = LibraryBook.query.get(book_id)
-    book.available_copies += 1
-    db.session.delete(borrowing)
+    # Only the request that actually deletes the record gives the copy back
+    deleted = Borrowing.query.filter_by(id=borrowing.id, status='Pending').delete(synchronize_session=False)
+    if not deleted:
+        db.session.rollback()
+        return jsonify({'error': 'Borrowing record not found'}), 404
+    return_library_copy(book_id)
+    record_borrow(user_id, book_id, count=-1)
     db.session.commit()
 
     return jsonify({'message': 'Book removed from borrowings successfully'}), 200
@@ -258,7 +378,7 @@ def fetch_all_borrowings():
 @jwt_required()
 def initiate_return():
     """
-    Initiate a return request for an approved borrowing.
+    Initiate a return request for an approved (or overdue) borrowing.
     """
     user_id = get_jwt_identity()
     borrowing_id = request.json.get('borrowing_id')
@@ -268,7 +388,7 @@ def initiate_return():
     if not borrowing:
         return jsonify({'error': 'Borrowing not found.'}), 404
 
-    if borrowing.status != 'Approved':
+    if borrowing.status not in ('Approved', 'Overdue'):
         return jsonify({'error': 'Return can only be initiated for approved borrowings.'}), 400
 
     try:
@@ -319,73 +439,41 @@ def get_sales_history():
         return jsonify({'error': 'Failed to fetch sales history'}), 500
 
 
+def _payer_scope():
+    # buyGoods has no login, its Idempotency-Keys belong to the paying phone
+    data = request.get_json(silent=True)
+    phone_number = data.get("phone_number") if isinstance(data, dict) else None
+    return f"phone:{phone_number}" if phone_number else f"client:{request.remote_addr}"
+
+
 @user_bp.route("/buyGoods", methods=["POST"])
+@idempotent(scope=_payer_scope)
 def buy_goods():
     data = request.get_json()
     amount = data.get("amount")
     phone_number = data.get("phone_number")
-    transaction_id = str(datetime.timestamp(datetime.now()))  # Unique transaction ID
-
-    # Save transaction in database
-    new_transaction = new_transaction(id=transaction_id, amount=amount, phone_number=phone_number)
-    db.session.add(new_transaction)
-    db.session.commit()
-
-    # Generate M-Pesa payload
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    password_str = f"{os.getenv('SHORTCODE')}{os.getenv('PASSKEY')}{timestamp}"
-    password = base64.b64encode(password_str.encode()).decode("utf-8")
-    access_token = get_access_token()
-
-    headers = {"Authorization": f"Bearer {access_token}"}
-    endpoint = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-    payload = {
-        "BusinessShortCode": os.getenv("SHORTCODE"),
-        "Password": password,
-        "Timestamp": timestamp,
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": amount,
-        "PartyA": phone_number,
-        "PartyB": os.getenv("SHORTCODE"),
-        "PhoneNumber": phone_number,
-        "CallBackURL": os.getenv("BASE_URL") + "/user/callback",
-        "AccountReference": "Mpesa Integration Api",
-        "TransactionDesc": "Test Payment",
-    }
-
-    response = requests.post(endpoint, json=payload, headers=headers)
-    response_data = response.json()
-    return jsonify(response_data)
+    if not amount or not phone_number:
+        return jsonify({"error": "amount and phone_number are required"}), 400
 
+    # The STK push is sent by a payment worker, poll /transactions/<id> for the outcome
+    try:
+        transaction = start_payment(amount, phone_number)
+    except PaymentQueueFull:
+        return jsonify({"error": "Too many payments in progress, try again shortly"}), 503
+    return jsonify({"transaction_id": transaction.id, "status": transaction.status}), 202
 
 
+@user_bp.route("/transactions/<transaction_id>", methods=["GET"])
+def get_transaction(transaction_id):
+    transaction = db.session.get(Transaction, transaction_id)
+    if not transaction:
+        return jsonify({"error": "Transaction not found"}), 404
+    return jsonify(transaction.to_dict(only=("id", "amount", "status", "result_code", "result_desc", "created_at", "updated_at"))), 200
 
 
 @user_bp.route("/callback", methods=["POST"])
 def mpesa_callback():
-    data = request.get_json()
-    callback = data.get("Body", {}).get("stkCallback", {})
-    result_code = callback.get("ResultCode")
-    transaction_id = callback.get("CheckoutRequestID")
-
-    if not transaction_id:
-        return jsonify({"ResultCode": 1, "ResultDesc": "Invalid transaction ID"})
-
-    # Update transaction status in database
-    transaction = transaction.query.filter_by(id=transaction_id).first()
-    if transaction:
-        transaction.status = "Completed" if result_code == 0 else "Canceled"
-        db.session.commit()
-
+    # Only stored here, the callback processor applies it to the transaction
+    if not receive_callback(request.get_json(silent=True)):
+        return jsonify({"ResultCode": 1, "ResultDesc": "Invalid callback"})
     return jsonify({"ResultCode": 0, "ResultDesc": "Callback received"})
-
-# Helper function for getting access token
-def get_access_token():
-    endpoint = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-    response = requests.get(
-        endpoint,
-        auth=requests.auth.HTTPBasicAuth(
-            os.getenv("CONSUMER_KEY"), os.getenv("CONSUMER_SECRET")
-        ),
-    )
-    return response.json().get("access_token")
\ No newline at end of file
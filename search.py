@@ -0,0 +1,157 @@
+import re
+from sqlalchemy import event, or_, text
+from models import db, StoreBook, LibraryBook
+
+# Catalog search.
+# SQLite: one FTS5 table (book_search) covering both catalogs, kept in sync
+# by triggers, so every insert/update/delete of a book (admin routes, seeding,
+# bulk imports) is indexed without extra code in the handlers.
+# PostgreSQL: GIN indexes on a weighted tsvector of each books table.
+# Anything else falls back to ILIKE.
+
+SEARCH_KINDS = {
+    'store': StoreBook,
+    'library': LibraryBook,
+}
+
+SQLITE_SEARCH_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_search USING fts5("
+    "title, author, genre, isbn, kind UNINDEXED, book_id UNINDEXED, "
+    "tokenize='unicode61', prefix='2 3')"
+)
+
+SQLITE_TRIGGER_TEMPLATES = (
+    "CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO book_search (title, author, genre, isbn, kind, book_id) "
+    "VALUES (new.title, new.author, new.genre, new.isbn, '{kind}', new.id); END",
+
+    "CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN "
+    "DELETE FROM book_search WHERE kind = '{kind}' AND book_id = old.id; END",
+
+    "CREATE TRIGGER IF NOT EXISTS {table}_search_au "
+    "AFTER UPDATE OF title, author, genre, isbn ON {table} BEGIN "
+    "DELETE FROM book_search WHERE kind = '{kind}' AND book_id = old.id; "
+    "INSERT INTO book_search (title, author, genre, isbn, kind, book_id) "
+    "VALUES (new.title, new.author, new.genre, new.isbn, '{kind}', new.id); END",
+)
+
+# Title matches rank above author, genre and isbn matches
+SQLITE_RANK = 'bm25(book_search, 10.0, 5.0, 2.0, 1.0)'
+
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(genre, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(isbn, '')), 'D')"
+)
+
+
+def _tokens(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def create_search_index(connection):
+    """Create the search index for the connection's backend and fill it."""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        connection.execute(text(SQLITE_SEARCH_TABLE))
+        for kind, model in SEARCH_KINDS.items():
+            for template in SQLITE_TRIGGER_TEMPLATES:
+                connection.execute(text(template.format(table=model.__tablename__, kind=kind)))
+        rebuild_search_index(connection)
+    elif dialect == 'postgresql':
+        for model in SEARCH_KINDS.values():
+            table = model.__tablename__
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} USING gin (({POSTGRES_DOCUMENT}))"
+            ))
+
+
+def drop_search_index(connection):
+    """Drop the SQLite search table (the triggers go with their books tables)."""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("DROP TABLE IF EXISTS book_search"))
+
+
+# The index isn't part of the models' metadata, so build it whenever the
+# tables are created from the models (db.create_all(), tests) and drop it with
+# them. Migrated databases get it from the 8033f479c33a migration instead.
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    create_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    drop_search_index(connection)
+
+
+def rebuild_search_index(connection):
+    """Re-index every book, e.g. after rows were written with triggers disabled."""
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.execute(text("DELETE FROM book_search"))
+    for kind, model in SEARCH_KINDS.items():
+        connection.execute(text(
+            "INSERT INTO book_search (title, author, genre, isbn, kind, book_id) "
+            f"SELECT title, author, genre, isbn, '{kind}', id FROM {model.__tablename__}"
+        ))
+
+
+def _sqlite_ids(kind, tokens, limit, offset):
+    # Every token is quoted (no FTS syntax from users) and prefix matched
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    rows = db.session.execute(text(
+        "SELECT book_id FROM book_search "
+        "WHERE book_search MATCH :match AND kind = :kind "
+        f"ORDER BY {SQLITE_RANK} LIMIT :limit OFFSET :offset"
+    ), {'match': match, 'kind': kind, 'limit': limit, 'offset': offset})
+    return [row[0] for row in rows]
+
+
+def _postgres_ids(kind, tokens, limit, offset):
+    table = SEARCH_KINDS[kind].__tablename__
+    tsquery = ' & '.join(f'{token}:*' for token in tokens)
+    rows = db.session.execute(text(
+        f"SELECT id FROM {table} "
+        f"WHERE ({POSTGRES_DOCUMENT}) @@ to_tsquery('simple', :tsquery) "
+        f"ORDER BY ts_rank(({POSTGRES_DOCUMENT}), to_tsquery('simple', :tsquery)) DESC, id "
+        "LIMIT :limit OFFSET :offset"
+    ), {'tsquery': tsquery, 'limit': limit, 'offset': offset})
+    return [row[0] for row in rows]
+
+
+def _ilike_ids(kind, tokens, limit, offset):
+    model = SEARCH_KINDS[kind]
+    query = db.session.query(model.id)
+    for token in tokens:
+        pattern = f'%{token}%'
+        query = query.filter(or_(
+            model.title.ilike(pattern), model.author.ilike(pattern),
+            model.genre.ilike(pattern), model.isbn.ilike(pattern),
+        ))
+    return [row[0] for row in query.order_by(model.id).limit(limit).offset(offset)]
+
+
+def search_catalog(kind, query, limit, offset=0):
+    """
+    Return the `kind` ('store' or 'library') books matching every word of
+    `query` as a prefix, best match first.
+    """
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        ids = _sqlite_ids(kind, tokens, limit, offset)
+    elif dialect == 'postgresql':
+        ids = _postgres_ids(kind, tokens, limit, offset)
+    else:
+        ids = _ilike_ids(kind, tokens, limit, offset)
+    if not ids:
+        return []
+
+    model = SEARCH_KINDS[kind]
+    books = {book.id: book for book in model.query.filter(model.id.in_(ids))}
+    return [books[book_id] for book_id in ids if book_id in books]
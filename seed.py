@@ -1,8 +1,11 @@
 from app import create_app
 from config import db
-from models import User, StoreBook, LibraryBook, CartItem, Borrowing
-from datetime import datetime, timedelta
+from models import User, StoreBook, LibraryBook
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import insert
 import cloudinary.uploader
+import hashlib
+import json
 import os
 
 import cloudinary
@@ -18,13 +21,42 @@ app = create_app()  # Initialize the app
 
 # Create tables
 with app.app_context():
-    db.create_all()
+    db.create_all()  # Also builds the search index
+
+# Uploads run in parallel and every uploaded image is recorded in a local
+# manifest keyed by the sha256 of its content, so reruns (or runs resumed after
+# a failure) never upload an unchanged image twice. Rows are inserted in chunks
+# and books / users that already exist are skipped, so seeding can be rerun.
+UPLOAD_WORKERS = int(os.getenv('SEED_UPLOAD_WORKERS', 8))
+CHUNK_SIZE = int(os.getenv('SEED_CHUNK_SIZE', 1000))
+MANIFEST_PATH = os.getenv('SEED_MANIFEST', os.path.join(app.instance_path, 'seed_manifest.json'))
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    # Write to a temp file first so an interrupted run never leaves half a manifest
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def file_hash(image_path):
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
 
 # Helper function to upload image to Cloudinary
 def upload_to_cloudinary(image_path):
-    if not os.path.exists(image_path):
-        print(f"Image file does not exist: {image_path}")
-        return None
     try:
         response = cloudinary.uploader.upload(image_path)
         return response.get('secure_url')  # Return the secure URL
@@ -32,13 +64,68 @@ def upload_to_cloudinary(image_path):
         print(f"Error uploading {image_path} to Cloudinary: {e}")
         return None
 
+
+def upload_images(image_paths):
+    """
+    Return {image_path: url} for every image that is uploaded, uploading only
+    content the manifest hasn't seen yet.
+    """
+    manifest = load_manifest()
+    hashes = {}
+    for image_path in set(image_paths):
+        if not os.path.exists(image_path):
+            print(f"Image file does not exist: {image_path}")
+            continue
+        hashes[image_path] = file_hash(image_path)
+
+    # Identical files are uploaded once, whatever their name
+    to_upload = {}
+    for image_path, content_hash in hashes.items():
+        if content_hash not in manifest:
+            to_upload.setdefault(content_hash, image_path)
+
+    if to_upload:
+        print(f"Uploading {len(to_upload)} images ({len(hashes) - len(to_upload)} already uploaded)")
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+            futures = {pool.submit(upload_to_cloudinary, path): content_hash for content_hash, path in to_upload.items()}
+            for future, content_hash in futures.items():
+                url = future.result()
+                if url:
+                    manifest[content_hash] = url
+                    save_manifest(manifest)
+
+    return {path: manifest[content_hash] for path, content_hash in hashes.items() if content_hash in manifest}
+
+
+def bulk_insert(model, rows, key):
+    """Insert `rows` in chunks, skipping those whose `key` is already stored."""
+    column = getattr(model, key)
+    inserted = 0
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        existing = {value for (value,) in db.session.query(column).filter(column.in_([row[key] for row in chunk]))}
+        new_rows = [row for row in chunk if row[key] not in existing]
+        if new_rows:
+            db.session.execute(insert(model), new_rows)
+            db.session.commit()
+            inserted += len(new_rows)
+    return inserted
+
+
+def with_images(books_data, image_urls):
+    """Books whose cover was uploaded, the rest is picked up by the next run."""
+    books = []
+    for book_data in books_data:
+        book = dict(book_data)
+        image_url = image_urls.get(book.pop('image_path'))
+        if image_url:
+            books.append(dict(book, image_url=image_url))
+    return books
+
+
 # Run the seeding process
 def seed_data():
     try:
-        # Delete existing data before seeding
-        db.session.query(User).delete()
-        db.session.commit()
-
         # Add sample books for the store
         store_books_data = [
             {'title': 'The Great Gatsby', 'author': 'F. Scott Fitzgerald', 'genre': 'Fiction', 'isbn': '123123123', 'price': 15.99, 'stock': 20, 'image_path': './images/gatsby.jpg'},
@@ -49,12 +136,6 @@ def seed_data():
             {'title': 'Educated', 'author': 'Tara Westover', 'genre': 'Biography', 'isbn': '7777777778', 'price': 14.99, 'stock': 10, 'image_path': './images/educated.jpg'},
         ]
 
-        store_books = []
-        for book_data in store_books_data:
-            image_url = upload_to_cloudinary(book_data.pop('image_path'))
-            if image_url:
-                store_books.append(StoreBook(image_url=image_url, **book_data))
-
         # Add sample library books
         library_books_data = [
             {'title': 'A Brief History of Time', 'author': 'Stephen Hawking', 'genre': 'Science', 'isbn': '5566778123', 'available_copies': 2, 'total_copies': 4, 'image_path': './images/brief_history.jpg'},
@@ -64,11 +145,9 @@ def seed_data():
             {'title': 'The Hobbit', 'author': 'J.R.R. Tolkien', 'genre': 'Fantasy', 'isbn': '2121212121', 'available_copies': 5, 'total_copies': 8, 'image_path': './images/hobbit.jpg'},
         ]
 
-        library_books = []
-        for book_data in library_books_data:
-            image_url = upload_to_cloudinary(book_data.pop('image_path'))
-            if image_url:
-                library_books.append(LibraryBook(image_url=image_url, **book_data))
+        image_urls = upload_images([book['image_path'] for book in store_books_data + library_books_data])
+        store_books = with_images(store_books_data, image_urls)
+        library_books = with_images(library_books_data, image_urls)
 
         # Add users with unique emails
         users = [
@@ -82,9 +161,14 @@ def seed_data():
         for user in users:
             user.set_password('pass123')
 
-        # Commit base records
-        db.session.add_all(store_books + library_books + users)
-        db.session.commit()
+        user_rows = [
+            {'name': user.name, 'email': user.email, 'is_admin': user.is_admin, 'password_hash': user.password_hash}
+            for user in users
+        ]
+
+        print(f"Store books added: {bulk_insert(StoreBook, store_books, 'isbn')}")
+        print(f"Library books added: {bulk_insert(LibraryBook, library_books, 'isbn')}")
+        print(f"Users added: {bulk_insert(User, user_rows, 'email')}")
 
         print("Database seeded successfully!")
     except Exception as e:
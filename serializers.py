@@ -0,0 +1,160 @@
+import json
+from flask import Response
+from sqlalchemy import inspect, Date, DateTime, Time
+from sqlalchemy.orm import Session
+from models import db, User, StoreBook, LibraryBook, CartItem, Sale, Borrowing
+
+# Same formats SerializerMixin uses, so responses keep their shape
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+TIME_FORMAT = '%H:%M'
+
+# Streamed listings fetch this many rows per round trip and flush roughly
+# this many bytes at a time
+STREAM_BATCH_SIZE = 1000
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _formatter(fmt):
+    def format_value(value):
+        return value.strftime(fmt)
+    return format_value
+
+
+def _converter_for(column_type):
+    # DateTime has to be checked before Date
+    if isinstance(column_type, DateTime):
+        return _formatter(DATETIME_FORMAT)
+    if isinstance(column_type, Date):
+        return _formatter(DATE_FORMAT)
+    if isinstance(column_type, Time):
+        return _formatter(TIME_FORMAT)
+    return None
+
+
+class ModelPlan:
+    """
+    Columns and relationships of one model, resolved once at import time.
+    Top level `-field` entries of the model's serialize_rules are honoured,
+    so e.g. User.password_hash never leaves the server.
+    """
+
+    def __init__(self, model):
+        mapper = inspect(model)
+        excluded = {
+            rule[1:] for rule in getattr(model, 'serialize_rules', ())
+            if rule.startswith('-') and '.' not in rule
+        }
+
+        self.model = model
+        self.columns = tuple(
+            (attr.key, _converter_for(attr.columns[0].type))
+            for attr in mapper.column_attrs
+            if attr.key not in excluded
+        )
+        self.relationships = tuple(
+            (rel.key, rel.uselist)
+            for rel in mapper.relationships
+            if rel.key not in excluded
+        )
+
+
+PLANS = {model: ModelPlan(model) for model in (User, StoreBook, LibraryBook, CartItem, Sale, Borrowing)}
+
+
+def serialize(obj, depth=0, include=None):
+    """
+    Turn a model instance into a plain dict.
+
+    Only columns are read unless `depth` is above 0, in which case each
+    relationship (or only those named in `include`) is serialized with
+    depth - 1. Callers should eager load whatever they ask to be nested.
+    """
+    if obj is None:
+        return None
+
+    plan = PLANS[type(obj)]
+    data = {}
+    for key, convert in plan.columns:
+        value = getattr(obj, key)
+        if convert is not None and value is not None:
+            value = convert(value)
+        data[key] = value
+
+    if depth > 0:
+        for key, uselist in plan.relationships:
+            if include is not None and key not in include:
+                continue
+            value = getattr(obj, key)
+            if uselist:
+                data[key] = [serialize(item, depth - 1) for item in value]
+            else:
+                data[key] = serialize(value, depth - 1)
+    return data
+
+
+def serialize_many(objs, depth=0, include=None):
+    return [serialize(obj, depth, include) for obj in objs]
+
+
+def to_json(data):
+    """Encode already serialized data straight to compact JSON bytes."""
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, status=200):
+    return Response(to_json(data), status=status, mimetype='application/json')
+
+
+def iter_json_array(query, depth=0, include=None, batch_size=STREAM_BATCH_SIZE, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield the rows of `query` as one JSON array, encoded row by row and
+    flushed in chunks of about `chunk_size` bytes. Rows are fetched with
+    yield_per, so only one batch of instances is alive at a time.
+    """
+    buffer = bytearray(b'[')
+    separator = b''
+    for obj in query.yield_per(batch_size):
+        buffer += separator
+        buffer += to_json(serialize(obj, depth, include))
+        separator = b','
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b']'
+    yield bytes(buffer)
+
+
+def streaming_json_response(query, depth=0, include=None):
+    """
+    Stream `query` as a JSON array. The first chunk is produced before the
+    response is returned, so a failing query still ends up as an error
+    response instead of a cut off body.
+    """
+    # The rest of the body is sent after the request context is gone, so the
+    # rows are read on a session of their own instead of through
+    # stream_with_context, which breaks when a body isn't read to the end
+    session = Session(db.engine)
+    chunks = iter_json_array(query.with_session(session), depth, include)
+    try:
+        first = next(chunks)
+    except Exception:
+        session.close()
+        raise
+
+    def body():
+        try:
+            yield first
+            yield from chunks
+        finally:
+            session.close()
+
+    def close():
+        chunks.close()
+        session.close()
+
+    response = Response(body(), mimetype='application/json')
+    # The session goes once the body is read, or when the server closes a
+    # response that wasn't read to the end
+    response.call_on_close(close)
+    return response
@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+
+# Settings are read from the environment when config is imported, so they
+# have to be in place before the app is
+_tmp = tempfile.mkdtemp(prefix='bookstore-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ['QUERY_BUDGET_ENFORCE'] = 'true'
+os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['IMAGE_UPLOADER'] = 'stub'
+os.environ['IMAGE_UPLOAD_DIR'] = os.path.join(_tmp, 'uploads')
+os.environ['PAYMENT_CALLBACK_INTERVAL'] = '0'
+os.environ['OVERDUE_SWEEP_INTERVAL'] = '0'
+os.environ['MPESA_API_URL'] = 'http://127.0.0.1:9'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from app import create_app
+from cache import cache
+from models import db, User, StoreBook, LibraryBook
+from tokens import issue_tokens
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    """A fresh schema and empty caches for every test."""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        cache.local.clear()
+        cache._counters.clear()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_user(name, email, is_admin=False):
+    user = User(name=name, email=email, is_admin=is_admin)
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def auth_headers(user):
+    access_token, _ = issue_tokens(user)
+    return {'Authorization': f'Bearer {access_token}'}
+
+
+@pytest.fixture
+def admin():
+    return make_user('Admin', 'admin@example.com', is_admin=True)
+
+
+@pytest.fixture
+def user():
+    return make_user('Alice', 'alice@example.com')
+
+
+@pytest.fixture
+def admin_headers(admin):
+    return auth_headers(admin)
+
+
+@pytest.fixture
+def user_headers(user):
+    return auth_headers(user)
+
+
+@pytest.fixture
+def books():
+    """Three store books (stock 5) and three library books (2 copies)."""
+    store = [
+        StoreBook(title=f'Book {i}', author=f'Author {i}', genre='Fiction', isbn=f'isbn-{i}', price=10 + i, stock=5)
+        for i in range(3)
+    ]
+    library = [
+        LibraryBook(title=f'Library {i}', author=f'Author {i}', genre='Science', isbn=f'lib-{i}',
+                    available_copies=2, total_copies=2)
+        for i in range(3)
+    ]
+    db.session.add_all(store + library)
+    db.session.commit()
+    return store, library
@@ -0,0 +1,52 @@
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from auth import ADMIN_STATUS_NAMESPACE
+from cache import cache
+from models import db
+
+
+def test_admin_status_is_cached(client, admin, admin_headers):
+    assert client.get('/admin/overdue', headers=admin_headers).status_code == 200
+    assert cache.get(ADMIN_STATUS_NAMESPACE, admin.id) is True
+
+
+def test_demoting_an_admin_takes_effect_at_once(client, admin, admin_headers):
+    assert client.get('/admin/overdue', headers=admin_headers).status_code == 200
+
+    admin.is_admin = False
+    db.session.commit()
+
+    assert cache.get(ADMIN_STATUS_NAMESPACE, admin.id) is None
+    # The token still carries is_admin: True, the role is checked again
+    assert client.get('/admin/overdue', headers=admin_headers).status_code == 403
+
+
+def test_status_cached_before_the_demotion_commits_is_dropped(admin):
+    admin.is_admin = False
+    db.session.flush()
+    # Another request reading the committed row caches the old role meanwhile
+    cache.set(ADMIN_STATUS_NAMESPACE, admin.id, True)
+
+    db.session.commit()
+
+    assert cache.get(ADMIN_STATUS_NAMESPACE, admin.id) is None
+
+
+def test_non_admin_claim_is_rejected_without_a_lookup(client, admin):
+    # Even for a user who is an admin by now, the claim decides
+    token = create_access_token(identity=str(admin.id), additional_claims={'is_admin': False})
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get('/admin/overdue', headers={'Authorization': f'Bearer {token}'})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert response.status_code == 403
+    assert not [statement for statement in statements if 'users' in statement]
+    assert cache.get(ADMIN_STATUS_NAMESPACE, admin.id) is None
+
+
+def test_non_admins_are_turned_away(client, user_headers):
+    assert client.get('/admin/overdue', headers=user_headers).status_code == 403
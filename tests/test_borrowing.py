@@ -0,0 +1,105 @@
+import threading
+from models import db, Borrowing, LibraryBook, Sale, DailyBookRevenue, UserActiveLoans
+from analytics import is_active_loan
+from conftest import make_user, auth_headers
+
+
+def _race(app, requests):
+    """Send `requests` (method, url, headers, json) at the same time, return the status codes."""
+    barrier = threading.Barrier(len(requests))
+    statuses = [None] * len(requests)
+
+    def send(index, method, url, headers, body):
+        client = app.test_client()
+        barrier.wait()
+        statuses[index] = client.open(url, method=method, headers=headers, json=body).status_code
+
+    threads = [threading.Thread(target=send, args=(index, *request)) for index, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def test_last_copy_is_borrowed_once(app, books):
+    book = books[1][0]
+    book.available_copies = 1
+    db.session.commit()
+    users = [make_user(f'Reader {i}', f'reader{i}@example.com') for i in range(4)]
+
+    statuses = _race(app, [
+        ('POST', '/user/add_to_borrowings', auth_headers(user), {'book_id': book.id}) for user in users
+    ])
+
+    assert sorted(statuses) == [201, 400, 400, 400]
+    db.session.expire_all()
+    assert db.session.get(LibraryBook, book.id).available_copies == 0
+    assert Borrowing.query.count() == 1
+
+
+def test_borrowing_an_unavailable_book_fails(client, user_headers, books):
+    book = books[1][0]
+    book.available_copies = 0
+    db.session.commit()
+
+    response = client.post('/user/add_to_borrowings', headers=user_headers, json={'book_id': book.id})
+    assert response.status_code == 400
+    assert Borrowing.query.count() == 0
+
+
+def test_removing_a_borrowing_returns_the_copy(client, user_headers, books):
+    book = books[1][0]
+    assert client.post('/user/add_to_borrowings', headers=user_headers, json={'book_id': book.id}).status_code == 201
+    response = client.delete('/user/remove_from_borrowings', headers=user_headers, json={'book_id': book.id})
+
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert db.session.get(LibraryBook, book.id).available_copies == 2
+
+
+def test_concurrent_lending_decisions_count_the_loan_once(app, client, user, user_headers, admin_headers, books):
+    response = client.post('/user/add_to_borrowings', headers=user_headers, json={'book_id': books[1][0].id})
+    borrowing = db.session.get(Borrowing, response.get_json()['id'])
+
+    statuses = _race(app, [
+        ('POST', f'/admin/approve_lending/{borrowing.id}', admin_headers, {'action': action})
+        for action in ('approve', 'reject') * 4
+    ])
+
+    # A request that read a status another one already changed gets 409
+    assert set(statuses) <= {200, 409}
+    db.session.expire_all()
+    final = db.session.get(Borrowing, borrowing.id).status
+    loans = db.session.get(UserActiveLoans, user.id)
+    assert loans.active_loans == int(is_active_loan(final))
+
+
+def test_concurrent_order_approvals_count_the_revenue_once(app, user, admin_headers, books):
+    sale = Sale(user_id=user.id, book_id=books[0][0].id, quantity=2, total_price=20, status='Pending')
+    db.session.add(sale)
+    db.session.commit()
+
+    statuses = _race(app, [
+        ('POST', f'/admin/approve_order/{sale.id}', admin_headers, {'action': 'approve'}) for _ in range(8)
+    ])
+
+    assert 200 in statuses and set(statuses) <= {200, 409}
+    revenue = DailyBookRevenue.query.filter_by(book_id=sale.book_id).one()
+    assert (revenue.approved_quantity, revenue.approved_revenue) == (2, 20)
+
+
+def test_deleting_a_library_book_closes_its_open_loans(client, user, user_headers, admin_headers, books):
+    book, other_book = books[1][:2]
+    reader = make_user('Bob', 'bob@example.com')
+    for headers, book_id in ((user_headers, book.id), (auth_headers(reader), book.id), (user_headers, other_book.id)):
+        assert client.post('/user/add_to_borrowings', headers=headers, json={'book_id': book_id}).status_code == 201
+    rejected = Borrowing.query.filter_by(user_id=reader.id).one()
+    assert client.post(f'/admin/approve_lending/{rejected.id}', headers=admin_headers,
+                       json={'action': 'reject'}).status_code == 200
+
+    assert client.delete(f'/admin/library_books/{book.id}', headers=admin_headers).status_code == 200
+
+    db.session.expire_all()
+    assert db.session.get(UserActiveLoans, user.id).active_loans == 1
+    assert db.session.get(UserActiveLoans, reader.id).active_loans == 0
@@ -0,0 +1,150 @@
+import time
+import pytest
+from flask import Flask
+import cache as cache_module
+from cache import Cache, InMemoryRedis, TTLCache, cache
+
+
+class Clock:
+    """Stands in for the cache module's `time`, moved forward by the tests."""
+
+    def __init__(self):
+        self.now = time.monotonic()
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, 'time', clock)
+    return clock
+
+
+def _worker(shared, **config):
+    """A Cache as one worker process would set it up, on `shared` Redis."""
+    app = Flask('worker')
+    app.config.update(CACHE_REDIS_CLIENT=shared, CACHE_LOCAL_TTL=5, **config)
+    worker_cache = Cache()
+    worker_cache.init_app(app)
+    return worker_cache
+
+
+def test_ttl_cache_entries_expire(clock):
+    local = TTLCache(ttl=10)
+    local.set('a', 1)
+    local.set('b', 2, ttl=30)
+
+    clock.now += 10
+    assert local.get('a') == 1
+    clock.now += 1
+    assert local.get('a') is None
+    assert local.get('b') == 2
+    assert len(local) == 1
+    clock.now += 20
+    assert local.get('b', 'gone') == 'gone'
+
+
+def test_ttl_cache_evicts_the_least_recently_used():
+    local = TTLCache(maxsize=2)
+    local.set('a', 1)
+    local.set('b', 2)
+    local.get('a')
+    local.set('c', 3)
+
+    assert (local.get('a'), local.get('b'), local.get('c')) == (1, None, 3)
+
+
+def test_in_memory_redis_expiry_and_incr(clock):
+    shared = InMemoryRedis()
+    shared.set('key', b'value', ex=5)
+    assert shared.incr('count') == 1
+    assert shared.incr('count', 2) == 3
+
+    clock.now += 6
+    assert shared.get('key') is None
+    assert shared.get('count') == b'3'
+    assert shared.delete('count', 'missing') == 1
+
+
+def test_values_are_shared_between_workers(clock):
+    shared = InMemoryRedis()
+    first, second = _worker(shared), _worker(shared)
+
+    first.set('books', 1, {'title': 'Dune'})
+
+    assert second.get('books', 1) == {'title': 'Dune'}
+    assert second.get('books', 2) is None
+
+
+def test_a_delete_reaches_other_workers_within_the_local_ttl(clock):
+    shared = InMemoryRedis()
+    first, second = _worker(shared), _worker(shared)
+    first.set('books', 1, 'old')
+    assert second.get('books', 1) == 'old'
+
+    first.delete('books', 1)
+
+    assert first.get('books', 1) is None
+    # The second worker still has its local copy, for at most CACHE_LOCAL_TTL
+    assert second.get('books', 1) == 'old'
+    clock.now += 6
+    assert second.get('books', 1) is None
+
+
+def test_entries_expire_in_both_tiers(clock):
+    shared = InMemoryRedis()
+    first, second = _worker(shared), _worker(shared)
+    first.set('books', 1, 'value', ttl=60)
+
+    clock.now += 30
+    assert second.get('books', 1) == 'value'
+    clock.now += 31
+    assert first.get('books', 1) is None
+    assert second.get('books', 1) is None
+
+
+def test_counters_are_shared_between_workers(clock):
+    shared = InMemoryRedis()
+    first, second = _worker(shared), _worker(shared)
+
+    assert first.incr('versions', 'catalog') == 1
+    assert second.incr('versions', 'catalog') == 2
+    clock.now += 6
+    assert first.counter('versions', 'catalog') == 2
+
+
+def test_process_local_counters():
+    local_cache = Cache()
+    assert local_cache.counter('versions', 'catalog') == 0
+    local_cache.incr('versions', 'catalog')
+    assert local_cache.counter('versions', 'catalog') == 1
+
+
+def test_hits_and_misses_are_counted_per_namespace():
+    local_cache = Cache()
+    loads = []
+    loader = lambda: loads.append(1) or 'loaded'
+
+    assert local_cache.get_or_set('books', 1, loader) == 'loaded'
+    assert local_cache.get_or_set('books', 1, loader) == 'loaded'
+    local_cache.get('users', 1)
+
+    assert len(loads) == 1
+    assert local_cache.stats() == {'books': {'hits': 1, 'misses': 1}, 'users': {'hits': 0, 'misses': 1}}
+
+
+def test_admin_cache_stats(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(cache, '_stats', {})
+    cache.set('books', 1, 'value')
+    cache.get('books', 1)
+    cache.get('books', 2)
+
+    response = client.get('/admin/cache/stats', headers=admin_headers)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['shared_tier'] is False
+    assert body['local_entries'] >= 1
+    assert body['namespaces']['books'] == {'hits': 1, 'misses': 1}
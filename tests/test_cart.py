@@ -0,0 +1,111 @@
+from sqlalchemy import event
+from models import db, CartItem
+
+
+def patch_cart(client, headers, *operations):
+    return client.patch('/user/cart', headers=headers, json={'operations': list(operations)})
+
+
+def cart_quantities(user):
+    return {item.book_id: item.quantity for item in CartItem.query.filter_by(user_id=user.id)}
+
+
+def test_duplicate_adds_are_merged_into_one_row(client, user, user_headers, books):
+    book = books[0][0]
+
+    response = patch_cart(client, user_headers,
+                          {'op': 'add', 'book_id': book.id, 'quantity': 1},
+                          {'op': 'add', 'book_id': book.id, 'quantity': 2})
+
+    assert response.status_code == 200
+    assert response.get_json()['items'] == [{'book_id': book.id, 'quantity': 3}]
+    assert CartItem.query.count() == 1
+    assert cart_quantities(user) == {book.id: 3}
+
+
+def test_older_duplicate_rows_are_merged(client, user, user_headers, books):
+    book = books[0][0]
+    db.session.add_all([CartItem(user_id=user.id, book_id=book.id, quantity=1) for _ in range(2)])
+    db.session.commit()
+
+    assert patch_cart(client, user_headers, {'op': 'add', 'book_id': book.id, 'quantity': 1}).status_code == 200
+
+    assert CartItem.query.count() == 1
+    assert cart_quantities(user) == {book.id: 3}
+
+
+def test_set_and_remove(client, user, user_headers, books):
+    first, second, third = books[0]
+    patch_cart(client, user_headers,
+               {'op': 'add', 'book_id': first.id, 'quantity': 1},
+               {'op': 'add', 'book_id': second.id, 'quantity': 1})
+
+    response = patch_cart(client, user_headers,
+                          {'op': 'set', 'book_id': first.id, 'quantity': 4},
+                          {'op': 'remove', 'book_id': second.id},
+                          {'op': 'set', 'book_id': third.id, 'quantity': 2})
+
+    assert response.status_code == 200
+    assert cart_quantities(user) == {first.id: 4, third.id: 2}
+
+
+def test_setting_quantity_zero_deletes_the_item(client, user, user_headers, books):
+    book = books[0][0]
+    patch_cart(client, user_headers, {'op': 'add', 'book_id': book.id, 'quantity': 2})
+
+    response = patch_cart(client, user_headers, {'op': 'set', 'book_id': book.id, 'quantity': 0})
+
+    assert response.status_code == 200
+    assert response.get_json()['items'] == [{'book_id': book.id, 'quantity': 0}]
+    assert cart_quantities(user) == {}
+
+
+def test_an_unknown_book_rejects_the_whole_batch(client, user, user_headers, books):
+    book = books[0][0]
+
+    response = patch_cart(client, user_headers,
+                          {'op': 'add', 'book_id': book.id, 'quantity': 1},
+                          {'op': 'add', 'book_id': 9999, 'quantity': 1})
+
+    assert response.status_code == 400
+    assert '9999' in response.get_json()['error']
+    assert cart_quantities(user) == {}
+
+
+def test_bad_operations_are_rejected(client, user_headers, books):
+    book = books[0][0]
+
+    assert patch_cart(client, user_headers).status_code == 400
+    assert patch_cart(client, user_headers, {'op': 'add', 'book_id': book.id, 'quantity': 0}).status_code == 400
+    assert patch_cart(client, user_headers, {'op': 'move', 'book_id': book.id}).status_code == 400
+    assert CartItem.query.count() == 0
+
+
+def test_the_batch_is_one_commit(client, user, user_headers, books):
+    first, second, third = books[0]
+    patch_cart(client, user_headers, {'op': 'add', 'book_id': third.id, 'quantity': 1})
+    commits = []
+    listener = lambda session: commits.append(session)
+    event.listen(db.session, 'after_commit', listener)
+    try:
+        response = patch_cart(client, user_headers,
+                              {'op': 'add', 'book_id': first.id, 'quantity': 1},
+                              {'op': 'set', 'book_id': second.id, 'quantity': 2},
+                              {'op': 'remove', 'book_id': third.id})
+    finally:
+        event.remove(db.session, 'after_commit', listener)
+
+    assert response.status_code == 200
+    assert len(commits) == 1
+    assert cart_quantities(user) == {first.id: 1, second.id: 2}
+
+
+def test_cart_view_is_priced(client, user_headers, books):
+    book = books[0][0]
+    patch_cart(client, user_headers, {'op': 'add', 'book_id': book.id, 'quantity': 3})
+
+    cart = client.get('/user/cart', headers=user_headers).get_json()
+
+    assert cart['total_quantity'] == 3
+    assert cart['total_price'] == round(book.price * 3, 2)
+    assert cart['all_in_stock'] is True
@@ -0,0 +1,138 @@
+import time
+from datetime import date
+import pytest
+from sqlalchemy import text
+import cache as cache_module
+from cache import cache
+from models import db, StoreBook, LibraryBook, DailyBookRevenue, BookBorrowCount, OverdueSummary
+from response_cache import PAGES_NAMESPACE, catalog_version
+
+
+@pytest.fixture(params=['OFF', 'ON'], ids=['fk-off', 'fk-on'])
+def foreign_keys(request):
+    """
+    Each test runs with SQLite's default of not enforcing foreign keys and
+    with enforcement on, as PostgreSQL would. The tests share the request's
+    connection, so the pragma applies to the handler too.
+    """
+    db.session.execute(text(f'PRAGMA foreign_keys = {request.param}'))
+    yield
+    db.session.rollback()
+    db.session.execute(text('PRAGMA foreign_keys = OFF'))
+
+
+def test_deleting_a_store_book_drops_its_revenue_rollup(client, user_headers, admin_headers, books, foreign_keys):
+    book = books[0][0]
+    client.post('/user/add_to_cart', headers=user_headers, json={'book_id': book.id, 'quantity': 1})
+    assert client.post('/user/checkout', headers=user_headers).status_code == 201
+    assert DailyBookRevenue.query.filter_by(book_id=book.id).count() == 1
+
+    response = client.delete(f'/admin/store_books/{book.id}', headers=admin_headers)
+
+    assert response.status_code == 200
+    assert db.session.get(StoreBook, book.id) is None
+    assert DailyBookRevenue.query.filter_by(book_id=book.id).count() == 0
+
+
+def test_deleting_a_library_book_drops_its_rollups(client, user_headers, admin_headers, books, foreign_keys):
+    book = books[1][0]
+    assert client.post('/user/add_to_borrowings', headers=user_headers, json={'book_id': book.id}).status_code == 201
+    db.session.add(OverdueSummary(book_id=book.id, overdue_count=1, oldest_due_date=date(2020, 1, 1)))
+    db.session.commit()
+
+    response = client.delete(f'/admin/library_books/{book.id}', headers=admin_headers)
+
+    assert response.status_code == 200
+    assert db.session.get(LibraryBook, book.id) is None
+    assert BookBorrowCount.query.filter_by(book_id=book.id).count() == 0
+    assert OverdueSummary.query.filter_by(book_id=book.id).count() == 0
+
+
+class Clock:
+    """Stands in for the cache module's `time`, moved forward by the tests."""
+
+    def __init__(self):
+        self.now = time.monotonic()
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, 'time', clock)
+    return clock
+
+
+def _page(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.get_json(), response.headers['ETag']
+
+
+def test_borrowing_keeps_the_catalog_version(client, user_headers, books):
+    version = catalog_version()
+    book = books[1][0]
+
+    client.post('/user/add_to_borrowings', headers=user_headers, json={'book_id': book.id})
+    client.delete('/user/remove_from_borrowings', headers=user_headers, json={'book_id': book.id})
+
+    assert catalog_version() == version
+
+
+def test_checkout_keeps_the_catalog_version(client, user_headers, books):
+    version = catalog_version()
+    client.post('/user/add_to_cart', headers=user_headers, json={'book_id': books[0][0].id, 'quantity': 1})
+    assert client.post('/user/checkout', headers=user_headers).status_code == 201
+    assert catalog_version() == version
+
+
+def test_stock_on_cached_pages_is_refreshed_after_the_stock_ttl(app, client, user_headers, books, clock):
+    book = books[1][0]
+    before, etag = _page(client, '/user/library_books')
+
+    client.post('/user/add_to_borrowings', headers=user_headers, json={'book_id': book.id})
+    assert _page(client, '/user/library_books') == (before, etag)
+
+    clock.now += app.config['CATALOG_STOCK_TTL'] + 1
+    after, new_etag = _page(client, '/user/library_books')
+    assert new_etag != etag
+    assert after[0]['available_copies'] == before[0]['available_copies'] - 1
+
+
+def test_pages_without_stock_keep_the_full_ttl(app, client, user_headers, books, clock):
+    url = '/user/store_books?fields=title,price'
+    page = _page(client, url)
+
+    client.post('/user/add_to_cart', headers=user_headers, json={'book_id': books[0][0].id, 'quantity': 1})
+    client.post('/user/checkout', headers=user_headers)
+    clock.now += app.config['CATALOG_STOCK_TTL'] + 1
+
+    assert _page(client, url) == page
+    assert cache.get(PAGES_NAMESPACE, (catalog_version(), '/user/store_books', (('fields', 'title,price'),))) is not None
+
+
+def test_admin_changes_show_up_at_once(client, admin_headers, books):
+    book = books[0][0]
+    _page(client, '/user/store_books')
+
+    response = client.put(f'/admin/store_books/{book.id}', headers=admin_headers, data={'price': '99'})
+    assert response.status_code == 200
+
+    page, _ = _page(client, '/user/store_books')
+    assert page[0]['price'] == 99
+
+
+def test_cart_stock_is_refreshed_after_the_stock_ttl(app, client, user_headers, books, clock):
+    book = books[0][0]
+    client.post('/user/add_to_cart', headers=user_headers, json={'book_id': book.id, 'quantity': 1})
+    assert client.get('/user/cart', headers=user_headers).get_json()['items'][0]['stock'] == 5
+
+    # Another customer buys the rest of the stock
+    StoreBook.query.filter_by(id=book.id).update({'stock': 0})
+    db.session.commit()
+    clock.now += app.config['CATALOG_STOCK_TTL'] + 1
+
+    cart = client.get('/user/cart', headers=user_headers).get_json()
+    assert (cart['items'][0]['stock'], cart['all_in_stock']) == (0, False)
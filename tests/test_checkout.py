@@ -0,0 +1,43 @@
+from models import db, CartItem, Sale, StoreBook
+
+
+def _add(client, headers, book_id, quantity):
+    response = client.post('/user/add_to_cart', headers=headers, json={'book_id': book_id, 'quantity': quantity})
+    assert response.status_code in (200, 201), response.get_data(as_text=True)
+
+
+def test_checkout_turns_the_cart_into_sales(client, user_headers, books):
+    store = books[0]
+    _add(client, user_headers, store[0].id, 2)
+    _add(client, user_headers, store[1].id, 1)
+
+    response = client.post('/user/checkout', headers=user_headers)
+
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['total_price'] == store[0].price * 2 + store[1].price
+    assert len(body['sales']) == 2
+    assert CartItem.query.count() == 0
+    db.session.expire_all()
+    assert db.session.get(StoreBook, store[0].id).stock == 3
+    assert db.session.get(StoreBook, store[1].id).stock == 4
+
+
+def test_checkout_without_enough_stock_changes_nothing(client, user_headers, books):
+    store = books[0]
+    _add(client, user_headers, store[0].id, 1)
+    _add(client, user_headers, store[1].id, 1)
+    store[1].stock = 0
+    db.session.commit()
+
+    response = client.post('/user/checkout', headers=user_headers)
+
+    assert response.status_code == 409
+    assert Sale.query.count() == 0
+    assert CartItem.query.count() == 2
+    db.session.expire_all()
+    assert db.session.get(StoreBook, store[0].id).stock == 5
+
+
+def test_checkout_of_an_empty_cart(client, user_headers):
+    assert client.post('/user/checkout', headers=user_headers).status_code == 400
@@ -0,0 +1,53 @@
+import logging
+import os
+import tempfile
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from engine_config import engine_options, init_engine, sqlite_pragmas
+
+
+def _separate_app(log_level):
+    # Not the session app: init_engine would add a second connect listener to its engine
+    app = Flask('engine_config_test')
+    path = os.path.join(tempfile.mkdtemp(prefix='engine-config-'), 'engine.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLITE_PRAGMAS'] = sqlite_pragmas({'SQLITE_BUSY_TIMEOUT': '1234'})
+    app.logger.setLevel(log_level)
+    database = SQLAlchemy()
+    database.init_app(app)
+    return app, database
+
+
+def test_create_app_logs_at_info(app):
+    assert app.config['LOG_LEVEL'] == 'INFO'
+    assert app.logger.isEnabledFor(logging.INFO)
+
+
+def test_settings_are_logged_not_printed(caplog, capsys):
+    app, database = _separate_app(logging.INFO)
+
+    init_engine(app, database)
+
+    assert "'journal_mode': 'wal'" in caplog.text
+    assert "'busy_timeout': 1234" in caplog.text
+    assert capsys.readouterr().out == ''
+
+
+def test_pragmas_apply_to_new_connections():
+    app, database = _separate_app(logging.WARNING)
+    init_engine(app, database)
+
+    with app.app_context():
+        database.engine.dispose()
+        with database.engine.connect() as connection:
+            assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 1234
+            assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+
+
+def test_sqlite_pragmas_from_the_environment():
+    pragmas = sqlite_pragmas({'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_BUSY_TIMEOUT': '250'})
+
+    assert pragmas['journal_mode'] == 'DELETE'
+    assert pragmas['busy_timeout'] == 250
+    assert engine_options('sqlite:///x.db', {'SQLITE_BUSY_TIMEOUT': '250'}) == {'connect_args': {'timeout': 0.25}}
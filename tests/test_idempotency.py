@@ -0,0 +1,97 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from models import db, Borrowing, IdempotencyKey, Sale, Transaction
+from conftest import make_user, auth_headers
+
+
+def _body(phone_number, amount=10):
+    return json.dumps({'amount': amount, 'phone_number': phone_number}).encode('utf-8')
+
+
+def _buy(client, phone_number, key='order-1', amount=10):
+    return client.post('/user/buyGoods', data=_body(phone_number, amount), content_type='application/json',
+                       headers={'Idempotency-Key': key})
+
+
+def _in_progress(phone_number, client_key, created_at):
+    """The row a buyGoods request that is still running (or died) leaves behind."""
+    fingerprint = hashlib.sha256(b'POST\0/user/buyGoods\0' + _body(phone_number) + b'\0').hexdigest()
+    db.session.add(IdempotencyKey(
+        key=hashlib.sha256(f'phone:{phone_number}:{client_key}'.encode('utf-8')).hexdigest(),
+        fingerprint=fingerprint, created_at=created_at, expires_at=datetime.utcnow() + timedelta(days=1),
+    ))
+    db.session.commit()
+
+
+def test_anonymous_payers_dont_share_keys(client):
+    first = _buy(client, '254700000001')
+    second = _buy(client, '254700000002')
+
+    assert first.status_code == second.status_code == 202
+    assert first.get_json()['transaction_id'] != second.get_json()['transaction_id']
+    assert 'Idempotent-Replayed' not in second.headers
+    assert Transaction.query.count() == 2
+
+
+def test_payment_retry_is_replayed(client):
+    first = _buy(client, '254700000001')
+    again = _buy(client, '254700000001')
+
+    assert again.headers['Idempotent-Replayed'] == 'true'
+    assert again.get_json() == first.get_json()
+    assert Transaction.query.count() == 1
+
+
+def test_key_reused_for_another_payment_is_rejected(client):
+    _buy(client, '254700000001')
+    assert _buy(client, '254700000001', amount=20).status_code == 422
+
+
+def test_request_in_progress_gets_409(client):
+    _in_progress('254700000001', 'order-1', datetime.utcnow())
+    assert _buy(client, '254700000001').status_code == 409
+    assert Transaction.query.count() == 0
+
+
+def test_abandoned_claim_is_taken_over_after_the_lock_timeout(app, client):
+    timeout = app.config['IDEMPOTENCY_LOCK_TIMEOUT']
+    _in_progress('254700000001', 'order-1', datetime.utcnow() - timedelta(seconds=timeout + 1))
+
+    response = _buy(client, '254700000001')
+
+    assert response.status_code == 202
+    assert Transaction.query.count() == 1
+    row = IdempotencyKey.query.one()
+    assert row.status_code == 202
+
+
+def test_user_keys_are_scoped_to_the_user(client, user, user_headers, books):
+    book_id = books[1][0].id
+    other = make_user('Bob', 'bob@example.com')
+    alice_headers = dict(user_headers, **{'Idempotency-Key': 'borrow-1'})
+    bob_headers = dict(auth_headers(other), **{'Idempotency-Key': 'borrow-1'})
+
+    first = client.post('/user/add_to_borrowings', headers=alice_headers, json={'book_id': book_id})
+    again = client.post('/user/add_to_borrowings', headers=alice_headers, json={'book_id': book_id})
+    bobs = client.post('/user/add_to_borrowings', headers=bob_headers, json={'book_id': book_id})
+
+    assert first.status_code == again.status_code == bobs.status_code == 201
+    assert again.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in bobs.headers
+    assert first.get_json()['user_id'] == user.id
+    assert bobs.get_json()['user_id'] == other.id
+    assert Borrowing.query.count() == 2
+
+
+def test_checkout_is_replayed_for_the_same_idempotency_key(client, user_headers, books):
+    client.post('/user/add_to_cart', headers=user_headers, json={'book_id': books[0][0].id, 'quantity': 1})
+    headers = dict(user_headers, **{'Idempotency-Key': 'checkout-1'})
+
+    first = client.post('/user/checkout', headers=headers)
+    second = client.post('/user/checkout', headers=headers)
+
+    assert first.status_code == second.status_code == 201
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json() == first.get_json()
+    assert Sale.query.count() == 1
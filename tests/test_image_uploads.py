@@ -0,0 +1,82 @@
+import io
+import os
+import pytest
+from models import db, StoreBook
+from image_uploads import PENDING, READY, FAILED
+
+
+@pytest.fixture
+def uploads(app, monkeypatch):
+    queue = app.extensions['image_uploads']
+    monkeypatch.setattr(queue, 'retry_delay', 0)
+    return queue
+
+
+def _add_book(client, headers, isbn='isbn-cover'):
+    data = {
+        'title': 'Cover', 'author': 'Author', 'genre': 'Fiction', 'isbn': isbn, 'price': '12', 'stock': '3',
+        'image': (io.BytesIO(b'not really a png'), 'cover.png'),
+    }
+    response = client.post('/admin/store_books', headers=headers, data=data, content_type='multipart/form-data')
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()
+
+
+def _book(book_id):
+    db.session.expire_all()
+    return db.session.get(StoreBook, book_id)
+
+
+def test_cover_is_uploaded_after_the_book_is_saved(client, admin_headers, uploads):
+    book = _add_book(client, admin_headers)
+    assert book['image_status'] == PENDING
+
+    uploads.wait(timeout=10)
+
+    saved = _book(book['id'])
+    assert saved.image_status == READY
+    assert saved.image_url.startswith('stub://') and saved.image_url.endswith('.png')
+    assert os.listdir(uploads.upload_dir) == []
+
+
+def test_failed_upload_is_retried(client, admin_headers, uploads, monkeypatch):
+    calls = []
+
+    def flaky(path):
+        calls.append(path)
+        if len(calls) == 1:
+            raise ConnectionError('upload timed out')
+        return 'stub://retried.png'
+
+    monkeypatch.setattr(uploads, 'uploader', flaky)
+    book = _add_book(client, admin_headers)
+    uploads.wait(timeout=10)
+
+    assert len(calls) == 2
+    saved = _book(book['id'])
+    assert (saved.image_status, saved.image_url) == (READY, 'stub://retried.png')
+
+
+def test_upload_fails_once_retries_run_out(client, admin_headers, uploads, monkeypatch):
+    calls = []
+
+    def broken(path):
+        calls.append(path)
+        raise ConnectionError('upload service down')
+
+    monkeypatch.setattr(uploads, 'uploader', broken)
+    book = _add_book(client, admin_headers)
+    uploads.wait(timeout=10)
+
+    assert len(calls) == uploads.retries
+    saved = _book(book['id'])
+    assert (saved.image_status, saved.image_url) == (FAILED, None)
+    # The buffered file is cleaned up either way
+    assert os.listdir(uploads.upload_dir) == []
+
+
+def test_book_without_a_cover_has_no_status(client, admin_headers):
+    data = {'title': 'Plain', 'author': 'Author', 'genre': 'Fiction', 'isbn': 'isbn-plain', 'price': '5'}
+    response = client.post('/admin/store_books', headers=admin_headers, data=data)
+    assert response.status_code == 201
+    assert response.get_json()['image_status'] is None
@@ -0,0 +1,96 @@
+import threading
+import time
+import pytest
+from models import db, Transaction
+from mpesa import MpesaClient, MpesaError
+from mpesa_stub import MpesaStubServer
+from payments import SENT
+
+
+@pytest.fixture
+def stub():
+    server = MpesaStubServer().start()
+    yield server
+    server.stop()
+
+
+def _client(url, **kwargs):
+    return MpesaClient('key', 'secret', '174379', 'passkey', 'http://localhost/user/callback', api_url=url, **kwargs)
+
+
+def test_pushes_share_one_token_and_connection(stub):
+    client = _client(stub.url)
+
+    for _ in range(5):
+        assert client.stk_push(10, '254700000000')['ResponseCode'] == '0'
+
+    assert stub.stk_requests == 5
+    assert stub.token_requests == 1
+    assert stub.connections == 1
+
+
+def test_expired_token_is_fetched_again(stub):
+    # Tokens that are stale as soon as they arrive
+    stub.token_expires_in = 60
+    client = _client(stub.url, token_margin=60)
+
+    client.stk_push(10, '254700000000')
+    client.stk_push(10, '254700000000')
+
+    assert stub.token_requests == 2
+
+
+def test_revoked_token_is_replaced_on_401(stub):
+    client = _client(stub.url)
+    client.stk_push(10, '254700000000')
+    stub.valid_tokens.clear()
+
+    response = client.stk_push(10, '254700000000')
+
+    assert response['ResponseCode'] == '0'
+    assert stub.token_requests == 2
+    assert stub.stk_requests == 2
+
+
+def test_concurrent_pushes_fetch_the_token_once(stub):
+    stub.latency = 0.1
+    client = _client(stub.url)
+    responses = []
+
+    def push():
+        responses.append(client.stk_push(10, '254700000000'))
+
+    threads = [threading.Thread(target=push) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response['ResponseCode'] for response in responses] == ['0'] * 8
+    assert stub.token_requests == 1
+
+
+def test_unreachable_api_raises():
+    client = _client('http://127.0.0.1:9', timeout=(0.5, 0.5))
+    with pytest.raises(MpesaError):
+        client.stk_push(10, '254700000000')
+
+
+def test_buy_goods_sends_the_push_in_the_background(app, client, stub, monkeypatch):
+    monkeypatch.setitem(app.extensions, 'mpesa', _client(stub.url))
+
+    response = client.post('/user/buyGoods', json={'amount': 10, 'phone_number': '254700000000'})
+    assert response.status_code == 202
+    transaction_id = response.get_json()['transaction_id']
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        db.session.expire_all()
+        transaction = db.session.get(Transaction, transaction_id)
+        if transaction.status != 'Pending':
+            break
+        time.sleep(0.05)
+
+    assert transaction.status == SENT
+    assert transaction.checkout_request_id.startswith('ws_CO_')
+    assert stub.stk_payloads[0]['PhoneNumber'] == '254700000000'
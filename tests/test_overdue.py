@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+from models import db, Borrowing, OverdueSummary
+from overdue import mark_overdue, refresh_overdue_summary, sweep_overdue
+
+TODAY = date(2024, 6, 1)
+
+
+def _loans(user, book, *due_dates, status='Approved'):
+    loans = [Borrowing(user_id=user.id, book_id=book.id, status=status, due_date=due) for due in due_dates]
+    db.session.add_all(loans)
+    db.session.commit()
+    return loans
+
+
+def _statuses(loans):
+    db.session.expire_all()
+    return [db.session.get(Borrowing, loan.id).status for loan in loans]
+
+
+def test_past_due_loans_are_marked_in_batches(user, books):
+    book = books[1][0]
+    late = _loans(user, book, *[TODAY - timedelta(days=days) for days in range(1, 6)])
+    on_time = _loans(user, book, TODAY, TODAY + timedelta(days=3))
+    pending = _loans(user, book, TODAY - timedelta(days=10), status='Pending')
+    returned = _loans(user, book, TODAY - timedelta(days=10), status='Returned')
+
+    assert mark_overdue(TODAY, batch_size=2) == 5
+
+    assert _statuses(late) == ['Overdue'] * 5
+    assert _statuses(on_time) == ['Approved'] * 2
+    assert _statuses(pending + returned) == ['Pending', 'Returned']
+    assert mark_overdue(TODAY, batch_size=2) == 0
+
+
+def test_summary_is_rebuilt_per_book(user, books):
+    first, second, third = books[1]
+    _loans(user, first, TODAY - timedelta(days=1), TODAY - timedelta(days=9))
+    _loans(user, second, TODAY - timedelta(days=4))
+    _loans(user, third, TODAY + timedelta(days=4))
+    # A stale row from an earlier sweep, the book has nothing overdue now
+    db.session.add(OverdueSummary(book_id=third.id, overdue_count=7, oldest_due_date=date(2020, 1, 1)))
+    db.session.commit()
+
+    assert sweep_overdue(TODAY, batch_size=1) == 3
+
+    db.session.expire_all()
+    rows = {row.book_id: (row.overdue_count, row.oldest_due_date) for row in OverdueSummary.query}
+    assert rows == {first.id: (2, TODAY - timedelta(days=9)), second.id: (1, TODAY - timedelta(days=4))}
+
+
+def test_returned_loans_leave_the_summary(user, books):
+    book = books[1][0]
+    loan, = _loans(user, book, TODAY - timedelta(days=2))
+    sweep_overdue(TODAY)
+    assert OverdueSummary.query.count() == 1
+
+    loan.status = 'Returned'
+    db.session.commit()
+    refresh_overdue_summary()
+
+    assert OverdueSummary.query.count() == 0
+
+
+def test_admin_overdue_payload(client, user, admin_headers, books):
+    first, second = books[1][:2]
+    _loans(user, first, TODAY - timedelta(days=1))
+    _loans(user, second, TODAY - timedelta(days=3), TODAY - timedelta(days=5))
+    sweep_overdue(TODAY)
+
+    response = client.get('/admin/overdue', headers=admin_headers)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['total_overdue'] == 3
+    assert body['refreshed_at'] is not None
+    assert body['books'] == [
+        {'book_id': second.id, 'overdue_count': 2, 'oldest_due_date': str(TODAY - timedelta(days=5))},
+        {'book_id': first.id, 'overdue_count': 1, 'oldest_due_date': str(TODAY - timedelta(days=1))},
+    ]
+
+
+def test_admin_overdue_before_any_sweep(client, admin_headers):
+    response = client.get('/admin/overdue', headers=admin_headers)
+
+    assert response.get_json() == {'total_overdue': 0, 'refreshed_at': None, 'books': []}
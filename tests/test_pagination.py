@@ -0,0 +1,63 @@
+import re
+import pytest
+from sqlalchemy import insert
+from models import db, StoreBook
+from pagination import DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT
+
+
+@pytest.fixture
+def shelf():
+    db.session.execute(insert(StoreBook), [
+        {'title': f'Book {i}', 'author': 'Author', 'genre': 'Fiction', 'isbn': f'isbn-{i}', 'price': 10, 'stock': 1}
+        for i in range(DEFAULT_PAGE_LIMIT + 10)
+    ])
+    db.session.commit()
+
+
+def _next_link(response):
+    match = re.fullmatch(r'<(.+)>; rel="next"', response.headers.get('Link', ''))
+    return match.group(1) if match else None
+
+
+def test_listing_without_limit_is_the_whole_plain_list(client, shelf):
+    response = client.get('/user/store_books')
+
+    books = response.get_json()
+    assert isinstance(books, list)
+    assert [book['id'] for book in books] == list(range(1, DEFAULT_PAGE_LIMIT + 11))
+    assert _next_link(response) is None
+
+    rest = client.get(f'/user/store_books?cursor={DEFAULT_PAGE_LIMIT}&fields=title')
+    assert rest.get_json()[0] == {'id': DEFAULT_PAGE_LIMIT + 1, 'title': f'Book {DEFAULT_PAGE_LIMIT}'}
+    assert len(rest.get_json()) == 10
+
+
+def test_listing_with_limit_is_an_envelope(client, shelf):
+    response = client.get('/user/store_books?limit=5&fields=title')
+
+    page = response.get_json()
+    assert page['limit'] == 5 and page['next_cursor'] == 5
+    assert page['items'][0] == {'id': 1, 'title': 'Book 0'}
+    # The link keeps the other arguments
+    assert _next_link(response).endswith('/user/store_books?limit=5&fields=title&cursor=5')
+
+    last = client.get(f'/user/store_books?limit={DEFAULT_PAGE_LIMIT}&cursor=50').get_json()
+    assert len(last['items']) == 10 and last['next_cursor'] is None
+
+
+def test_limit_defaults_and_is_capped(client, shelf):
+    assert client.get('/user/store_books?limit=').get_json()['limit'] == DEFAULT_PAGE_LIMIT
+    assert client.get('/user/store_books?limit=1000').get_json()['limit'] == MAX_PAGE_LIMIT
+
+
+def test_link_header_is_served_from_the_cache(client, shelf):
+    first = client.get('/user/store_books?limit=5')
+    cached = client.get('/user/store_books?limit=5')
+
+    assert cached.headers['ETag'] == first.headers['ETag']
+    assert cached.headers['Link'] == first.headers['Link']
+
+
+def test_bad_arguments(client):
+    assert client.get('/user/library_books?cursor=abc').status_code == 400
+    assert client.get('/user/store_books?fields=password').status_code == 400
@@ -0,0 +1,51 @@
+import bcrypt
+import pytest
+from models import db
+from passwords import hash_rounds, password_hasher
+
+
+@pytest.fixture
+def raised_cost(monkeypatch):
+    """The tests hash at the minimum cost of 4, pretend 5 is configured."""
+    monkeypatch.setattr(password_hasher, 'rounds', 5)
+    return 5
+
+
+def _login(client, password):
+    return client.post('/user/login', json={'email': 'alice@example.com', 'password': password})
+
+
+def _store_hash(user, rounds):
+    user.password_hash = bcrypt.hashpw(b'password', bcrypt.gensalt(rounds)).decode('utf-8')
+    db.session.commit()
+
+
+def test_login_upgrades_a_cheaper_hash(client, user, raised_cost):
+    _store_hash(user, 4)
+
+    assert _login(client, 'password').status_code == 200
+
+    db.session.refresh(user)
+    assert hash_rounds(user.password_hash) == raised_cost
+    assert user.check_password('password')
+    # And the new hash is kept from then on
+    stored = user.password_hash
+    assert _login(client, 'password').status_code == 200
+    db.session.refresh(user)
+    assert user.password_hash == stored
+
+
+def test_failed_login_keeps_the_old_hash(client, user, raised_cost):
+    _store_hash(user, 4)
+    stored = user.password_hash
+
+    assert _login(client, 'wrong').status_code == 401
+
+    db.session.refresh(user)
+    assert user.password_hash == stored
+
+
+def test_hash_rounds():
+    assert hash_rounds('$2b$12$' + 'x' * 53) == 12
+    assert hash_rounds('not a hash') is None
+    assert hash_rounds(None) is None
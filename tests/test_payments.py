@@ -0,0 +1,125 @@
+import json
+from datetime import datetime, timedelta
+import click
+from flask import Flask
+from models import db, MpesaCallback, Transaction
+from payments import apply_callbacks, init_payments, SENT, COMPLETED, CANCELED
+
+
+def _transaction(checkout_request_id, status=SENT):
+    transaction = Transaction(id=checkout_request_id.lower(), amount=100, phone_number='254700000000',
+                              status=status, checkout_request_id=checkout_request_id)
+    db.session.add(transaction)
+    db.session.commit()
+    return transaction
+
+
+def _callback(checkout_request_id, result_code=0, description='Done'):
+    return {'Body': {'stkCallback': {
+        'CheckoutRequestID': checkout_request_id, 'ResultCode': result_code, 'ResultDesc': description,
+    }}}
+
+
+def _post(client, body):
+    return client.post('/user/callback', json=body).get_json()
+
+
+def test_callback_settles_its_transaction(client):
+    _transaction('ws_CO_1')
+    assert _post(client, _callback('ws_CO_1'))['ResultCode'] == 0
+
+    assert apply_callbacks() == 1
+
+    transaction = db.session.get(Transaction, 'ws_co_1')
+    assert transaction.status == COMPLETED
+    assert transaction.result_code == 0
+
+
+def test_replayed_callbacks_change_nothing(client):
+    _transaction('ws_CO_1')
+    _post(client, _callback('ws_CO_1', 0))
+    _post(client, _callback('ws_CO_1', 1032, 'Cancelled'))
+    apply_callbacks()
+    _post(client, _callback('ws_CO_1', 1032, 'Cancelled'))
+    apply_callbacks()
+
+    db.session.expire_all()
+    assert db.session.get(Transaction, 'ws_co_1').status == COMPLETED
+    assert MpesaCallback.query.filter(MpesaCallback.processed_at.is_(None)).count() == 0
+
+
+def test_malformed_callbacks_are_not_stored(client):
+    assert _post(client, {'Body': {}})['ResultCode'] == 1
+    assert _post(client, _callback(None))['ResultCode'] == 1
+    assert _post(client, _callback('ws_CO_1', None))['ResultCode'] == 1
+    assert _post(client, _callback('ws_CO_1', 'abc'))['ResultCode'] == 1
+    assert MpesaCallback.query.count() == 0
+
+
+def test_unmatched_callbacks_dont_block_the_inbox(client):
+    for i in range(3):
+        _post(client, _callback(f'ws_CO_unknown_{i}'))
+    _transaction('ws_CO_1')
+    _post(client, _callback('ws_CO_1', 1032))
+
+    # The whole inbox fits in a batch of 3 only because unmatched rows are put back
+    assert apply_callbacks(batch_size=3) == 3
+    assert apply_callbacks(batch_size=3) == 1
+    assert apply_callbacks(batch_size=3) == 0
+
+    assert db.session.get(Transaction, 'ws_co_1').status == CANCELED
+    deferred = MpesaCallback.query.filter(MpesaCallback.processed_at.is_(None)).all()
+    assert len(deferred) == 3
+    assert all(row.attempts == 1 and row.next_attempt_at > datetime.utcnow() for row in deferred)
+
+
+def test_callback_arriving_before_its_checkout_id_is_retried(client):
+    _post(client, _callback('ws_CO_1'))
+    apply_callbacks()
+    _transaction('ws_CO_1')
+
+    MpesaCallback.query.update({'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    assert apply_callbacks() == 1
+
+    assert db.session.get(Transaction, 'ws_co_1').status == COMPLETED
+
+
+def test_orphaned_and_invalid_callbacks_are_marked_processed():
+    _transaction('ws_CO_1')
+    old = datetime.utcnow() - timedelta(hours=2)
+    db.session.add_all([
+        MpesaCallback(checkout_request_id='ws_CO_gone', payload=json.dumps({'ResultCode': 0}), received_at=old),
+        # Stored before callbacks were validated
+        MpesaCallback(checkout_request_id='ws_CO_1', payload=json.dumps({'ResultCode': None}), received_at=old),
+    ])
+    db.session.commit()
+
+    assert apply_callbacks() == 2
+
+    errors = {row.checkout_request_id: row.error for row in MpesaCallback.query}
+    assert errors == {'ws_CO_gone': 'Unknown CheckoutRequestID', 'ws_CO_1': 'Invalid ResultCode'}
+    assert MpesaCallback.query.filter(MpesaCallback.processed_at.is_(None)).count() == 0
+    assert db.session.get(Transaction, 'ws_co_1').status == SENT
+
+
+def _started_processor(info_name=None):
+    app = Flask('payments_test')
+    app.config['PAYMENT_CALLBACK_INTERVAL'] = 60
+    if info_name is None:
+        init_payments(app)
+    else:
+        with click.Context(click.Command(info_name), info_name=info_name):
+            init_payments(app)
+    processor = app.extensions.get('callback_processor')
+    if processor is not None:
+        processor.stop()
+    return processor is not None
+
+
+def test_callback_processor_runs_only_when_serving():
+    assert _started_processor()
+    assert _started_processor('run')
+    # `flask db upgrade` and friends load the app from the root command
+    assert not _started_processor('flask')
+    assert not _started_processor('shell')
@@ -0,0 +1,61 @@
+import pytest
+from models import db, Sale, Borrowing, CartItem
+
+
+@pytest.fixture
+def activity(user, books):
+    store, library = books
+    db.session.add_all([
+        Sale(user_id=user.id, book_id=store[0].id, quantity=1, total_price=store[0].price, status='Approved'),
+        Sale(user_id=user.id, book_id=store[1].id, quantity=2, total_price=store[1].price * 2, status='Pending'),
+        Borrowing(user_id=user.id, book_id=library[0].id, status='Approved'),
+        Borrowing(user_id=user.id, book_id=library[1].id, status='Return Requested'),
+        CartItem(user_id=user.id, book_id=store[2].id, quantity=1),
+    ])
+    db.session.commit()
+
+
+ADMIN_ENDPOINTS = [
+    '/admin/orders',
+    '/admin/borrowings',
+    '/admin/return_requests',
+    '/admin/view_books',
+    '/admin/view_library_books',
+    '/admin/overdue',
+    '/admin/analytics/revenue',
+    '/admin/analytics/borrowing',
+    '/admin/analytics/active_loans',
+    '/admin/reports',
+]
+
+USER_ENDPOINTS = [
+    '/user/store_books',
+    '/user/store_books?limit=2',
+    '/user/library_books',
+    '/user/cart',
+]
+
+
+def _get_twice(client, url, headers):
+    # A cold cache and a warm one; the budget check raises on an overrun under TESTING
+    for _ in range(2):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        response.get_data()
+        response.close()
+
+
+@pytest.mark.parametrize('url', ADMIN_ENDPOINTS)
+def test_admin_endpoint_within_budget(client, admin_headers, activity, url):
+    _get_twice(client, url, admin_headers)
+
+
+@pytest.mark.parametrize('url', USER_ENDPOINTS)
+def test_user_endpoint_within_budget(client, user_headers, activity, url):
+    _get_twice(client, url, user_headers)
+
+
+def test_every_budget_is_exercised(app):
+    endpoints = {app.url_map.bind('').match(url.split('?')[0], method='GET')[0]
+                 for url in ADMIN_ENDPOINTS + USER_ENDPOINTS}
+    assert endpoints == set(app.config['QUERY_BUDGETS'])
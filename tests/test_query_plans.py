@@ -0,0 +1,37 @@
+import pytest
+from query_profiles import _full_scans
+
+
+@pytest.fixture
+def plan_check(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'QUERY_PLAN_CHECK', True)
+    monkeypatch.setitem(app.config, 'CATALOG_CACHE_ENABLED', False)
+    monkeypatch.setitem(app.extensions, 'full_scans', {})
+    return app.extensions['full_scans']
+
+
+def test_keyset_pages_are_not_full_scans(client, books, plan_check):
+    client.get('/user/store_books?limit=2')
+    client.get('/user/store_books?limit=2&cursor=1')
+    client.get('/user/library_books?limit=2')
+
+    assert plan_check == {}
+
+
+def test_unbounded_scans_are_reported(client, admin_headers, books, plan_check, caplog):
+    client.get('/admin/reports', headers=admin_headers)
+
+    scans = plan_check['admin_routes.reports']
+    assert any(detail.split()[:2] == ['SCAN', 'sales'] for detail, statement in scans)
+    warnings = [record.getMessage() for record in caplog.records if record.levelname == 'WARNING']
+    assert any(message.startswith('Full scan in admin_routes.reports: SCAN sales') for message in warnings)
+
+
+def test_only_the_paged_table_is_let_through():
+    plan = [(2, 0, 0, 'SCAN store_books'), (5, 0, 0, 'SCAN sales')]
+    statement = 'SELECT store_books.id FROM store_books, sales ORDER BY store_books.id\n LIMIT ? OFFSET ?'
+
+    assert _full_scans(plan, statement) == ['SCAN sales']
+    assert _full_scans(plan, 'SELECT store_books.id FROM store_books ORDER BY store_books.title LIMIT ?') == [
+        'SCAN store_books', 'SCAN sales',
+    ]
@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+import pytest
+import reporting
+from models import db, Sale, Borrowing
+
+
+@pytest.fixture
+def history(user, books):
+    store, library = books
+    statuses = ('Approved', 'Pending', 'Rejected')
+    db.session.add_all(
+        Sale(user_id=user.id, book_id=store[i % 3].id, quantity=i % 4 + 1, total_price=(i % 4 + 1) * 10.5,
+             status=statuses[i % 3], date_of_sale=date(2026, 1, 1) + timedelta(days=i))
+        for i in range(30)
+    )
+    db.session.add_all(
+        Borrowing(user_id=user.id, book_id=library[i % 3].id, status='Returned' if i % 2 else 'Approved',
+                  date_borrowed=date(2026, 1, 1), due_date=date(2026, 3, 1),
+                  date_returned=date(2026, 1, 1) + timedelta(days=i) if i % 2 else None)
+        for i in range(20)
+    )
+    db.session.commit()
+
+
+def _reports():
+    # Small chunks, so partial totals are merged
+    return reporting.sales_report(top=3, chunk_size=7), reporting.borrowing_report(chunk_size=7)
+
+
+def test_reports_match_without_numpy(history, monkeypatch):
+    pytest.importorskip('numpy')
+    with_numpy = _reports()
+    monkeypatch.setattr(reporting, 'np', None)
+    assert reporting.engine_name() == 'python'
+    assert _reports() == with_numpy
+
+
+def test_sales_report_totals(history):
+    sales, borrowings = _reports()
+
+    assert sales['orders'] == 30
+    assert sales['by_status']['Approved']['orders'] == 10
+    assert sales['revenue'] == round(sum((i % 4 + 1) * 10.5 for i in range(30)), 2)
+    assert borrowings['by_status'] == {'Approved': 10, 'Returned': 10}
+    assert borrowings['duration_days']['returned'] == 10
+    assert borrowings['duration_days']['max'] == 19
@@ -0,0 +1,79 @@
+from models import db, StoreBook, LibraryBook
+
+
+def search(client, headers, **params):
+    response = client.get('/user/search_books', headers=headers, query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def titles(books):
+    return [book['title'] for book in books]
+
+
+def test_title_matches_rank_above_author_matches(client, user_headers):
+    db.session.add_all([
+        StoreBook(title='A Study', author='Tolkien Society', genre='Essays', isbn='s-1', price=5, stock=1),
+        StoreBook(title='Tolkien', author='Humphrey Carpenter', genre='Biography', isbn='s-2', price=5, stock=1),
+    ])
+    db.session.commit()
+
+    result = search(client, user_headers, query='tolkien')
+
+    assert titles(result['store_books']) == ['Tolkien', 'A Study']
+    assert result['library_books'] == []
+
+
+def test_every_word_is_prefix_matched(client, user_headers, books):
+    result = search(client, user_headers, query='libr auth')
+
+    assert sorted(titles(result['library_books'])) == ['Library 0', 'Library 1', 'Library 2']
+    assert result['store_books'] == []
+    assert titles(search(client, user_headers, query='lib-1')['library_books']) == ['Library 1']
+
+
+def test_limit_and_offset_page_through_the_results(client, user_headers, books):
+    first = search(client, user_headers, query='book', limit=2)['store_books']
+    rest = search(client, user_headers, query='book', limit=2, offset=2)['store_books']
+
+    assert len(first) == 2
+    assert len(rest) == 1
+    assert sorted(titles(first + rest)) == ['Book 0', 'Book 1', 'Book 2']
+
+
+def test_a_blank_query_matches_nothing(client, user_headers, books):
+    assert search(client, user_headers, query='  ') == {'store_books': [], 'library_books': []}
+
+
+def test_index_follows_admin_changes(client, user_headers, admin_headers):
+    response = client.post('/admin/store_books', headers=admin_headers, data={
+        'title': 'Dune', 'author': 'Frank Herbert', 'genre': 'Fiction', 'isbn': 'd-1', 'price': '9', 'stock': '1',
+    })
+    assert response.status_code == 201
+    book_id = response.get_json()['id']
+    assert titles(search(client, user_headers, query='dune')['store_books']) == ['Dune']
+
+    response = client.put(f'/admin/store_books/{book_id}', headers=admin_headers, data={'title': 'Children of Dune'})
+    assert response.status_code == 200
+    assert titles(search(client, user_headers, query='children')['store_books']) == ['Children of Dune']
+
+    assert client.delete(f'/admin/store_books/{book_id}', headers=admin_headers).status_code == 200
+    assert search(client, user_headers, query='dune')['store_books'] == []
+
+
+def test_index_follows_admin_changes_to_library_books(client, user_headers, admin_headers):
+    response = client.post('/admin/library_books', headers=admin_headers, data={
+        'title': 'Emma', 'author': 'Jane Austen', 'genre': 'Fiction', 'isbn': 'e-1', 'total_copies': '1',
+    })
+    assert response.status_code == 201
+    book_id = response.get_json()['id']
+    assert titles(search(client, user_headers, query='austen')['library_books']) == ['Emma']
+
+    response = client.put(f'/admin/library_books/{book_id}', headers=admin_headers, data={'author': 'J. Austen'})
+    assert response.status_code == 200
+    assert titles(search(client, user_headers, query='austen')['library_books']) == ['Emma']
+    assert search(client, user_headers, query='jane')['library_books'] == []
+
+    assert client.delete(f'/admin/library_books/{book_id}', headers=admin_headers).status_code == 200
+    assert search(client, user_headers, query='emma')['library_books'] == []
+    assert db.session.get(LibraryBook, book_id) is None
@@ -0,0 +1,77 @@
+import json
+import threading
+import pytest
+from sqlalchemy import insert
+from models import db, StoreBook
+
+
+@pytest.fixture
+def many_books():
+    # Enough rows for the streamed body to come in several chunks
+    db.session.execute(insert(StoreBook), [
+        {'title': f'Book {i}', 'author': 'Author', 'genre': 'Fiction', 'isbn': f'isbn-{i}', 'price': 10, 'stock': 1}
+        for i in range(2000)
+    ])
+    db.session.commit()
+    db.session.close()
+
+
+def _without_app_context(fn):
+    """
+    Run `fn` on a thread with no app context, the way a server runs a
+    request: the request pushes its own contexts and pops them before the
+    body is read.
+    """
+    result = {}
+
+    def run():
+        try:
+            result['value'] = fn()
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+
+def test_streamed_listing_drains_and_closes(app, admin_headers, many_books):
+    before = db.engine.pool.checkedout()
+
+    def fetch():
+        response = app.test_client().get('/admin/view_books', headers=admin_headers)
+        chunks = list(response.response)
+        response.close()
+        return chunks
+
+    chunks = _without_app_context(fetch)
+
+    assert len(chunks) > 1
+    books = json.loads(b''.join(chunks))
+    assert [book['id'] for book in books] == list(range(1, 2001))
+    assert db.engine.pool.checkedout() == before
+
+
+def test_streamed_listing_closed_half_read(app, admin_headers, many_books):
+    before = db.engine.pool.checkedout()
+
+    def fetch_part():
+        client = app.test_client()
+        response = client.get('/admin/view_books', headers=admin_headers)
+        body = iter(response.response)
+        next(body)
+        next(body)
+        response.close()
+        # Later requests on the same thread still get a clean context
+        return client.get('/admin/view_library_books', headers=admin_headers).get_json()
+
+    assert _without_app_context(fetch_part) == []
+    # The streaming session gave its connection back
+    assert db.engine.pool.checkedout() == before
+
+
+def test_streamed_listing_of_an_empty_table(client, admin_headers):
+    assert client.get('/admin/view_books', headers=admin_headers).get_json() == []
@@ -0,0 +1,57 @@
+from conftest import make_user
+
+
+def _login(client, user):
+    response = client.post('/user/login', json={'email': user.email, 'password': 'password'})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_refresh_rotates_the_pair(client, user):
+    tokens = _login(client, user)
+
+    response = client.post('/user/refresh', headers=_bearer(tokens['refresh_token']))
+
+    assert response.status_code == 200
+    rotated = response.get_json()
+    assert rotated['refresh_token'] != tokens['refresh_token']
+    assert client.get('/user/cart', headers=_bearer(rotated['access_token'])).status_code == 200
+
+
+def test_refresh_token_works_once(client, user):
+    tokens = _login(client, user)
+    first = client.post('/user/refresh', headers=_bearer(tokens['refresh_token']))
+    again = client.post('/user/refresh', headers=_bearer(tokens['refresh_token']))
+
+    assert first.status_code == 200
+    assert again.status_code == 401
+    # The rotated token still works
+    assert client.post('/user/refresh', headers=_bearer(first.get_json()['refresh_token'])).status_code == 200
+
+
+def test_access_token_cannot_refresh(client, user):
+    tokens = _login(client, user)
+    assert client.post('/user/refresh', headers=_bearer(tokens['access_token'])).status_code == 422
+
+
+def test_logout_revokes_both_tokens(client, user):
+    tokens = _login(client, user)
+
+    assert client.post('/user/logout', headers=_bearer(tokens['access_token'])).status_code == 200
+    assert client.post('/user/logout', headers=_bearer(tokens['refresh_token'])).status_code == 200
+
+    assert client.get('/user/cart', headers=_bearer(tokens['access_token'])).status_code == 401
+    assert client.post('/user/refresh', headers=_bearer(tokens['refresh_token'])).status_code == 401
+
+
+def test_revocation_is_per_token(client, user):
+    other = make_user('Bob', 'bob@example.com')
+    mine, theirs = _login(client, user), _login(client, other)
+
+    client.post('/user/logout', headers=_bearer(mine['access_token']))
+
+    assert client.get('/user/cart', headers=_bearer(theirs['access_token'])).status_code == 200
@@ -0,0 +1,149 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import click
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from models import db, RevokedToken
+from query_profiles import uncounted_queries
+
+# Access tokens are short lived and checked without touching the database;
+# refresh tokens are rotated on every use. Revoked token ids (jti) are kept in
+# revoked_tokens until the token would have expired anyway.
+#
+# Every process keeps a bloom filter of the revoked jtis in front of that
+# table: a token not in the filter is certainly not revoked, only the rare
+# possible match is looked up. The filter picks up revocations made by other
+# workers every REVOKED_TOKENS_SYNC_INTERVAL seconds. Refresh token rotation
+# doesn't depend on the filter, it claims the old jti with an INSERT that only
+# one request can win.
+
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+def issue_tokens(user):
+    """Access + refresh token pair for `user`, the is_admin claim read from the row."""
+    claims = {'is_admin': bool(user.is_admin)}
+    identity = str(user.id)
+    return (
+        create_access_token(identity=identity, additional_claims=claims),
+        create_refresh_token(identity=identity, additional_claims=claims),
+    )
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        # Double hashing: k positions from two 64 bit hashes
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        if key in self:
+            return
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    def __init__(self, capacity=100000, sync_interval=5):
+        self.capacity = capacity
+        self.sync_interval = sync_interval
+        self._bloom = BloomFilter(capacity)
+        self._synced_until = None
+        self._next_sync = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.capacity = app.config.get('REVOKED_TOKENS_CAPACITY', self.capacity)
+        self.sync_interval = app.config.get('REVOKED_TOKENS_SYNC_INTERVAL', self.sync_interval)
+        self._bloom = BloomFilter(self.capacity)
+        self._synced_until = None
+        self._next_sync = 0
+
+    def _sync(self):
+        if time.monotonic() < self._next_sync:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_sync:
+                return
+            now = datetime.utcnow()
+            if self._synced_until is None or self._bloom.count > self._bloom.capacity:
+                # First load, or the filter got too full to stay accurate
+                condition = RevokedToken.expires_at > now
+                count = db.session.scalar(select(func.count()).select_from(RevokedToken).where(condition))
+                self._bloom = BloomFilter(max(self.capacity, count * 2))
+            else:
+                # Look back a little, a row can be committed a moment after its revoked_at
+                condition = RevokedToken.revoked_at >= self._synced_until - SYNC_OVERLAP
+            for (jti,) in db.session.execute(select(RevokedToken.jti).where(condition)):
+                self._bloom.add(jti)
+            self._synced_until = now
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def is_revoked(self, jti):
+        # Runs for every JWT request, not part of any endpoint's query budget
+        with uncounted_queries():
+            self._sync()
+            if jti not in self._bloom:
+                return False
+            return db.session.get(RevokedToken, jti) is not None
+
+    def revoke(self, jwt_payload):
+        """
+        Record the token as revoked and commit. Returns False when it already
+        was, i.e. another request used (or revoked) the same token first.
+        """
+        expires_at = datetime.fromtimestamp(jwt_payload['exp'], timezone.utc).replace(tzinfo=None)
+        try:
+            db.session.execute(insert(RevokedToken).values(
+                jti=jwt_payload['jti'],
+                token_type=jwt_payload['type'],
+                revoked_at=datetime.utcnow(),
+                expires_at=expires_at,
+            ))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        with self._lock:
+            self._bloom.add(jwt_payload['jti'])
+        return True
+
+
+revocation_list = RevocationList()
+
+
+def prune_revoked_tokens():
+    """Forget revoked tokens that have expired anyway, returns how many."""
+    result = db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()))
+    db.session.commit()
+    return result.rowcount
+
+
+def init_tokens(app, jwt):
+    revocation_list.init_app(app)
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return revocation_list.is_revoked(jwt_payload['jti'])
+
+    @app.cli.command('prune-revoked-tokens')
+    def prune_revoked_tokens_command():
+        """Delete expired entries from the token revocation list."""
+        click.echo(f'Pruned {prune_revoked_tokens()} revoked tokens')